@@ -4,7 +4,7 @@ from .messaging_pyx import MultiplePublishersError, MessagingError  # pylint: di
 import os
 import capnp
 
-from typing import Optional, List, Union
+from typing import Callable, Optional, List, Union
 from collections import deque
 
 from cereal import log
@@ -248,12 +248,19 @@ class SubMaster:
            and self.all_valid(service_list=service_list)
 
 class PubMaster:
+  # called with the service name on the first send of any PubMaster in the process, then cleared
+  on_first_send: Optional[Callable[[str], None]] = None
+
   def __init__(self, services: List[str]):
     self.sock = {}
     for s in services:
       self.sock[s] = pub_sock(s)
 
   def send(self, s: str, dat: Union[bytes, capnp.lib.capnp._DynamicStructBuilder]) -> None:
+    if PubMaster.on_first_send is not None:
+      on_first_send, PubMaster.on_first_send = PubMaster.on_first_send, None
+      on_first_send(s)
+
     if not isinstance(dat, bytes):
       dat = dat.to_bytes()
     self.sock[s].send(dat)
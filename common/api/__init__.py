@@ -1,13 +1,46 @@
 import jwt
 import os
+import threading
 import requests
 from datetime import datetime, timedelta
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from common.basedir import PERSIST
 from selfdrive.version import get_version
 
 API_HOST = os.getenv('API_HOST', 'https://api.commadotai.com')
 
+TOKEN_EXPIRY = timedelta(hours=1)
+# tokens are refreshed this long before they expire
+TOKEN_REFRESH_MARGIN = timedelta(minutes=5)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+  """Returns the process wide keep-alive session, shared between threads.
+
+  Connection errors are retried with backoff for all requests, since nothing was sent yet.
+  Server errors are only retried for GET requests, uploads can't replay their body.
+  """
+  global _session
+  with _session_lock:
+    if _session is None:
+      retries = Retry(total=3, backoff_factor=0.5, status_forcelist=(502, 503, 504),
+                      allowed_methods=frozenset(['GET', 'HEAD']), raise_on_status=False)
+      adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retries)
+      _session = requests.Session()
+      _session.mount('http://', adapter)
+      _session.mount('https://', adapter)
+    return _session
+
+
 class Api():
+  # signed tokens by dongle id, shared by all instances
+  _token_cache = {}
+  _token_lock = threading.Lock()
+
   def __init__(self, dongle_id):
     self.dongle_id = dongle_id
     with open(PERSIST+'/comma/id_rsa') as f:
@@ -24,16 +57,22 @@ class Api():
 
   def get_token(self):
     now = datetime.utcnow()
-    payload = {
-      'identity': self.dongle_id,
-      'nbf': now,
-      'iat': now,
-      'exp': now + timedelta(hours=1)
-    }
-    token = jwt.encode(payload, self.private_key, algorithm='RS256')
-    if isinstance(token, bytes):
-      token = token.decode('utf8')
-    return token
+    with self._token_lock:
+      token, exp = self._token_cache.get(self.dongle_id, (None, now))
+      if token is not None and now < exp - TOKEN_REFRESH_MARGIN:
+        return token
+
+      payload = {
+        'identity': self.dongle_id,
+        'nbf': now,
+        'iat': now,
+        'exp': now + TOKEN_EXPIRY
+      }
+      token = jwt.encode(payload, self.private_key, algorithm='RS256')
+      if isinstance(token, bytes):
+        token = token.decode('utf8')
+      self._token_cache[self.dongle_id] = (token, payload['exp'])
+      return token
 
 
 def api_get(endpoint, method='GET', timeout=None, access_token=None, **params):
@@ -43,4 +82,4 @@ def api_get(endpoint, method='GET', timeout=None, access_token=None, **params):
 
   headers['User-Agent'] = "openpilot-" + get_version()
 
-  return requests.request(method, API_HOST + "/" + endpoint, timeout=timeout, headers=headers, params=params)
+  return get_session().request(method, API_HOST + "/" + endpoint, timeout=timeout, headers=headers, params=params)
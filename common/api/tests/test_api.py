@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+import common.api
+from common.api import Api, api_get
+
+
+class CountingHandler(BaseHTTPRequestHandler):
+  protocol_version = 'HTTP/1.1'
+  connections = 0
+  requests = 0
+
+  def setup(self):
+    super().setup()
+    CountingHandler.connections += 1
+
+  def do_GET(self):
+    CountingHandler.requests += 1
+    body = b'{"ok": true}'
+    self.send_response(200)
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, *args):
+    pass
+
+
+class TestApi(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls.server = ThreadingHTTPServer(('127.0.0.1', 0), CountingHandler)
+    cls.server_thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+    cls.server_thread.start()
+
+    cls.persist = tempfile.mkdtemp()
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    os.mkdir(os.path.join(cls.persist, 'comma'))
+    with open(os.path.join(cls.persist, 'comma', 'id_rsa'), 'wb') as f:
+      f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL,
+                                serialization.NoEncryption()))
+    cls.public_key = key.public_key()
+
+  @classmethod
+  def tearDownClass(cls):
+    cls.server.shutdown()
+    shutil.rmtree(cls.persist)
+
+  def setUp(self):
+    CountingHandler.connections = 0
+    CountingHandler.requests = 0
+    Api._token_cache.clear()
+    common.api._session = None
+
+  def _api(self, dongle_id='0000000000000000'):
+    with mock.patch.object(common.api, 'PERSIST', self.persist):
+      return Api(dongle_id)
+
+  def test_token_reused(self):
+    with mock.patch('common.api.jwt.encode', wraps=jwt.encode) as encode:
+      tokens = {self._api().get_token() for _ in range(100)}
+    self.assertEqual(len(tokens), 1)
+    self.assertEqual(encode.call_count, 1)
+
+    payload = jwt.decode(tokens.pop(), self.public_key, algorithms=['RS256'])
+    self.assertEqual(payload['identity'], '0000000000000000')
+
+  def test_token_refreshed_before_expiry(self):
+    api = self._api()
+    with mock.patch('common.api.jwt.encode', wraps=jwt.encode) as encode:
+      api.get_token()
+      token, exp = Api._token_cache[api.dongle_id]
+      Api._token_cache[api.dongle_id] = (token, exp - common.api.TOKEN_EXPIRY + common.api.TOKEN_REFRESH_MARGIN)
+      api.get_token()
+    self.assertEqual(encode.call_count, 2)
+
+  def test_tokens_per_dongle(self):
+    with mock.patch('common.api.jwt.encode', wraps=jwt.encode) as encode:
+      self.assertNotEqual(self._api('a').get_token(), self._api('b').get_token())
+    self.assertEqual(encode.call_count, 2)
+
+  def test_connection_reuse(self):
+    host = f'http://127.0.0.1:{self.server.server_port}'
+    api = self._api()
+    with mock.patch.object(common.api, 'API_HOST', host):
+      for _ in range(20):
+        r = api_get('v1/me', timeout=5, access_token=api.get_token())
+        self.assertEqual(r.status_code, 200)
+    self.assertEqual(CountingHandler.requests, 20)
+    self.assertEqual(CountingHandler.connections, 1)
+
+  def test_threaded_requests(self):
+    host = f'http://127.0.0.1:{self.server.server_port}'
+    api = self._api()
+
+    def worker():
+      for _ in range(10):
+        api_get('v1/me', timeout=5, access_token=api.get_token())
+
+    with mock.patch.object(common.api, 'API_HOST', host), mock.patch('common.api.jwt.encode', wraps=jwt.encode) as encode:
+      threads = [threading.Thread(target=worker) for _ in range(4)]
+      for t in threads:
+        t.start()
+      for t in threads:
+        t.join()
+    self.assertEqual(CountingHandler.requests, 40)
+    self.assertLessEqual(CountingHandler.connections, 4)
+    self.assertEqual(encode.call_count, 1)
+
+
+if __name__ == "__main__":
+  unittest.main()
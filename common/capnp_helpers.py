@@ -0,0 +1,29 @@
+import numpy as np
+
+# pycapnp list readers don't expose their buffer, converting them to a python list first is
+# the fastest copy from python. Copying into preallocated arrays avoids allocating new arrays
+# every frame, like np.array and np.column_stack do.
+
+
+def copy_list(dst: np.ndarray, lst) -> bool:
+  """Copy a capnp list of numbers into dst, if it has the same length"""
+  if len(lst) != len(dst):
+    return False
+  dst[:] = list(lst)
+  return True
+
+
+def copy_lists(dst: np.ndarray, lsts) -> bool:
+  """Copy capnp lists of numbers into the columns of dst, if they all have the same length"""
+  if len(lsts) != dst.shape[1] or any(len(lst) != len(dst) for lst in lsts):
+    return False
+  for i, lst in enumerate(lsts):
+    dst[:, i] = list(lst)
+  return True
+
+
+def copy_xyz(dst: np.ndarray, xyzt, std: bool = False) -> bool:
+  """Copy the x, y and z (or xStd, yStd and zStd) of a capnp XYZTData into the columns of dst"""
+  if std:
+    return copy_lists(dst, (xyzt.xStd, xyzt.yStd, xyzt.zStd))
+  return copy_lists(dst, (xyzt.x, xyzt.y, xyzt.z))
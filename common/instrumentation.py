@@ -0,0 +1,115 @@
+"""Timing histograms for realtime loops, published to statsd at a low rate."""
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional
+
+# upper bounds of the buckets, four per octave from 1 us to ~4 s, so percentiles are within 19%
+BUCKETS_NS: List[int] = [round(1000 * 2 ** (i / 4)) for i in range(89)]
+PERCENTILES = (50, 90, 99)
+PUBLISH_INTERVAL = 10.  # seconds
+
+
+class Histogram:
+  """Fixed size histogram of durations in ns"""
+  __slots__ = ("counts", "count", "total", "max")
+
+  def __init__(self) -> None:
+    self.counts = [0] * (len(BUCKETS_NS) + 1)
+    self.count = 0
+    self.total = 0
+    self.max = 0
+
+  def add(self, ns: int) -> None:
+    self.counts[bisect_left(BUCKETS_NS, ns)] += 1
+    self.count += 1
+    self.total += ns
+    if ns > self.max:
+      self.max = ns
+
+  def percentile(self, p: float) -> float:
+    """Upper bound of the bucket holding the p-th percentile in ms, the max for the last bucket"""
+    if self.count == 0:
+      return 0.
+    rank = p / 100. * self.count
+    seen = 0
+    for i, c in enumerate(self.counts):
+      seen += c
+      if seen >= rank and c > 0:
+        return min(BUCKETS_NS[i], self.max) / 1e6 if i < len(BUCKETS_NS) else self.max / 1e6
+    return self.max / 1e6
+
+  def mean(self) -> float:
+    return self.total / self.count / 1e6 if self.count else 0.
+
+  def reset(self) -> None:
+    for i in range(len(self.counts)):
+      self.counts[i] = 0
+    self.count = 0
+    self.total = 0
+    self.max = 0
+
+
+class LoopStats:
+  """
+  Section timings of a process loop. Call start() when the loop body starts, checkpoint(name)
+  after each section and end() at the end of the loop. Every publish_interval the percentiles,
+  mean and max of each section, in ms, are sent as statsd gauges named <name>_<section>_<stat>,
+  and the histograms are cleared. Nothing is printed.
+  """
+  def __init__(self, name: str, publish_interval: float = PUBLISH_INTERVAL) -> None:
+    self.name = name
+    self.publish_interval_ns = int(publish_interval * 1e9)
+    self.sections: Dict[str, Histogram] = {}
+    self.counters: Dict[str, int] = {}
+    self.start_time = time.perf_counter_ns()
+    self.last_time = self.start_time
+    self.last_publish = time.monotonic_ns()
+
+  def start(self) -> None:
+    self.start_time = self.last_time = time.perf_counter_ns()
+
+  def checkpoint(self, name: str) -> None:
+    t = time.perf_counter_ns()
+    self.record(name, t - self.last_time)
+    self.last_time = t
+
+  def record(self, name: str, ns: int) -> None:
+    hist = self.sections.get(name)
+    if hist is None:
+      hist = self.sections[name] = Histogram()
+    hist.add(ns)
+
+  def increment(self, name: str) -> None:
+    self.counters[name] = self.counters.get(name, 0) + 1
+
+  def end(self) -> bool:
+    """Records the time since start() as "total", and publishes if due. Returns True if published."""
+    self.record("total", time.perf_counter_ns() - self.start_time)
+    return self.maybe_publish()
+
+  def maybe_publish(self, now_ns: Optional[int] = None) -> bool:
+    if now_ns is None:
+      now_ns = time.monotonic_ns()
+    if now_ns - self.last_publish < self.publish_interval_ns:
+      return False
+    self.last_publish = now_ns
+    self.publish()
+    return True
+
+  def publish(self) -> None:
+    # not imported at the top, common.realtime can't depend on cereal.messaging, which imports it
+    from selfdrive.statsd import statlog
+
+    for section, hist in self.sections.items():
+      if hist.count == 0:
+        continue
+      prefix = f"{self.name}_{section}"
+      for p in PERCENTILES:
+        statlog.gauge(f"{prefix}_p{p}_ms", hist.percentile(p))
+      statlog.gauge(f"{prefix}_mean_ms", hist.mean())
+      statlog.gauge(f"{prefix}_max_ms", hist.max / 1e6)
+      hist.reset()
+
+    for counter, count in self.counters.items():
+      statlog.gauge(f"{self.name}_{counter}", count)
+      self.counters[counter] = 0
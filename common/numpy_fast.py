@@ -1,19 +1,58 @@
+from bisect import bisect_left
+
+import numpy as np
+
+
 def clip(x, lo, hi):
   return max(lo, min(hi, x))
 
-def interp(x, xp, fp):
+def _interp(xv, xp, fp):
+  # first breakpoint >= xv. xp must be sorted, a repeated breakpoint is a step like with the
+  # linear scan before, unsorted xp gives different results
+  hi = bisect_left(xp, xv)
+  if hi == 0:
+    return fp[0]
+  if hi == len(xp):
+    return fp[-1]
+  low = hi - 1
+  return (xv - xp[low]) * (fp[hi] - fp[low]) / (xp[hi] - xp[low]) + fp[low]
+
+def _interp_array(x, xp, fp):
+  # same operations as _interp in float64, so the results are identical
+  x = np.asarray(x, dtype=np.float64)
+  xp = np.asarray(xp, dtype=np.float64)
+  fp = np.asarray(fp, dtype=np.float64)
   N = len(xp)
+  if N == 1:
+    return np.full(x.shape, fp[0])
+
+  hi = np.minimum(np.maximum(np.searchsorted(xp, x, side='left'), 1), N - 1)
+  low = hi - 1
+  with np.errstate(divide='ignore', invalid='ignore'):
+    ret = (x - xp[low]) * (fp[hi] - fp[low]) / (xp[hi] - xp[low]) + fp[low]
+  # NaN is clamped to fp[0] too, like with bisect
+  ret = np.where(x > xp[-1], fp[-1], ret)
+  return np.where(x > xp[0], ret, fp[0])
+
+def interp(x, xp, fp):
+  if isinstance(x, np.ndarray):
+    return _interp_array(x, xp, fp)
+  return [_interp(v, xp, fp) for v in x] if hasattr(x, '__iter__') else _interp(x, xp, fp)
 
-  def get_interp(xv):
-    hi = 0
-    while hi < N and xv > xp[hi]:
-      hi += 1
-    low = hi - 1
-    return fp[-1] if hi == N and xv > xp[low] else (
-      fp[0] if hi == 0 else
-      (xv - xp[low]) * (fp[hi] - fp[low]) / (xp[hi] - xp[low]) + fp[low])
+class Interpolator:
+  """interp over constant breakpoints, converted to floats once instead of on every call"""
+  def __init__(self, xp, fp):
+    assert len(xp) == len(fp) > 0
+    self.xp_array = np.array(xp, dtype=np.float64)
+    self.fp_array = np.array(fp, dtype=np.float64)
+    # indexing lists of python floats is faster than numpy arrays
+    self.xp = self.xp_array.tolist()
+    self.fp = self.fp_array.tolist()
 
-  return [get_interp(v) for v in x] if hasattr(x, '__iter__') else get_interp(x)
+  def __call__(self, x):
+    if isinstance(x, np.ndarray):
+      return _interp_array(x, self.xp_array, self.fp_array)
+    return [_interp(v, self.xp, self.fp) for v in x] if hasattr(x, '__iter__') else _interp(x, self.xp, self.fp)
 
 def mean(x):
   return sum(x) / len(x)
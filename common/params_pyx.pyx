@@ -2,6 +2,10 @@
 # cython: language_level = 3
 from libcpp cimport bool
 from libcpp.string cimport string
+from posix.unistd cimport read, close
+import ctypes
+import ctypes.util
+import os
 import threading
 
 cdef extern from "selfdrive/common/params.h":
@@ -14,6 +18,7 @@ cdef extern from "selfdrive/common/params.h":
 
   cdef cppclass c_Params "Params":
     c_Params(string) nogil
+    string getParamPath(string) nogil
     string get(string, bool) nogil
     bool getBool(string) nogil
     int remove(string) nogil
@@ -29,19 +34,147 @@ def ensure_bytes(v):
 class UnknownKeyName(Exception):
   pass
 
+
+# inotify, see inotify(7)
+cdef struct inotify_event:
+  int wd
+  unsigned int mask
+  unsigned int cookie
+  unsigned int len
+
+cdef enum:
+  IN_MODIFY = 0x2
+  IN_CLOSE_WRITE = 0x8
+  IN_MOVED_FROM = 0x40
+  IN_MOVED_TO = 0x80
+  IN_CREATE = 0x100
+  IN_DELETE = 0x200
+  IN_DELETE_SELF = 0x400
+  IN_MOVE_SELF = 0x800
+  IN_Q_OVERFLOW = 0x4000
+  IN_IGNORED = 0x8000
+  IN_NONBLOCK = 0o4000
+  IN_CLOEXEC = 0o2000000
+
+cdef unsigned int WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | \
+                               IN_DELETE_SELF | IN_MOVE_SELF
+
+try:
+  _libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+  _inotify_init1 = _libc.inotify_init1
+  _inotify_add_watch = _libc.inotify_add_watch
+  _inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+except (OSError, AttributeError):
+  # no inotify, values are always read from disk
+  _inotify_init1 = None
+
+
+cdef class ParamsCache:
+  """
+  Values of one params directory read by this process. Every change to the
+  directory, from any process, queues an inotify event before the syscall
+  returns, so draining the events before a lookup never returns a stale value.
+  """
+  cdef bytes path
+  cdef int fd
+  cdef int wd
+  cdef dict values
+  cdef unsigned long generation
+  # put_nonblocking values not written yet
+  cdef dict pending
+  cdef dict writing
+
+  def __cinit__(self, bytes path):
+    self.path = path
+    self.fd = -1
+    self.wd = -1
+    self.pending = {}
+    self.writing = {}
+    self.reset()
+
+  def reset(self):
+    if self.fd >= 0:
+      close(self.fd)
+    self.fd = _inotify_init1(IN_NONBLOCK | IN_CLOEXEC) if _inotify_init1 is not None else -1
+    self.wd = -1
+    self.values = {}
+    self.generation += 1
+    self.pending.clear()
+    self.writing.clear()
+
+  cdef void invalidate(self, key) except *:
+    self.generation += 1
+    if key is None:
+      self.values.clear()
+    else:
+      self.values.pop(key, None)
+
+  cdef bint update(self):
+    """Drains the inotify events, returns False if the directory isn't watched"""
+    cdef char buf[4096]
+    cdef inotify_event* event
+    cdef ssize_t n, i
+
+    if self.fd < 0:
+      return False
+    if self.wd < 0:
+      self.wd = _inotify_add_watch(self.fd, self.path, WATCH_MASK)
+      if self.wd < 0:
+        return False
+      self.invalidate(None)
+
+    while True:
+      n = read(self.fd, buf, sizeof(buf))
+      if n <= 0:
+        return self.wd >= 0
+
+      i = 0
+      while i < n:
+        event = <inotify_event*>&buf[i]
+        if event.mask & IN_IGNORED:
+          # directory removed, watch it again on the next lookup
+          self.wd = -1
+          self.invalidate(None)
+        elif event.mask & (IN_Q_OVERFLOW | IN_DELETE_SELF | IN_MOVE_SELF):
+          self.invalidate(None)
+        elif event.len > 0:
+          self.invalidate(<bytes>(&buf[i + sizeof(inotify_event)]))
+        i += sizeof(inotify_event) + event.len
+
+  cdef lookup(self, bytes key):
+    """Returns the value if known without reading from disk, else None"""
+    v = self.pending.get(key)
+    if v is None:
+      v = self.writing.get(key)
+    if v is None and self.update():
+      v = self.values.get(key)
+    return v
+
+
+cdef dict _caches = {}
+
+cdef ParamsCache get_cache(d, bytes path):
+  cache = _caches.get(d)
+  if cache is None:
+    cache = _caches[d] = ParamsCache(path)
+  return cache
+
+
 cdef class Params:
   cdef c_Params* p
+  cdef ParamsCache cache
 
   def __cinit__(self, d=""):
     cdef string path = <string>d.encode()
     with nogil:
       self.p = new c_Params(path)
+    self.cache = get_cache(d, self.p.getParamPath(b""))
 
   def __dealloc__(self):
     del self.p
 
   def clear_all(self, tx_type=ParamKeyType.ALL):
-    self.p.clearAll(tx_type)
+    _writer.write_sync(self.cache, None, lambda: self.p.clearAll(tx_type))
 
   def check_key(self, key):
     key = ensure_bytes(key)
@@ -49,28 +182,46 @@ cdef class Params:
       raise UnknownKeyName(key)
     return key
 
+  cdef bytes read(self, bytes key):
+    cdef ParamsCache cache = self.cache
+    cdef string k = key
+    cdef string val
+    cdef unsigned long generation
+
+    v = cache.lookup(key)
+    if v is not None:
+      return v
+
+    generation = cache.generation
+    with nogil:
+      val = self.p.get(k, False)
+    v = val
+    # don't store the value if the key changed while reading
+    if cache.wd >= 0 and cache.generation == generation:
+      cache.values[key] = v
+    return v
+
   def get(self, key, bool block=False, encoding=None):
     cdef string k = self.check_key(key)
     cdef string val
-    with nogil:
-      val = self.p.get(k, block)
 
-    if val == b"":
-      if block:
+    if block:
+      with nogil:
+        val = self.p.get(k, block)
+      if val == b"":
         # If we got no value while running in blocked mode
         # it means we got an interrupt while waiting
         raise KeyboardInterrupt
-      else:
+      v = val
+    else:
+      v = self.read(k)
+      if v == b"":
         return None
 
-    return val if encoding is None else val.decode(encoding)
+    return v if encoding is None else v.decode(encoding)
 
   def get_bool(self, key):
-    cdef string k = self.check_key(key)
-    cdef bool r
-    with nogil:
-      r = self.p.getBool(k)
-    return r
+    return self.read(self.check_key(key)) == b"1"
 
   def put(self, key, dat):
     """
@@ -79,27 +230,130 @@ cdef class Params:
     Use the put_nonblocking helper function in time sensitive code, but
     in general try to avoid writing params as much as possible.
     """
-    cdef string k = self.check_key(key)
-    cdef string dat_bytes = ensure_bytes(dat)
-    with nogil:
-      self.p.put(k, dat_bytes)
+    key = self.check_key(key)
+    _writer.write_sync(self.cache, key, lambda: self.write(key, ensure_bytes(dat)))
 
   def put_bool(self, key, bool val):
-    cdef string k = self.check_key(key)
+    key = self.check_key(key)
+    _writer.write_sync(self.cache, key, lambda: self.write_bool(key, val))
+
+  def delete(self, key):
+    key = self.check_key(key)
+    _writer.write_sync(self.cache, key, lambda: self.remove(key))
+
+  cdef void write(self, string k, string dat) except *:
+    with nogil:
+      self.p.put(k, dat)
+
+  cdef void write_bool(self, string k, bool val) except *:
     with nogil:
       self.p.putBool(k, val)
 
-  def delete(self, key):
-    cdef string k = self.check_key(key)
+  cdef void remove(self, string k) except *:
     with nogil:
       self.p.remove(k)
 
+
+class PendingWrite:
+  def __init__(self, writer, seq):
+    self.writer = writer
+    self.seq = seq
+
+  def join(self, timeout=None):
+    """Waits until the value, or a later value of the same key, is written"""
+    return self.writer.wait(self.seq, timeout)
+
+
+class ParamsWriter:
+  """
+  Writes the values from put_nonblocking in one background thread. When a key
+  is put again before it is written, only the last value is written. A
+  synchronous put or delete of the key supersedes its value.
+  """
+  def __init__(self):
+    self.cv = threading.Condition()
+    # held while writing to disk, so a superseded value is never written after the put that superseded it
+    self.write_lock = threading.Lock()
+    self.queued = {}  # ParamsCache: Params
+    self.seq = 0
+    self.written = 0
+    self.thread = None
+
+  def put(self, Params params, bytes key, bytes val):
+    cdef ParamsCache cache = params.cache
+    with self.cv:
+      cache.pending[key] = val
+      self.queued.setdefault(cache, params)
+      self.seq += 1
+      if self.thread is None:
+        self.thread = threading.Thread(target=self.writer_thread, name="params_writer", daemon=True)
+        self.thread.start()
+      self.cv.notify_all()
+      return PendingWrite(self, self.seq)
+
+  def write_sync(self, ParamsCache cache, key, write):
+    """Drops the values of key, or of all keys if None, that aren't written yet and calls write"""
+    with self.write_lock:
+      with self.cv:
+        if key is None:
+          cache.pending.clear()
+          cache.writing.clear()
+        else:
+          cache.pending.pop(key, None)
+          cache.writing.pop(key, None)
+      write()
+
+  def write(self, Params params, bytes key, bytes val):
+    params.write(key, val)
+
+  def wait(self, seq, timeout=None):
+    with self.cv:
+      return self.cv.wait_for(lambda: self.written >= seq, timeout)
+
+  def writer_thread(self):
+    cdef ParamsCache cache
+    while True:
+      with self.cv:
+        self.cv.wait_for(lambda: self.queued)
+        queued, self.queued = self.queued, {}
+        seq = self.seq
+        for cache in queued:
+          # lookups find the values in writing until they're on disk
+          cache.writing = cache.pending
+          cache.pending = {}
+
+      try:
+        for cache, params in queued.items():
+          for key, val in list(cache.writing.items()):
+            with self.write_lock:
+              # skipped if superseded by a synchronous write
+              if cache.writing.get(key) is not val:
+                continue
+              try:
+                self.write(params, key, val)
+              except Exception:
+                from selfdrive.swaglog import cloudlog
+                cloudlog.exception(f"failed to write param {key}")
+              finally:
+                cache.writing.pop(key, None)
+      finally:
+        with self.cv:
+          self.written = seq
+          self.cv.notify_all()
+
+
+_writer = ParamsWriter()
+
 def put_nonblocking(key, val, d=""):
-  def f(key, val):
-    params = Params(d)
-    cdef string k = ensure_bytes(key)
-    params.put(k, val)
-
-  t = threading.Thread(target=f, args=(key, val))
-  t.start()
-  return t
+  params = Params(d)
+  return _writer.put(params, params.check_key(key), ensure_bytes(val))
+
+
+def _after_fork_in_child():
+  # the inotify fds are shared with the parent and the writer thread isn't running
+  global _writer
+  _writer = ParamsWriter()
+  for cache in _caches.values():
+    cache.reset()
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
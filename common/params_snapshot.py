@@ -0,0 +1,73 @@
+import struct
+import zlib
+from typing import Callable, Optional, Sequence
+
+import numpy as np
+
+from common.params import Params, put_nonblocking
+
+# magic, version, name length, number of values, then the name, the values as float64 and a crc32
+HEADER = struct.Struct("<4sBBH")
+MAGIC = b"OPSS"
+VERSION = 1
+
+
+def pack_values(name: str, values: Sequence[float]) -> bytes:
+  """Compact binary snapshot of values, tagged with the name of what they belong to"""
+  name_bytes = name.encode()
+  body = HEADER.pack(MAGIC, VERSION, len(name_bytes), len(values)) + name_bytes + np.asarray(values, dtype="<f8").tobytes()
+  return body + struct.pack("<I", zlib.crc32(body))
+
+
+def unpack_values(dat: Optional[bytes], name: str, n: int) -> Optional[np.ndarray]:
+  """Returns the values of a snapshot, None if it's corrupt or for something else"""
+  if dat is None or len(dat) < HEADER.size + 4:
+    return None
+  magic, version, name_len, count = HEADER.unpack_from(dat)
+  if magic != MAGIC or version != VERSION or count != n or len(dat) != HEADER.size + name_len + 8 * n + 4:
+    return None
+  if struct.unpack_from("<I", dat, len(dat) - 4)[0] != zlib.crc32(dat[:-4]):
+    return None
+  if dat[HEADER.size:HEADER.size + name_len] != name.encode():
+    return None
+
+  return np.frombuffer(dat, dtype="<f8", count=n, offset=HEADER.size + name_len).astype(np.float64)
+
+
+class ParamSnapshot:
+  """
+  Periodically saved state, like learned car parameters. Writes are queued on the
+  put_nonblocking writer thread, and skipped while all values are within their
+  tolerance of the last saved values, so saving often doesn't wear the flash.
+  """
+  def __init__(self, key: str, tolerances: Sequence[float], d: str = ""):
+    self.key = key
+    self.tolerances = np.asarray(tolerances, dtype=np.float64)
+    self.d = d
+    self.saved: Optional[np.ndarray] = None
+
+  def changed(self, values: np.ndarray) -> bool:
+    return self.saved is None or bool(np.any(np.abs(values - self.saved) > self.tolerances))
+
+  def save(self, values: Sequence[float], encode: Callable[[np.ndarray], bytes]):
+    """Writes encode(values) if the values changed, returns the pending write or None if skipped"""
+    values = np.array(values, dtype=np.float64)
+    if not np.isfinite(values).all() or not self.changed(values):
+      return None
+    self.saved = values
+    return put_nonblocking(self.key, encode(values), self.d)
+
+  def load(self, decode: Callable[[bytes], Optional[Sequence[float]]]) -> Optional[np.ndarray]:
+    """Reads the saved values, None if there are none or decode returns None or
+    values that aren't finite. The values aren't written again while unchanged."""
+    dat = Params(self.d).get(self.key)
+    if dat is None:
+      return None
+    values = decode(dat)
+    if values is None:
+      return None
+    values = np.array(values, dtype=np.float64)
+    if not np.isfinite(values).all():
+      return None
+    self.saved = values
+    return values
@@ -1,33 +1,35 @@
 import time
 
+from common.instrumentation import Histogram
+
+# display prints at most this often
+DISPLAY_INTERVAL = 1.  # seconds
+
+
 class Profiler():
+  """Prints section timings for debugging, use common.instrumentation.LoopStats to publish them"""
   def __init__(self, enabled=False):
-    self.enabled = enabled
-    self.cp = {}
-    self.cp_ignored = []
-    self.iter = 0
-    self.start_time = time.time()
-    self.last_time = self.start_time
-    self.tot = 0.
+    self.reset(enabled)
 
   def reset(self, enabled=False):
     self.enabled = enabled
     self.cp = {}
     self.cp_ignored = []
     self.iter = 0
-    self.start_time = time.time()
-    self.last_time = self.start_time
+    self.last_time = time.perf_counter_ns()
+    self.last_display = time.monotonic()
+    self.tot = 0
 
   def checkpoint(self, name, ignore=False):
     # ignore flag needed when benchmarking threads with ratekeeper
     if not self.enabled:
       return
-    tt = time.time()
+    tt = time.perf_counter_ns()
     if name not in self.cp:
-      self.cp[name] = 0.
+      self.cp[name] = Histogram()
       if ignore:
         self.cp_ignored.append(name)
-    self.cp[name] += tt - self.last_time
+    self.cp[name].add(tt - self.last_time)
     if not ignore:
       self.tot += tt - self.last_time
     self.last_time = tt
@@ -36,10 +38,13 @@ class Profiler():
     if not self.enabled:
       return
     self.iter += 1
+    if time.monotonic() - self.last_display < DISPLAY_INTERVAL:
+      return
+    self.last_display = time.monotonic()
+
     print("******* Profiling %d *******" % self.iter)
-    for n, ms in sorted(self.cp.items(), key=lambda x: -x[1]):
-      if n in self.cp_ignored:
-        print("%30s: %9.2f  avg: %7.2f  percent: %3.0f   IGNORED" % (n, ms*1000.0, ms*1000.0/self.iter, ms/self.tot*100))
-      else:
-        print("%30s: %9.2f  avg: %7.2f  percent: %3.0f" % (n, ms*1000.0, ms*1000.0/self.iter, ms/self.tot*100))
-    print(f"Iter clock: {self.tot / self.iter:2.6f}   TOTAL: {self.tot:2.2f}")
+    for n, h in sorted(self.cp.items(), key=lambda x: -x[1].total):
+      line = "%30s: %9.2f  avg: %7.3f  p50: %7.3f  p99: %7.3f  max: %7.3f  percent: %3.0f" % \
+             (n, h.total / 1e6, h.total / 1e6 / self.iter, h.percentile(50), h.percentile(99), h.max / 1e6, h.total / max(self.tot, 1) * 100)
+      print(line + ("   IGNORED" if n in self.cp_ignored else ""))
+    print(f"Iter clock: {self.tot / 1e9 / self.iter:2.6f}   TOTAL: {self.tot / 1e9:2.2f}")
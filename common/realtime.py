@@ -5,6 +5,7 @@ import time
 import multiprocessing
 from typing import Optional
 
+from common.instrumentation import LoopStats
 from common.clock import sec_since_boot  # pylint: disable=no-name-in-module, import-error
 from selfdrive.hardware import PC, TICI
 
@@ -14,6 +15,9 @@ DT_CTRL = 0.01  # controlsd
 DT_MDL = 0.05  # model
 DT_TRML = 0.5  # thermald and manager
 
+# lagging frames are summed up and logged at most this often
+LAG_LOG_INTERVAL = 1.  # seconds
+
 # driver monitoring
 if TICI:
   DT_DMON = 0.05
@@ -49,14 +53,20 @@ def config_realtime_process(core: int, priority: int) -> None:
 
 
 class Ratekeeper:
-  def __init__(self, rate: int, print_delay_threshold: Optional[float] = 0.0) -> None:
-    """Rate in Hz for ratekeeping. print_delay_threshold must be nonnegative."""
+  def __init__(self, rate: int, print_delay_threshold: Optional[float] = 0.0, stats: Optional[LoopStats] = None) -> None:
+    """Rate in Hz for ratekeeping. print_delay_threshold must be nonnegative.
+    The lag and the jitter of the loop period are recorded in stats, if given."""
     self._interval = 1. / rate
     self._next_frame_time = sec_since_boot() + self._interval
     self._print_delay_threshold = print_delay_threshold
     self._frame = 0
     self._remaining = 0.0
     self._process_name = multiprocessing.current_process().name
+    self._stats = stats
+    self._last_frame_time: Optional[float] = None
+    self._lagged_frames = 0
+    self._max_lag = 0.
+    self._last_lag_log = -LAG_LOG_INTERVAL
 
   @property
   def frame(self) -> int:
@@ -76,11 +86,28 @@ class Ratekeeper:
   # this only monitor the cumulative lag, but does not enforce a rate
   def monitor_time(self) -> bool:
     lagged = False
-    remaining = self._next_frame_time - sec_since_boot()
+    t = sec_since_boot()
+    remaining = self._next_frame_time - t
     self._next_frame_time += self._interval
+
+    if self._stats is not None:
+      self._stats.record("lag", int(max(-remaining, 0.) * 1e9))
+      if self._last_frame_time is not None:
+        self._stats.record("jitter", int(abs(t - self._last_frame_time - self._interval) * 1e9))
+    self._last_frame_time = t
+
     if self._print_delay_threshold is not None and remaining < -self._print_delay_threshold:
-      print(f"{self._process_name} lagging by {-remaining * 1000:.2f} ms")
       lagged = True
+      self._lagged_frames += 1
+      self._max_lag = max(self._max_lag, -remaining)
+    if self._lagged_frames > 0 and t - self._last_lag_log >= LAG_LOG_INTERVAL:
+      # not imported at the top, swaglog isn't needed by every user of common.realtime
+      from selfdrive.swaglog import cloudlog
+      cloudlog.debug(f"{self._process_name} lagging by up to {self._max_lag * 1000:.2f} ms in {self._lagged_frames} frames")
+      self._lagged_frames = 0
+      self._max_lag = 0.
+      self._last_lag_log = t
+
     self._frame += 1
     self._remaining = remaining
     return lagged
@@ -0,0 +1,85 @@
+import unittest
+from unittest import mock
+
+from common.instrumentation import BUCKETS_NS, Histogram, LoopStats
+from common.realtime import Ratekeeper
+
+
+class TestInstrumentation(unittest.TestCase):
+  def test_histogram_percentiles(self):
+    h = Histogram()
+    self.assertEqual(h.percentile(50), 0.)
+    for ms in range(1, 101):
+      h.add(ms * 1000000)
+
+    self.assertEqual(h.count, 100)
+    self.assertAlmostEqual(h.mean(), 50.5)
+    self.assertEqual(h.max, 100000000)
+    for p in (1, 50, 90, 99):
+      # within the 19% wide bucket
+      self.assertGreaterEqual(h.percentile(p), p)
+      self.assertLess(h.percentile(p), p * 2 ** 0.25)
+    self.assertEqual(h.percentile(100), 100.)
+
+    h.reset()
+    self.assertEqual((h.count, h.total, h.max, sum(h.counts)), (0, 0, 0, 0))
+
+  def test_histogram_overflow(self):
+    h = Histogram()
+    h.add(0)
+    h.add(10 * BUCKETS_NS[-1])
+    self.assertEqual(h.percentile(50), BUCKETS_NS[0] / 1e6)
+    self.assertEqual(h.percentile(99), 10 * BUCKETS_NS[-1] / 1e6)
+
+  def test_publish(self):
+    stats = LoopStats("test", publish_interval=10.)
+    with mock.patch("selfdrive.statsd.statlog") as statlog:
+      for _ in range(10):
+        stats.start()
+        stats.checkpoint("a")
+        stats.checkpoint("b")
+        stats.increment("skipped")
+        self.assertFalse(stats.end())
+      self.assertEqual(stats.sections["a"].count, 10)
+      statlog.gauge.assert_not_called()
+
+      self.assertTrue(stats.maybe_publish(stats.last_publish + int(10e9)))
+      gauges = {c.args[0]: c.args[1] for c in statlog.gauge.call_args_list}
+
+    for section in ("a", "b", "total"):
+      for stat in ("p50", "p90", "p99", "mean", "max"):
+        self.assertGreaterEqual(gauges[f"test_{section}_{stat}_ms"], 0.)
+    self.assertEqual(gauges["test_skipped"], 10)
+    # the histograms start over after publishing
+    self.assertEqual(stats.sections["a"].count, 0)
+    self.assertEqual(stats.counters["skipped"], 0)
+
+  def test_no_import_cycle(self):
+    # cereal.messaging falls back to time.time if importing common.realtime fails
+    import cereal.messaging
+    import common.realtime
+    self.assertIs(cereal.messaging.sec_since_boot, common.realtime.sec_since_boot)
+
+  def test_ratekeeper_lag(self):
+    stats = LoopStats("test")
+    t = [100.]
+    with mock.patch("common.realtime.sec_since_boot", lambda: t[0]), mock.patch("builtins.print") as p, \
+         mock.patch("selfdrive.swaglog.cloudlog") as log:
+      rk = Ratekeeper(100, print_delay_threshold=0., stats=stats)
+      for dt in (0.01, 0.01, 0.015, 0.01, 0.005):
+        t[0] += dt
+        rk.monitor_time()
+
+      # lagging frames are logged once, and nothing is printed
+      self.assertEqual(log.debug.call_count, 1)
+      p.assert_not_called()
+
+    self.assertEqual(stats.sections["lag"].count, 5)
+    self.assertAlmostEqual(stats.sections["lag"].max / 1e6, 5., places=3)
+    self.assertEqual(stats.sections["jitter"].count, 4)
+    self.assertAlmostEqual(stats.sections["jitter"].max / 1e6, 5., places=3)
+    self.assertAlmostEqual(rk.remaining, 0., places=6)
+
+
+if __name__ == "__main__":
+  unittest.main()
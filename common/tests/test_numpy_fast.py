@@ -0,0 +1,107 @@
+import random
+import unittest
+
+import numpy as np
+
+from common.numpy_fast import Interpolator, interp
+
+
+def reference_interp(x, xp, fp):
+  # linear scan implementation before bisect
+  N = len(xp)
+
+  def get_interp(xv):
+    hi = 0
+    while hi < N and xv > xp[hi]:
+      hi += 1
+    low = hi - 1
+    return fp[-1] if hi == N and xv > xp[low] else (
+      fp[0] if hi == 0 else
+      (xv - xp[low]) * (fp[hi] - fp[low]) / (xp[hi] - xp[low]) + fp[low])
+
+  return [get_interp(v) for v in x] if hasattr(x, '__iter__') else get_interp(x)
+
+
+def random_table(rng):
+  n = rng.randint(1, 20)
+  xp = sorted(rng.uniform(-100, 100) for _ in range(n))
+  if n > 2 and rng.random() < 0.3:
+    xp[1] = xp[0]  # repeated breakpoint
+  fp = [rng.uniform(-10, 10) for _ in range(n)]
+  return xp, fp
+
+
+def query_points(rng, xp):
+  # breakpoints, clamped edges and values in between
+  return xp + [xp[0] - 1., xp[-1] + 1., -0.0, 0.0, float('inf'), float('-inf')] + \
+         [rng.uniform(xp[0] - 10, xp[-1] + 10) for _ in range(50)]
+
+
+class InterpTest(unittest.TestCase):
+  def test_correctness_controls(self):
+    _A_CRUISE_MIN_BP = np.asarray([0., 5., 10., 20., 40.])
+    _A_CRUISE_MIN_V = np.asarray([-1.0, -.8, -.67, -.5, -.30])
+    v_ego_arr = [-1, -1e-12, 0, 4, 5, 6, 7, 10, 11, 15.2, 20, 21, 39,
+                 39.999999, 40, 41]
+
+    expected = np.interp(v_ego_arr, _A_CRUISE_MIN_BP, _A_CRUISE_MIN_V)
+    actual = interp(v_ego_arr, _A_CRUISE_MIN_BP, _A_CRUISE_MIN_V)
+    np.testing.assert_equal(actual, expected)
+
+    for v_ego in v_ego_arr:
+      expected = np.interp(v_ego, _A_CRUISE_MIN_BP, _A_CRUISE_MIN_V)
+      actual = interp(v_ego, _A_CRUISE_MIN_BP, _A_CRUISE_MIN_V)
+      np.testing.assert_equal(actual, expected)
+
+  def test_identical_to_reference(self):
+    rng = random.Random(0)
+    for _ in range(500):
+      xp, fp = random_table(rng)
+      x = query_points(rng, xp)
+      expected = reference_interp(x, xp, fp)
+      interpolator = Interpolator(xp, fp)
+
+      self.assertEqual(interp(x, xp, fp), expected)
+      self.assertEqual(interp(tuple(x), np.array(xp), np.array(fp)), expected)
+      self.assertEqual(interpolator(x), expected)
+      for v, e in zip(x, expected):
+        self.assertEqual(interp(v, xp, fp), e)
+        self.assertEqual(interpolator(v), e)
+
+      # vectorized path, bitwise identical
+      np.testing.assert_array_equal(interp(np.array(x), xp, fp), np.array(expected))
+      np.testing.assert_array_equal(interpolator(np.array(x)), np.array(expected))
+
+  def test_repeated_breakpoints(self):
+    # a step at repeated breakpoints, pinned to the linear scan
+    for xp, fp in [([0., 1., 1., 2.], [0., 1., 5., 6.]),
+                   ([0., 1., 1., 1., 2.], [0., 1., 3., 5., 6.]),
+                   ([0., 0., 1.], [2., 4., 6.]),
+                   ([0., 2., 2.], [0., 1., 9.]),
+                   ([1., 1., 1.], [0., 5., 9.])]:
+      x = [-1., 0., 0.5, 1., 1.5, 2., 3.]
+      expected = reference_interp(x, xp, fp)
+      self.assertEqual(interp(x, xp, fp), expected)
+      self.assertEqual(Interpolator(xp, fp)(x), expected)
+      np.testing.assert_array_equal(interp(np.array(x), xp, fp), np.array(expected))
+
+    self.assertEqual(interp([1., 1.5], [0., 1., 1., 2.], [0., 1., 5., 6.]), [1., 5.5])
+
+  def test_nan_and_ints(self):
+    xp, fp = [0, 1, 4], [3, 5, -2]
+    x = [float('nan'), -1, 0, 1, 2, 3, 4, 5]
+    expected = reference_interp(x, xp, fp)
+    np.testing.assert_equal(interp(x, xp, fp), expected)
+    np.testing.assert_equal(interp(np.array(x), xp, fp), np.array(expected, dtype=np.float64))
+    self.assertEqual(interp(2, xp, fp), reference_interp(2, xp, fp))
+
+  def test_array_shapes(self):
+    xp, fp = [0., 1.], [0., 10.]
+    self.assertEqual(interp(np.float64(0.5), xp, fp), 5.)
+    self.assertEqual(interp(np.array(0.5), xp, fp).shape, ())
+    np.testing.assert_array_equal(interp(np.array([[0.25, 2.]]), xp, fp), [[2.5, 10.]])
+    np.testing.assert_array_equal(interp(np.array([-1., 0.5, 2.]), [1.], [7.]), [7., 7., 7.])
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,151 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import common.params_pyx as params_pyx
+from common.params import Params, UnknownKeyName, put_nonblocking
+
+
+def put_in_new_process(d, key, val):
+  subprocess.check_call([sys.executable, "-c", "import sys; from common.params import Params; Params(sys.argv[1]).put(sys.argv[2], sys.argv[3])",
+                         d, key, val])
+
+
+class TestParams(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.params = Params(self.tmpdir)
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def test_params_put_and_get(self):
+    self.params.put("DongleId", "cb38263377b873ee")
+    self.assertEqual(self.params.get("DongleId"), b"cb38263377b873ee")
+    self.assertEqual(self.params.get("DongleId", encoding="utf8"), "cb38263377b873ee")
+
+    self.params.put_bool("IsMetric", True)
+    self.assertTrue(self.params.get_bool("IsMetric"))
+    self.params.put_bool("IsMetric", False)
+    self.assertFalse(self.params.get_bool("IsMetric"))
+
+    self.params.delete("DongleId")
+    self.assertIsNone(self.params.get("DongleId"))
+
+  def test_params_unknown_key(self):
+    with self.assertRaises(UnknownKeyName):
+      self.params.get("swag")
+    with self.assertRaises(UnknownKeyName):
+      self.params.put("swag", "abc")
+
+  def test_params_visible_across_instances(self):
+    other = Params(self.tmpdir)
+    self.assertIsNone(other.get("DongleId"))
+    self.params.put("DongleId", "abc")
+    self.assertEqual(other.get("DongleId"), b"abc")
+    self.params.clear_all()
+    self.assertIsNone(other.get("DongleId"))
+
+  def test_params_visible_across_processes(self):
+    for i in range(3):
+      self.assertEqual(self.params.get("DongleId"), None if i == 0 else str(i - 1).encode())
+      put_in_new_process(self.tmpdir, "DongleId", str(i))
+      self.assertEqual(self.params.get("DongleId"), str(i).encode())
+
+    # written without Params
+    with open(os.path.join(self.tmpdir, "d", "DongleId"), "w") as f:
+      f.write("abc")
+    self.assertEqual(self.params.get("DongleId"), b"abc")
+    os.unlink(os.path.join(self.tmpdir, "d", "DongleId"))
+    self.assertIsNone(self.params.get("DongleId"))
+
+  def test_params_get_block(self):
+    self.params.put("CarParams", "test")
+    self.assertEqual(self.params.get("CarParams", block=True), b"test")
+
+  def test_put_nonblocking(self):
+    # read back before and after being written
+    t = put_nonblocking("CalibrationParams", "first", self.tmpdir)
+    self.assertEqual(self.params.get("CalibrationParams"), b"first")
+    self.assertTrue(t.join(5))
+    self.assertEqual(self.params.get("CalibrationParams"), b"first")
+
+    # only the last value matters
+    threads = [put_nonblocking("CalibrationParams", str(i), self.tmpdir) for i in range(100)]
+    self.assertEqual(self.params.get("CalibrationParams"), b"99")
+    self.assertTrue(threads[0].join(5) and threads[-1].join(5))
+    with open(os.path.join(self.tmpdir, "d", "CalibrationParams")) as f:
+      self.assertEqual(f.read(), "99")
+
+  def test_put_supersedes_nonblocking(self):
+    # the writer thread is held, so the values from put_nonblocking aren't written yet
+    with params_pyx._writer.write_lock:
+      t = put_nonblocking("CalibrationParams", "nonblocking", self.tmpdir)
+      time.sleep(0.1)
+      put_nonblocking("LiveParameters", "nonblocking", self.tmpdir)
+    self.params.put("CalibrationParams", "sync")
+    self.params.delete("LiveParameters")
+    self.assertEqual(self.params.get("CalibrationParams"), b"sync")
+    self.assertIsNone(self.params.get("LiveParameters"))
+
+    self.assertTrue(t.join(5))
+    self.assertEqual(self.params.get("CalibrationParams"), b"sync")
+    self.assertIsNone(self.params.get("LiveParameters"))
+    with open(os.path.join(self.tmpdir, "d", "CalibrationParams")) as f:
+      self.assertEqual(f.read(), "sync")
+
+  def test_put_nonblocking_write_fails(self):
+    write = params_pyx._writer.write
+    failures = [OSError("no space left")]
+
+    def fail_once(*args):
+      if failures:
+        raise failures.pop()
+      write(*args)
+
+    with mock.patch.object(params_pyx._writer, "write", side_effect=fail_once):
+      self.assertTrue(put_nonblocking("CalibrationParams", "fails", self.tmpdir).join(5))
+      self.assertIsNone(self.params.get("CalibrationParams"))
+
+      # the writer thread keeps running
+      self.assertTrue(put_nonblocking("CalibrationParams", "written", self.tmpdir).join(5))
+      self.assertEqual(self.params.get("CalibrationParams"), b"written")
+
+  def test_latency(self):
+    n = 1000
+    self.params.put("DongleId", "abc")
+    path = os.path.join(self.tmpdir, "d", "DongleId")
+
+    t = time.monotonic()
+    for _ in range(n):
+      with open(path, "rb") as f:
+        f.read()
+    t_read = (time.monotonic() - t) / n
+
+    t = time.monotonic()
+    for _ in range(n):
+      self.params.get("DongleId")
+    t_get = (time.monotonic() - t) / n
+
+    t = time.monotonic()
+    for i in range(n):
+      put_nonblocking("DongleId", str(i), self.tmpdir)
+    t_put_nonblocking = (time.monotonic() - t) / n
+    put_nonblocking("DongleId", "abc", self.tmpdir).join(5)
+
+    t = time.monotonic()
+    for _ in range(10):
+      self.params.put("DongleId", "abc")
+    t_put = (time.monotonic() - t) / 10
+
+    print(f"file read {t_read * 1e6:.1f} us, get {t_get * 1e6:.1f} us, put_nonblocking {t_put_nonblocking * 1e6:.1f} us, put {t_put * 1e6:.1f} us")
+    self.assertLess(t_get, t_read)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,68 @@
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from common.params import Params
+from common.params_snapshot import ParamSnapshot, pack_values, unpack_values
+
+
+class TestParamsSnapshot(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.params = Params(self.tmpdir)
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def test_pack_unpack(self):
+    values = [15.3, 1.0, -0.25]
+    dat = pack_values("HYUNDAI SONATA 2020", values)
+    self.assertEqual(len(dat), 8 + len("HYUNDAI SONATA 2020") + 3 * 8 + 4)
+    np.testing.assert_array_equal(unpack_values(dat, "HYUNDAI SONATA 2020", 3), values)
+
+    # another car, number of values, corrupted or truncated
+    self.assertIsNone(unpack_values(dat, "HYUNDAI SANTA FE 2019", 3))
+    self.assertIsNone(unpack_values(dat, "HYUNDAI SONATA 2020", 2))
+    corrupted = bytearray(dat)
+    corrupted[-6] ^= 1
+    self.assertIsNone(unpack_values(bytes(corrupted), "HYUNDAI SONATA 2020", 3))
+    self.assertIsNone(unpack_values(dat[:-1], "HYUNDAI SONATA 2020", 3))
+    self.assertIsNone(unpack_values(b"", "HYUNDAI SONATA 2020", 3))
+    self.assertIsNone(unpack_values(b'{"steerRatio": 15.3}', "HYUNDAI SONATA 2020", 3))
+
+  def test_save_skips_unchanged(self):
+    snapshot = ParamSnapshot("LiveParametersSnapshot", [0.01, 0.001], self.tmpdir)
+    save = lambda values: snapshot.save(values, lambda v: pack_values("car", v))
+
+    self.assertIsNotNone(save([15.0, 1.0]))
+    self.assertIsNone(save([15.005, 1.0005]))
+    self.assertIsNone(save([14.991, 1.0]))
+    self.assertIsNotNone(save([15.02, 1.0]))
+    self.assertIsNotNone(save([15.02, 0.998]))
+    self.assertIsNone(save([np.nan, 1.0]))
+
+    self.assertTrue(save([16.0, 1.1]).join(5))
+    with open(f"{self.tmpdir}/d/LiveParametersSnapshot", "rb") as f:
+      np.testing.assert_array_equal(unpack_values(f.read(), "car", 2), [16.0, 1.1])
+
+  def test_load(self):
+    snapshot = ParamSnapshot("LiveParametersSnapshot", [0.01, 0.001], self.tmpdir)
+    decode = lambda dat: unpack_values(dat, "car", 2)
+    self.assertIsNone(snapshot.load(decode))
+
+    self.params.put("LiveParametersSnapshot", pack_values("car", [15.0, 1.0]))
+    np.testing.assert_array_equal(snapshot.load(decode), [15.0, 1.0])
+    self.assertIsNone(snapshot.save([15.0, 1.0], lambda v: pack_values("car", v)))
+
+    # rejected values are written again
+    for dat in (b"garbage", pack_values("car", [np.inf, 1.0])):
+      self.params.put("LiveParametersSnapshot", dat)
+      snapshot = ParamSnapshot("LiveParametersSnapshot", [0.01, 0.001], self.tmpdir)
+      self.assertIsNone(snapshot.load(decode))
+      self.assertTrue(snapshot.save([15.0, 1.0], lambda v: pack_values("car", v)).join(5))
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -8,14 +8,29 @@ from common.transformations.transformations import (ecef_euler_from_ned_single,
                                                     quat2euler_single,
                                                     quat2rot_single,
                                                     rot2euler_single,
-                                                    rot2quat_single)
+                                                    rot2quat_single,
+                                                    ecef_euler_from_ned_batch,
+                                                    euler2quat_batch,
+                                                    euler2rot_batch,
+                                                    ned_euler_from_ecef_batch,
+                                                    quat2euler_batch,
+                                                    quat2rot_batch,
+                                                    rot2euler_batch,
+                                                    rot2quat_batch)
 
 
-def numpy_wrap(function, input_shape, output_shape):
-  """Wrap a function to take either an input or list of inputs and return the correct shape"""
+def numpy_wrap(function, input_shape, output_shape, batch_function=None):
+  """Wrap a function to take either an input or list of inputs and return the correct shape
+
+  If batch_function is given, it is called once with all inputs stacked in a
+  contiguous float64 array instead of calling function for every input. Inputs
+  of any other shape go through function, which checks their length"""
   def f(*inps):
     *args, inp = inps
-    inp = np.array(inp)
+    if batch_function is not None:
+      inp = np.ascontiguousarray(inp, dtype=np.float64)
+    else:
+      inp = np.array(inp)
     shape = inp.shape
 
     if len(shape) == len(input_shape):
@@ -25,22 +40,25 @@ def numpy_wrap(function, input_shape, output_shape):
 
     # Add empty dimension if inputs is not a list
     if len(shape) == len(input_shape):
-      inp.shape = (1, ) + inp.shape
+      inp = inp.reshape((1, ) + inp.shape)
 
-    result = np.asarray([function(*args, i) for i in inp])
+    if batch_function is not None and inp.shape[1:] == input_shape:
+      result = batch_function(*args, inp)
+    else:
+      result = np.asarray([function(*args, i) for i in inp])
     result.shape = out_shape
     return result
   return f
 
 
-euler2quat = numpy_wrap(euler2quat_single, (3,), (4,))
-quat2euler = numpy_wrap(quat2euler_single, (4,), (3,))
-quat2rot = numpy_wrap(quat2rot_single, (4,), (3, 3))
-rot2quat = numpy_wrap(rot2quat_single, (3, 3), (4,))
-euler2rot = numpy_wrap(euler2rot_single, (3,), (3, 3))
-rot2euler = numpy_wrap(rot2euler_single, (3, 3), (3,))
-ecef_euler_from_ned = numpy_wrap(ecef_euler_from_ned_single, (3,), (3,))
-ned_euler_from_ecef = numpy_wrap(ned_euler_from_ecef_single, (3,), (3,))
+euler2quat = numpy_wrap(euler2quat_single, (3,), (4,), euler2quat_batch)
+quat2euler = numpy_wrap(quat2euler_single, (4,), (3,), quat2euler_batch)
+quat2rot = numpy_wrap(quat2rot_single, (4,), (3, 3), quat2rot_batch)
+rot2quat = numpy_wrap(rot2quat_single, (3, 3), (4,), rot2quat_batch)
+euler2rot = numpy_wrap(euler2rot_single, (3,), (3, 3), euler2rot_batch)
+rot2euler = numpy_wrap(rot2euler_single, (3, 3), (3,), rot2euler_batch)
+ecef_euler_from_ned = numpy_wrap(ecef_euler_from_ned_single, (3,), (3,), ecef_euler_from_ned_batch)
+ned_euler_from_ecef = numpy_wrap(ned_euler_from_ecef_single, (3,), (3,), ned_euler_from_ecef_batch)
 
 quats_from_rotations = rot2quat
 quat_from_rot = rot2quat
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+import unittest
+
+import numpy as np
+
+import common.transformations.coordinates as coord
+import common.transformations.orientation as orient
+import common.transformations.transformations as tf
+
+ECEF_INIT = [-2712700., -4281600., 3859300.]
+
+
+def random_eulers(rng, n):
+  return rng.uniform(-np.pi, np.pi, (n, 3)) * [1., 0.49, 1.]
+
+
+def random_quats(rng, n):
+  q = rng.normal(size=(n, 4))
+  return q / np.linalg.norm(q, axis=1, keepdims=True)
+
+
+def random_rots(rng, n):
+  return np.array([tf.euler2rot_single(e) for e in random_eulers(rng, n)]).reshape((n, 3, 3))
+
+
+def random_geodetics(rng, n):
+  return np.column_stack([rng.uniform(-89., 89., n), rng.uniform(-180., 180., n), rng.uniform(-100., 3000., n)])
+
+
+def random_ecefs(rng, n):
+  return np.array([tf.geodetic2ecef_single(g) for g in random_geodetics(rng, n)]).reshape((n, 3))
+
+
+def random_neds(rng, n):
+  return rng.uniform(-1e4, 1e4, (n, 3))
+
+
+class TestBatchTransformations(unittest.TestCase):
+  def setUp(self):
+    self.rng = np.random.default_rng(0)
+    local = coord.LocalCoord.from_ecef(ECEF_INIT)
+    # (batch kernel, wrapped function, per row function, input generator, output row shape)
+    self.cases = [
+      (tf.euler2quat_batch, orient.euler2quat, tf.euler2quat_single, random_eulers, (4,)),
+      (tf.quat2euler_batch, orient.quat2euler, tf.quat2euler_single, random_quats, (3,)),
+      (tf.quat2rot_batch, orient.quat2rot, tf.quat2rot_single, random_quats, (3, 3)),
+      (tf.rot2quat_batch, orient.rot2quat, tf.rot2quat_single, random_rots, (4,)),
+      (tf.euler2rot_batch, orient.euler2rot, tf.euler2rot_single, random_eulers, (3, 3)),
+      (tf.rot2euler_batch, orient.rot2euler, tf.rot2euler_single, random_rots, (3,)),
+      (lambda x: tf.ecef_euler_from_ned_batch(ECEF_INIT, x), lambda x: orient.ecef_euler_from_ned(ECEF_INIT, x),
+       lambda x: tf.ecef_euler_from_ned_single(ECEF_INIT, x), random_eulers, (3,)),
+      (lambda x: tf.ned_euler_from_ecef_batch(ECEF_INIT, x), lambda x: orient.ned_euler_from_ecef(ECEF_INIT, x),
+       lambda x: tf.ned_euler_from_ecef_single(ECEF_INIT, x), random_eulers, (3,)),
+      (tf.geodetic2ecef_batch, coord.geodetic2ecef, tf.geodetic2ecef_single, random_geodetics, (3,)),
+      (tf.ecef2geodetic_batch, coord.ecef2geodetic, tf.ecef2geodetic_single, random_ecefs, (3,)),
+      (local.ecef2ned_batch, local.ecef2ned, local.ecef2ned_single, random_ecefs, (3,)),
+      (local.ned2ecef_batch, local.ned2ecef, local.ned2ecef_single, random_neds, (3,)),
+      (local.geodetic2ned_batch, local.geodetic2ned, local.geodetic2ned_single, random_geodetics, (3,)),
+      (local.ned2geodetic_batch, local.ned2geodetic, local.ned2geodetic_single, random_neds, (3,)),
+    ]
+
+  def test_batch_matches_single(self):
+    for n in (100, 1, 0):
+      for i, (batch, wrapped, single, gen, out_shape) in enumerate(self.cases):
+        with self.subTest(case=i, n=n):
+          inp = gen(self.rng, n)
+          expected = np.array([np.reshape(single(x), out_shape) for x in inp]).reshape((n,) + out_shape)
+
+          out = batch(inp)
+          self.assertEqual(out.shape, (n,) + out_shape)
+          np.testing.assert_allclose(out, expected, rtol=1e-12, atol=1e-9)
+
+          out = wrapped(inp)
+          self.assertEqual(out.shape, (n,) + out_shape)
+          np.testing.assert_allclose(out, expected, rtol=1e-12, atol=1e-9)
+
+          # a list of rows, and a single row. An empty list is a single row, so needs an array
+          if n:
+            np.testing.assert_allclose(wrapped(inp.tolist()), expected, rtol=1e-12, atol=1e-9)
+            out = wrapped(inp[0])
+            self.assertEqual(out.shape, out_shape)
+            np.testing.assert_allclose(out, expected[0], rtol=1e-12, atol=1e-9)
+
+  def test_non_contiguous_input(self):
+    eulers = random_eulers(self.rng, 20)
+    strided = np.asfortranarray(eulers)[::2]
+    np.testing.assert_allclose(orient.euler2quat(strided), orient.euler2quat(eulers[::2].copy()))
+
+  def test_wrong_row_length(self):
+    # rows of the wrong length go through the per row function, which checks their length
+    with self.assertRaises(IndexError):
+      orient.euler2quat(np.zeros((2, 2)))
+    with self.assertRaises(IndexError):
+      orient.euler2quat([])
+
+
+if __name__ == "__main__":
+  unittest.main()
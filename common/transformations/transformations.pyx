@@ -17,7 +17,7 @@ from common.transformations.transformations cimport ecef2geodetic as ecef2geodet
 from common.transformations.transformations cimport LocalCoord_c
 
 
-import cython
+cimport cython
 import numpy as np
 cimport numpy as np
 
@@ -54,6 +54,25 @@ cdef Geodetic list2geodetic(geodetic):
     g.alt = geodetic[2]
     return g
 
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef Matrix3 view2matrix(double[:, :, ::1] m, Py_ssize_t k):
+    # Matrix3 is column major
+    cdef double buf[9]
+    cdef int i, j
+    for i in range(3):
+        for j in range(3):
+            buf[j * 3 + i] = m[k, i, j]
+    return Matrix3(buf)
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void matrix2view(Matrix3 m, double[:, :, ::1] out, Py_ssize_t k):
+    cdef int i, j
+    for i in range(3):
+        for j in range(3):
+            out[k, i, j] = m(i, j)
+
 def euler2quat_single(euler):
     cdef Vector3 e = Vector3(euler[0], euler[1], euler[2])
     cdef Quaternion q = euler2quat_c(e)
@@ -84,6 +103,84 @@ def rot2euler_single(rot):
     cdef Vector3 e = rot2euler_c(r)
     return [e(0), e(1), e(2)]
 
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def euler2quat_batch(double[:, ::1] euler):
+    cdef Py_ssize_t k
+    cdef Quaternion q
+    out = np.empty((euler.shape[0], 4))
+    cdef double[:, ::1] out_v = out
+    for k in range(euler.shape[0]):
+        q = euler2quat_c(Vector3(euler[k, 0], euler[k, 1], euler[k, 2]))
+        out_v[k, 0] = q.w()
+        out_v[k, 1] = q.x()
+        out_v[k, 2] = q.y()
+        out_v[k, 3] = q.z()
+    return out
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def quat2euler_batch(double[:, ::1] quat):
+    cdef Py_ssize_t k
+    cdef Vector3 e
+    out = np.empty((quat.shape[0], 3))
+    cdef double[:, ::1] out_v = out
+    for k in range(quat.shape[0]):
+        e = quat2euler_c(Quaternion(quat[k, 0], quat[k, 1], quat[k, 2], quat[k, 3]))
+        out_v[k, 0] = e(0)
+        out_v[k, 1] = e(1)
+        out_v[k, 2] = e(2)
+    return out
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def quat2rot_batch(double[:, ::1] quat):
+    cdef Py_ssize_t k
+    out = np.empty((quat.shape[0], 3, 3))
+    cdef double[:, :, ::1] out_v = out
+    for k in range(quat.shape[0]):
+        matrix2view(quat2rot_c(Quaternion(quat[k, 0], quat[k, 1], quat[k, 2], quat[k, 3])), out_v, k)
+    return out
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def rot2quat_batch(double[:, :, ::1] rot):
+    cdef Py_ssize_t k
+    cdef Quaternion q
+    out = np.empty((rot.shape[0], 4))
+    cdef double[:, ::1] out_v = out
+    for k in range(rot.shape[0]):
+        q = rot2quat_c(view2matrix(rot, k))
+        out_v[k, 0] = q.w()
+        out_v[k, 1] = q.x()
+        out_v[k, 2] = q.y()
+        out_v[k, 3] = q.z()
+    return out
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def euler2rot_batch(double[:, ::1] euler):
+    cdef Py_ssize_t k
+    out = np.empty((euler.shape[0], 3, 3))
+    cdef double[:, :, ::1] out_v = out
+    for k in range(euler.shape[0]):
+        matrix2view(euler2rot_c(Vector3(euler[k, 0], euler[k, 1], euler[k, 2])), out_v, k)
+    return out
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def rot2euler_batch(double[:, :, ::1] rot):
+    cdef Py_ssize_t k
+    cdef Vector3 e
+    out = np.empty((rot.shape[0], 3))
+    cdef double[:, ::1] out_v = out
+    for k in range(rot.shape[0]):
+        e = rot2euler_c(view2matrix(rot, k))
+        out_v[k, 0] = e(0)
+        out_v[k, 1] = e(1)
+        out_v[k, 2] = e(2)
+    return out
+
 def rot_matrix(roll, pitch, yaw):
     return matrix2numpy(rot_matrix_c(roll, pitch, yaw))
 
@@ -101,6 +198,36 @@ def ned_euler_from_ecef_single(ecef_init, ecef_pose):
     cdef Vector3 e = ned_euler_from_ecef_c(init, pose)
     return [e(0), e(1), e(2)]
 
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def ecef_euler_from_ned_batch(ecef_init, double[:, ::1] ned_pose):
+    cdef ECEF init = list2ecef(ecef_init)
+    cdef Py_ssize_t k
+    cdef Vector3 e
+    out = np.empty((ned_pose.shape[0], 3))
+    cdef double[:, ::1] out_v = out
+    for k in range(ned_pose.shape[0]):
+        e = ecef_euler_from_ned_c(init, Vector3(ned_pose[k, 0], ned_pose[k, 1], ned_pose[k, 2]))
+        out_v[k, 0] = e(0)
+        out_v[k, 1] = e(1)
+        out_v[k, 2] = e(2)
+    return out
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def ned_euler_from_ecef_batch(ecef_init, double[:, ::1] ecef_pose):
+    cdef ECEF init = list2ecef(ecef_init)
+    cdef Py_ssize_t k
+    cdef Vector3 e
+    out = np.empty((ecef_pose.shape[0], 3))
+    cdef double[:, ::1] out_v = out
+    for k in range(ecef_pose.shape[0]):
+        e = ned_euler_from_ecef_c(init, Vector3(ecef_pose[k, 0], ecef_pose[k, 1], ecef_pose[k, 2]))
+        out_v[k, 0] = e(0)
+        out_v[k, 1] = e(1)
+        out_v[k, 2] = e(2)
+    return out
+
 def geodetic2ecef_single(geodetic):
     cdef Geodetic g = list2geodetic(geodetic)
     cdef ECEF e = geodetic2ecef_c(g)
@@ -111,6 +238,34 @@ def ecef2geodetic_single(ecef):
     cdef Geodetic g = ecef2geodetic_c(e)
     return [g.lat, g.lon, g.alt]
 
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def geodetic2ecef_batch(double[:, ::1] geodetic):
+    cdef Py_ssize_t k
+    cdef ECEF e
+    out = np.empty((geodetic.shape[0], 3))
+    cdef double[:, ::1] out_v = out
+    for k in range(geodetic.shape[0]):
+        e = geodetic2ecef_c(Geodetic(geodetic[k, 0], geodetic[k, 1], geodetic[k, 2], False))
+        out_v[k, 0] = e.x
+        out_v[k, 1] = e.y
+        out_v[k, 2] = e.z
+    return out
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def ecef2geodetic_batch(double[:, ::1] ecef):
+    cdef Py_ssize_t k
+    cdef Geodetic g
+    out = np.empty((ecef.shape[0], 3))
+    cdef double[:, ::1] out_v = out
+    for k in range(ecef.shape[0]):
+        g = ecef2geodetic_c(ECEF(ecef[k, 0], ecef[k, 1], ecef[k, 2]))
+        out_v[k, 0] = g.lat
+        out_v[k, 1] = g.lon
+        out_v[k, 2] = g.alt
+    return out
+
 
 cdef class LocalCoord:
     cdef LocalCoord_c * lc
@@ -170,5 +325,65 @@ cdef class LocalCoord:
         cdef Geodetic g = self.lc.ned2geodetic(n)
         return [g.lat, g.lon, g.alt]
 
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    def ecef2ned_batch(self, double[:, ::1] ecef):
+        assert self.lc
+        cdef Py_ssize_t k
+        cdef NED n
+        out = np.empty((ecef.shape[0], 3))
+        cdef double[:, ::1] out_v = out
+        for k in range(ecef.shape[0]):
+            n = self.lc.ecef2ned(ECEF(ecef[k, 0], ecef[k, 1], ecef[k, 2]))
+            out_v[k, 0] = n.n
+            out_v[k, 1] = n.e
+            out_v[k, 2] = n.d
+        return out
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    def ned2ecef_batch(self, double[:, ::1] ned):
+        assert self.lc
+        cdef Py_ssize_t k
+        cdef ECEF e
+        out = np.empty((ned.shape[0], 3))
+        cdef double[:, ::1] out_v = out
+        for k in range(ned.shape[0]):
+            e = self.lc.ned2ecef(NED(ned[k, 0], ned[k, 1], ned[k, 2]))
+            out_v[k, 0] = e.x
+            out_v[k, 1] = e.y
+            out_v[k, 2] = e.z
+        return out
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    def geodetic2ned_batch(self, double[:, ::1] geodetic):
+        assert self.lc
+        cdef Py_ssize_t k
+        cdef NED n
+        out = np.empty((geodetic.shape[0], 3))
+        cdef double[:, ::1] out_v = out
+        for k in range(geodetic.shape[0]):
+            n = self.lc.geodetic2ned(Geodetic(geodetic[k, 0], geodetic[k, 1], geodetic[k, 2], False))
+            out_v[k, 0] = n.n
+            out_v[k, 1] = n.e
+            out_v[k, 2] = n.d
+        return out
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    def ned2geodetic_batch(self, double[:, ::1] ned):
+        assert self.lc
+        cdef Py_ssize_t k
+        cdef Geodetic g
+        out = np.empty((ned.shape[0], 3))
+        cdef double[:, ::1] out_v = out
+        for k in range(ned.shape[0]):
+            g = self.lc.ned2geodetic(NED(ned[k, 0], ned[k, 1], ned[k, 2]))
+            out_v[k, 0] = g.lat
+            out_v[k, 1] = g.lon
+            out_v[k, 2] = g.alt
+        return out
+
     def __dealloc__(self):
         del self.lc
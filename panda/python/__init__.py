@@ -25,73 +25,85 @@ CANPACKET_HEAD_SIZE = 0x5
 DLC_TO_LEN = [0, 1, 2, 3, 4, 5, 6, 7, 8, 12, 16, 20, 24, 32, 48, 64]
 LEN_TO_DLC = {length: dlc for (dlc, length) in enumerate(DLC_TO_LEN)}
 
+# dlc and bus, then address with the returned and rejected flags
+CANPACKET_HEAD = struct.Struct("<BI")
+USB_PACKET_SIZE = 64
+CAN_CHUNK_SIZE = 256
+
 def pack_can_buffer(arr):
-  snds = [b'']
-  idx = 0
+  # all CAN packets go in one buffer, then each chunk is split in 64 byte USB packets with a counter
+  buf = bytearray()
+  chunk_ends = []
+  chunk_start = 0
+  pack_head = CANPACKET_HEAD.pack
   for address, _, dat, bus in arr:
     assert len(dat) in LEN_TO_DLC
     if DEBUG:
       print(f"  W 0x{address:x}: 0x{dat.hex()}")
     extended = 1 if address >= 0x800 else 0
     data_len_code = LEN_TO_DLC[len(dat)]
-    header = bytearray(5)
-    word_4b = address << 3 | extended << 2
-    header[0] = (data_len_code << 4) | (bus << 1)
-    header[1] = word_4b & 0xFF
-    header[2] = (word_4b >> 8) & 0xFF
-    header[3] = (word_4b >> 16) & 0xFF
-    header[4] = (word_4b >> 24) & 0xFF
-    snds[idx] += header + dat
-    if len(snds[idx]) > 256: # Limit chunks to 256 bytes
-      snds.append(b'')
-      idx += 1
+    buf += pack_head((data_len_code << 4) | (bus << 1), (address << 3 | extended << 2) & 0xFFFFFFFF)
+    buf += dat
+    if len(buf) - chunk_start > CAN_CHUNK_SIZE: # Limit chunks to 256 bytes
+      chunk_start = len(buf)
+      chunk_ends.append(chunk_start)
+  chunk_ends.append(len(buf))
 
   #Apply counter to each 64 byte packet
-  for idx in range(len(snds)):
-    tx = b''
-    counter = 0
-    for i in range (0, len(snds[idx]), 63):
-      tx += bytes([counter]) + snds[idx][i:i+63]
-      counter += 1
-    snds[idx] = tx
+  mv = memoryview(buf)
+  payload_size = USB_PACKET_SIZE - 1
+  snds = []
+  chunk_start = 0
+  for chunk_end in chunk_ends:
+    chunk_len = chunk_end - chunk_start
+    num_packets = -(-chunk_len // payload_size)
+    tx = bytearray(chunk_len + num_packets)
+    for counter in range(num_packets):
+      src = chunk_start + counter * payload_size
+      dst = counter * USB_PACKET_SIZE
+      n = min(payload_size, chunk_end - src)
+      tx[dst] = counter
+      tx[dst + 1:dst + 1 + n] = mv[src:src + n]
+    snds.append(bytes(tx))
+    chunk_start = chunk_end
   return snds
 
 def unpack_can_buffer(dat):
   ret = []
-  counter = 0
-  tail = bytearray()
-  for i in range(0, len(dat), 64):
+
+  # CAN packets can span USB packets, strip the counters to parse them as one stream
+  mv = memoryview(dat)
+  payloads = []
+  for counter, i in enumerate(range(0, len(dat), USB_PACKET_SIZE)):
     if counter != dat[i]:
       print("CAN: LOST RECV PACKET COUNTER")
       break
-    counter+=1
-    chunk = tail + dat[i+1:i+64]
-    tail = bytearray()
-    pos = 0
-    while pos<len(chunk):
-      data_len = DLC_TO_LEN[(chunk[pos]>>4)]
-      pckt_len = CANPACKET_HEAD_SIZE + data_len
-      if pckt_len <= len(chunk[pos:]):
-        header = chunk[pos:pos+CANPACKET_HEAD_SIZE]
-        if len(header) < 5:
-          print("CAN: MALFORMED USB RECV PACKET")
-          break
-        bus = (header[0] >> 1) & 0x7
-        address = (header[4] << 24 | header[3] << 16 | header[2] << 8 | header[1]) >> 3
-        returned = (header[1] >> 1) & 0x1
-        rejected = header[1] & 0x1
-        data = chunk[pos + CANPACKET_HEAD_SIZE:pos + CANPACKET_HEAD_SIZE + data_len]
-        if returned:
-          bus += 128
-        if rejected:
-          bus += 192
-        if DEBUG:
-          print(f"  R 0x{address:x}: 0x{data.hex()}")
-        ret.append((address, 0, data, bus))
-        pos += pckt_len
-      else:
-        tail = chunk[pos:]
-        break
+    payloads.append(mv[i+1:i+USB_PACKET_SIZE])
+  stream = bytearray().join(payloads)
+
+  pos = 0
+  stream_len = len(stream)
+  unpack_head = CANPACKET_HEAD.unpack_from
+  # an incomplete packet at the end is dropped
+  while pos < stream_len:
+    data_len = DLC_TO_LEN[(stream[pos]>>4)]
+    pckt_len = CANPACKET_HEAD_SIZE + data_len
+    if pos + pckt_len > stream_len:
+      break
+    head, word_4b = unpack_head(stream, pos)
+    bus = (head >> 1) & 0x7
+    address = word_4b >> 3
+    returned = (word_4b >> 1) & 0x1
+    rejected = word_4b & 0x1
+    data = stream[pos + CANPACKET_HEAD_SIZE:pos + pckt_len]
+    if returned:
+      bus += 128
+    if rejected:
+      bus += 192
+    if DEBUG:
+      print(f"  R 0x{address:x}: 0x{data.hex()}")
+    ret.append((address, 0, data, bus))
+    pos += pckt_len
   return ret
 
 def ensure_health_packet_version(fn):
@@ -2,6 +2,11 @@ import os
 
 import numpy as np
 
+CHI2_LOOKUP_TABLE_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'chi2_lookup_table.npy')
+CHI2_P_BP = np.arange(.01, .99, .01)
+
+_chi2_table = None
+
 
 def gen_chi2_ppf_lookup(max_dim=200):
   from scipy.stats import chi2
@@ -12,9 +17,32 @@ def gen_chi2_ppf_lookup(max_dim=200):
   np.save('chi2_lookup_table', table)
 
 
+def get_chi2_lookup_table():
+  # loaded once per process, the table never changes at runtime
+  global _chi2_table
+  if _chi2_table is None:
+    _chi2_table = np.load(CHI2_LOOKUP_TABLE_PATH)
+  return _chi2_table
+
+
 def chi2_ppf(p, dim):
-  table = np.load(os.path.dirname(os.path.realpath(__file__)) + '/chi2_lookup_table.npy')
-  result = np.interp(p, np.arange(.01, .99, .01), table[dim])
+  """Chi-squared percent point function from the lookup table.
+
+  p and dim can either be scalars or arrays of equal shape, in which
+  case the thresholds for all (p, dim) pairs are computed at once.
+  """
+  table = get_chi2_lookup_table()
+  if np.ndim(p) == 0 and np.ndim(dim) == 0:
+    return np.interp(p, CHI2_P_BP, table[dim])
+
+  p, dim = np.broadcast_arrays(np.asarray(p, dtype=np.float64), np.asarray(dim, dtype=np.intp))
+  # same linear interpolation and edge clamping as np.interp
+  idx = np.clip(np.searchsorted(CHI2_P_BP, p, side='right') - 1, 0, len(CHI2_P_BP) - 2)
+  x0, x1 = CHI2_P_BP[idx], CHI2_P_BP[idx + 1]
+  f0, f1 = table[dim, idx], table[dim, idx + 1]
+  result = (f1 - f0) / (x1 - x0) * (p - x0) + f0
+  result = np.where(p <= CHI2_P_BP[0], table[dim, 0], result)
+  result = np.where(p >= CHI2_P_BP[-1], table[dim, -1], result)
   return result
 
 
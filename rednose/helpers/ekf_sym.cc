@@ -84,20 +84,34 @@ void EKFSym::set_global(std::string global_var, double val) {
 std::optional<Estimate> EKFSym::predict_and_update_batch(double t, int kind, std::vector<Map<VectorXd>> z_map,
     std::vector<Map<MatrixXdr>> R_map, std::vector<std::vector<double>> extra_args, bool augment)
 {
-  // TODO handle rewinding at this level
+  Observation obs;
+  obs.t = t;
+  obs.kind = kind;
+  obs.extra_args = extra_args;
+  for (Map<VectorXd> zi : z_map) {
+    obs.z.push_back(zi);
+  }
+  for (Map<MatrixXdr> Ri : R_map) {
+    obs.R.push_back(Ri);
+  }
 
-  std::deque<Observation> rewound;
-  if (!std::isnan(this->filter_time) && t < this->filter_time) {
-    if (this->rewind_t.empty() || t < this->rewind_t.front() || t < this->rewind_t.back() - this->max_rewind_age) {
-      LOGD("observation too old at %d with filter at %d, ignoring!", t, this->filter_time);
-      return std::nullopt;
-    }
-    rewound = this->rewind(t);
+  return this->rewind_and_update(obs, augment);
+}
+
+std::optional<Estimate> EKFSym::predict_and_update_multi(double t, std::vector<int> kinds, std::vector<Map<VectorXd>> z_map,
+    std::vector<Map<MatrixXdr>> R_map, std::vector<std::vector<double>> extra_args)
+{
+  // observations of different kinds at the same time, applied in a single stacked update
+  assert(kinds.size() == z_map.size());
+  for (int kind : kinds) {
+    assert(std::find(this->maha_test_kinds.begin(), this->maha_test_kinds.end(), kind) == this->maha_test_kinds.end());
+    assert(std::find(this->ekf->feature_kinds.begin(), this->ekf->feature_kinds.end(), kind) == this->ekf->feature_kinds.end());
   }
 
   Observation obs;
   obs.t = t;
-  obs.kind = kind;
+  obs.kind = -1;
+  obs.kinds = kinds;
   obs.extra_args = extra_args;
   for (Map<VectorXd> zi : z_map) {
     obs.z.push_back(zi);
@@ -106,6 +120,21 @@ std::optional<Estimate> EKFSym::predict_and_update_batch(double t, int kind, std
     obs.R.push_back(Ri);
   }
 
+  return this->rewind_and_update(obs, false);
+}
+
+std::optional<Estimate> EKFSym::rewind_and_update(Observation& obs, bool augment) {
+  // TODO handle rewinding at this level
+
+  std::deque<Observation> rewound;
+  if (!std::isnan(this->filter_time) && obs.t < this->filter_time) {
+    if (this->rewind_t.empty() || obs.t < this->rewind_t.front() || obs.t < this->rewind_t.back() - this->max_rewind_age) {
+      LOGD("observation too old at %d with filter at %d, ignoring!", obs.t, this->filter_time);
+      return std::nullopt;
+    }
+    rewound = this->rewind(obs.t);
+  }
+
   std::optional<Estimate> res = std::make_optional(this->predict_and_update_batch(obs, augment));
 
   // optional fast forward
@@ -172,12 +201,16 @@ Estimate EKFSym::predict_and_update_batch(Observation& obs, bool augment) {
 
   // update batch
   std::vector<VectorXd> y;
-  for (int i = 0; i < obs.z.size(); i++) {
-    assert(obs.z[i].rows() == obs.R[i].rows());
-    assert(obs.z[i].rows() == obs.R[i].cols());
-
-    // update state
-    y.push_back(this->update(obs.kind, obs.z[i], obs.R[i], obs.extra_args[i]));
+  if (!obs.kinds.empty()) {
+    y = this->update_stacked(obs);
+  } else {
+    for (int i = 0; i < obs.z.size(); i++) {
+      assert(obs.z[i].rows() == obs.R[i].rows());
+      assert(obs.z[i].rows() == obs.R[i].cols());
+
+      // update state
+      y.push_back(this->update(obs.kind, obs.z[i], obs.R[i], obs.extra_args[i]));
+    }
   }
 
   res.xk = this->x;
@@ -219,6 +252,57 @@ VectorXd EKFSym::update(int kind, VectorXd z, MatrixXdr R, std::vector<double> e
   return z;
 }
 
+std::vector<VectorXd> EKFSym::update_stacked(Observation& obs) {
+  // same as the generated update, with the observations stacked and a block diagonal R
+  int dim_z = 0;
+  for (const VectorXd& zi : obs.z) {
+    dim_z += zi.rows();
+  }
+
+  VectorXd y(dim_z);
+  MatrixXdr H(dim_z, this->dim_x);
+  MatrixXdr R = MatrixXdr::Zero(dim_z, dim_z);
+  for (int i = 0, row = 0; i < obs.z.size(); row += obs.z[i].rows(), i++) {
+    int n = obs.z[i].rows();
+    assert(n == obs.R[i].rows() && n == obs.R[i].cols());
+
+    VectorXd h(n);
+    MatrixXdr H_i(n, this->dim_x);
+    this->ekf->hs.at(obs.kinds[i])(this->x.data(), obs.extra_args[i].data(), h.data());
+    this->ekf->Hs.at(obs.kinds[i])(this->x.data(), obs.extra_args[i].data(), H_i.data());
+
+    y.segment(row, n) = obs.z[i] - h;
+    H.middleRows(row, n) = H_i;
+    R.block(row, row, n, n) = obs.R[i];
+  }
+
+  // if using eskf
+  MatrixXdr H_mod(this->dim_x, this->dim_err);
+  this->ekf->H_mod_fun(this->x.data(), H_mod.data());
+  MatrixXdr H_err = H * H_mod;
+
+  // kalman gains and I_KH
+  MatrixXdr S = ((H_err * this->P) * H_err.transpose()) + R;
+  MatrixXdr KT = S.fullPivLu().solve(H_err * this->P.transpose());
+  MatrixXdr I_KH = MatrixXdr::Identity(this->dim_err, this->dim_err) - (KT.transpose() * H_err);
+
+  // update state by injecting dx
+  VectorXd dx = KT.transpose() * y;
+  VectorXd x_new(this->dim_x);
+  this->ekf->err_fun(this->x.data(), dx.data(), x_new.data());
+  this->x = x_new;
+  this->normalize_quaternions();
+
+  // update cov
+  this->P = ((I_KH * this->P) * I_KH.transpose()) + ((KT.transpose() * R) * KT);
+
+  std::vector<VectorXd> ys;
+  for (int i = 0, row = 0; i < obs.z.size(); row += obs.z[i].rows(), i++) {
+    ys.push_back(y.segment(row, obs.z[i].rows()));
+  }
+  return ys;
+}
+
 extra_routine_t EKFSym::get_extra_routine(const std::string& routine) {
   return this->ekf->extra_routines.at(routine);
 }
@@ -23,6 +23,7 @@ typedef Eigen::Matrix<double, Eigen::Dynamic, Eigen::Dynamic, Eigen::RowMajor> M
 typedef struct Observation {
   double t;
   int kind;
+  std::vector<int> kinds;  // kind of every z for stacked observations, empty otherwise
   std::vector<Eigen::VectorXd> z;
   std::vector<MatrixXdr> R;
   std::vector<std::vector<double>> extra_args;
@@ -61,6 +62,8 @@ public:
   void predict(double t);
   std::optional<Estimate> predict_and_update_batch(double t, int kind, std::vector<Eigen::Map<Eigen::VectorXd>> z,
       std::vector<Eigen::Map<MatrixXdr>> R, std::vector<std::vector<double>> extra_args = {{}}, bool augment = false);
+  std::optional<Estimate> predict_and_update_multi(double t, std::vector<int> kinds, std::vector<Eigen::Map<Eigen::VectorXd>> z,
+      std::vector<Eigen::Map<MatrixXdr>> R, std::vector<std::vector<double>> extra_args);
 
   extra_routine_t get_extra_routine(const std::string& routine);
 
@@ -68,8 +71,10 @@ private:
   std::deque<Observation> rewind(double t);
   void checkpoint(Observation& obs);
 
+  std::optional<Estimate> rewind_and_update(Observation& obs, bool augment);
   Estimate predict_and_update_batch(Observation& obs, bool augment);
   Eigen::VectorXd update(int kind, Eigen::VectorXd z, MatrixXdr R, std::vector<double> extra_args);
+  std::vector<Eigen::VectorXd> update_stacked(Observation& obs);
 
   // stuct with linked sympy generated functions
   const EKF *ekf = NULL;
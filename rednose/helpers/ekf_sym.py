@@ -1,6 +1,5 @@
 import os
 import logging
-from bisect import bisect_right
 
 import numpy as np
 import sympy as sp
@@ -10,6 +9,9 @@ from rednose.helpers.sympy_helpers import sympy_into_c
 from rednose.helpers import TEMPLATE_DIR, load_code
 from rednose.helpers.chi2_lookup import chi2_ppf
 
+# number of checkpoints kept around for rewinding
+REWIND_TO_KEEP = 512
+
 
 def solve(a, b):
   if a.shape[0] == 1 and a.shape[1] == 1:
@@ -26,6 +28,81 @@ def null(H, eps=1e-12):
   return np.transpose(null_space)
 
 
+class RewindBuffer():
+  """Preallocated ring buffer of filter checkpoints, ordered by time.
+
+  Checkpoints are stored in place, so pushing one is O(1) and finding the
+  checkpoint to rewind to is a binary search over the logical order.
+  """
+  def __init__(self, size, dim_x, dim_err):
+    self.size = size
+    self.t = np.zeros(size, dtype=np.float64)
+    self.x = np.zeros((size, dim_x, 1), dtype=np.float64)
+    self.P = np.zeros((size, dim_err, dim_err), dtype=np.float64)
+    self.obs = [None] * size
+    self.start = 0
+    self.count = 0
+
+  def __len__(self):
+    return self.count
+
+  def _idx(self, i):
+    return (self.start + i) % self.size
+
+  def clear(self):
+    self.obs = [None] * self.size
+    self.start = 0
+    self.count = 0
+
+  def push(self, t, x, P, obs):
+    if self.count < self.size:
+      idx = self._idx(self.count)
+      self.count += 1
+    else:
+      # overwrite the oldest checkpoint
+      idx = self.start
+      self.start = (self.start + 1) % self.size
+    self.t[idx] = t
+    self.x[idx] = x
+    self.P[idx] = P
+    self.obs[idx] = obs
+
+  def time(self, i):
+    if i < 0:
+      i += self.count
+    if not 0 <= i < self.count:
+      raise IndexError("rewind buffer index out of range")
+    return self.t[self._idx(i)]
+
+  def state(self, i):
+    idx = self._idx(i)
+    return self.x[idx], self.P[idx]
+
+  def bisect_right(self, t):
+    lo, hi = 0, self.count
+    while lo < hi:
+      mid = (lo + hi) // 2
+      if t < self.t[self._idx(mid)]:
+        hi = mid
+      else:
+        lo = mid + 1
+    return lo
+
+  def truncate(self, n):
+    """Drops all checkpoints from index n on and returns their observations."""
+    ret = []
+    for i in range(n, self.count):
+      idx = self._idx(i)
+      ret.append(self.obs[idx])
+      self.obs[idx] = None
+    self.count = n
+    return ret
+
+  @property
+  def nbytes(self):
+    return self.t.nbytes + self.x.nbytes + self.P.nbytes
+
+
 def gen_code(folder, name, f_sym, dt_sym, x_sym, obs_eqs, dim_x, dim_err, eskf_params=None, msckf_params=None,  # pylint: disable=dangerous-default-value
              maha_test_kinds=[], quaternion_idxs=[], global_vars=None, extra_routines=[]):
   # optional state transition matrix, H modifier
@@ -134,14 +211,16 @@ def gen_code(folder, name, f_sym, dt_sym, x_sym, obs_eqs, dim_x, dim_err, eskf_p
   post_code = "\n}\n" # namespace
   post_code += "extern \"C\" {\n\n"
 
-  for h_sym, kind, ea_sym, H_sym, He_sym in obs_eqs:
+  # mahalanobis distance for outlier detection
+  maha_threshs = chi2_ppf(np.full(len(obs_eqs), 0.95), [int(h_sym.shape[0]) for h_sym, _, _, _, _ in obs_eqs])
+
+  for (h_sym, kind, ea_sym, H_sym, He_sym), maha_thresh in zip(obs_eqs, maha_threshs):
     if msckf and kind in feature_track_kinds:
       He_str = 'He_%d' % kind
       # ea_dim = ea_sym.shape[0]
     else:
       He_str = 'NULL'
       # ea_dim = 1 # not really dim of ea but makes c function work
-    maha_thresh = chi2_ppf(0.95, int(h_sym.shape[0]))  # mahalanobis distance for outlier detection
     maha_test = kind in maha_test_kinds
 
     pre_code += f"const static double MAHA_THRESH_{kind} = {maha_thresh};\n"
@@ -238,6 +317,8 @@ class EKF_sym():
     # kinds that should get mahalanobis distance
     # tested for outlier rejection
     self.maha_test_kinds = maha_test_kinds
+    # chi2 thresholds by (p, dim), so outlier tests don't hit the lookup table
+    self.maha_threshs = {}
 
     # quaternions need normalization
     self.quaternion_idxs = quaternion_idxs
@@ -247,9 +328,8 @@ class EKF_sym():
 
     # rewind stuff
     self.max_rewind_age = max_rewind_age
-    self.rewind_t = []
-    self.rewind_states = []
-    self.rewind_obscache = []
+    self.rewind_buffer = RewindBuffer(REWIND_TO_KEEP, self.dim_x, self.dim_err)
+    self.logger.info("EKF %s rewind buffer uses %.1f kB" % (name, self.rewind_buffer.nbytes / 1024))
     self.init_state(x_initial, P_initial, None)
 
     ffi, lib = load_code(folder, name, "kf")
@@ -350,14 +430,10 @@ class EKF_sym():
     self.P = np.array(covs).astype(np.float64)
     self.filter_time = filter_time
     self.augment_times = [0] * self.N
-    self.rewind_obscache = []
-    self.rewind_t = []
-    self.rewind_states = []
+    self.rewind_buffer.clear()
 
   def reset_rewind(self):
-    self.rewind_obscache = []
-    self.rewind_t = []
-    self.rewind_states = []
+    self.rewind_buffer.clear()
 
   def augment(self):
     # TODO this is not a generalized way of doing this and implies that the augmented states
@@ -412,39 +488,34 @@ class EKF_sym():
   def set_global(self, global_var, val):
     self.set_globals[global_var](val)
 
+  def get_maha_thresh(self, p, dim):
+    key = (p, dim)
+    if key not in self.maha_threshs:
+      self.maha_threshs[key] = chi2_ppf(p, dim)
+    return self.maha_threshs[key]
+
   def rewind(self, t):
     # find where we are rewinding to
-    idx = bisect_right(self.rewind_t, t)
-    assert self.rewind_t[idx - 1] <= t
-    assert self.rewind_t[idx] > t    # must be true, or rewind wouldn't be called
+    idx = self.rewind_buffer.bisect_right(t)
+    assert self.rewind_buffer.time(idx - 1) <= t
+    assert self.rewind_buffer.time(idx) > t    # must be true, or rewind wouldn't be called
 
     # set the state to the time right before that
-    self.filter_time = self.rewind_t[idx - 1]
-    self.x[:] = self.rewind_states[idx - 1][0]
-    self.P[:] = self.rewind_states[idx - 1][1]
-
-    # return the observations we rewound over for fast forwarding
-    ret = self.rewind_obscache[idx:]
+    self.filter_time = self.rewind_buffer.time(idx - 1)
+    x, P = self.rewind_buffer.state(idx - 1)
+    self.x[:] = x
+    self.P[:] = P
 
-    # throw away the old future
-    # TODO: is this making a copy?
-    self.rewind_t = self.rewind_t[:idx]
-    self.rewind_states = self.rewind_states[:idx]
-    self.rewind_obscache = self.rewind_obscache[:idx]
-
-    return ret
+    # throw away the old future and return the observations
+    # we rewound over for fast forwarding
+    return self.rewind_buffer.truncate(idx)
 
   def checkpoint(self, obs):
-    # push to rewinder
-    self.rewind_t.append(self.filter_time)
-    self.rewind_states.append((np.copy(self.x), np.copy(self.P)))
-    self.rewind_obscache.append(obs)
+    # push to rewinder, the oldest checkpoint is dropped when full
+    self.rewind_buffer.push(self.filter_time, self.x, self.P, obs)
 
-    # only keep a certain number around
-    REWIND_TO_KEEP = 512
-    self.rewind_t = self.rewind_t[-REWIND_TO_KEEP:]
-    self.rewind_states = self.rewind_states[-REWIND_TO_KEEP:]
-    self.rewind_obscache = self.rewind_obscache[-REWIND_TO_KEEP:]
+  def rewind_memory_usage(self):
+    return self.rewind_buffer.nbytes
 
   def predict(self, t):
     # initialize time
@@ -459,11 +530,25 @@ class EKF_sym():
     self.filter_time = t
 
   def predict_and_update_batch(self, t, kind, z, R, extra_args=[[]], augment=False):  # pylint: disable=dangerous-default-value
+    return self._rewind_and_update(t, kind, z, R, extra_args, augment)
+
+  def predict_and_update_multi(self, t, kinds, z, R, extra_args=None):
+    """Predicts to t once and applies observations of different kinds, one z and R per kind, in a single stacked update"""
+    for kind in kinds:
+      assert kind not in self.maha_test_kinds, "stacked updates can't gate single observations"
+      assert kind not in self.Hes, "stacked updates can't project out feature positions"
+    if extra_args is None:
+      extra_args = [[] for _ in kinds]
+
+    # a tuple of kinds marks a stacked observation, so it's replayed as one when rewinding
+    return self._rewind_and_update(t, tuple(kinds), z, R, extra_args)
+
+  def _rewind_and_update(self, t, kind, z, R, extra_args, augment=False):
     # TODO handle rewinding at this level"
 
     # rewind
     if self.filter_time is not None and t < self.filter_time:
-      if len(self.rewind_t) == 0 or t < self.rewind_t[0] or t < self.rewind_t[-1] - self.max_rewind_age:
+      if len(self.rewind_buffer) == 0 or t < self.rewind_buffer.time(0) or t < self.rewind_buffer.time(-1) - self.max_rewind_age:
         self.logger.error("observation too old at %.3f with filter at %.3f, ignoring" % (t, self.filter_time))
         return None
       rewound = self.rewind(t)
@@ -491,9 +576,30 @@ class EKF_sym():
       R  (mat [n,dim_z, dim_z]): Measurement Noise
       extra_args    (list, [n]): Values used in H computations
     """
-    assert z.shape[0] == R.shape[0]
-    assert z.shape[1] == R.shape[1]
-    assert z.shape[1] == R.shape[2]
+    stacked = isinstance(kind, tuple)
+    if stacked:
+      # one observation per kind, of different sizes
+      assert len(kind) == len(z) == len(R) == len(extra_args)
+      z = [np.ascontiguousarray(z_i, dtype=np.float64).ravel() for z_i in z]
+      R = [np.ascontiguousarray(R_i, dtype=np.float64) for R_i in R]
+      extra_args = [np.asarray(ea, dtype=np.float64) for ea in extra_args]
+      for z_i, R_i in zip(z, R):
+        assert R_i.shape == (len(z_i), len(z_i))
+    else:
+      assert z.shape[0] == R.shape[0]
+      assert z.shape[1] == R.shape[1]
+      assert z.shape[1] == R.shape[2]
+
+      # these are from the user, so we canonicalize them once for the whole batch,
+      # this is a no-op when fast forwarding over checkpointed observations
+      z = np.ascontiguousarray(z, dtype=np.float64)
+      R = np.swapaxes(np.ascontiguousarray(np.swapaxes(R, 1, 2), dtype=np.float64), 1, 2)  # every R[i] in fortran order
+      if not isinstance(extra_args, np.ndarray):
+        try:
+          extra_args = np.array(extra_args, dtype=np.float64)
+        except ValueError:
+          # extra args of different lengths, canonicalized per observation
+          extra_args = [np.array(ea, dtype=np.float64) for ea in extra_args]
 
     # initialize time
     if self.filter_time is None:
@@ -507,16 +613,17 @@ class EKF_sym():
     xk_km1, Pk_km1 = np.copy(self.x).flatten(), np.copy(self.P)
 
     # update batch
-    y = []
-    for i in range(len(z)):
-      # these are from the user, so we canonicalize them
-      z_i = np.array(z[i], dtype=np.float64, order='F')
-      R_i = np.array(R[i], dtype=np.float64, order='F')
-      extra_args_i = np.array(extra_args[i], dtype=np.float64, order='F')
-      # update
-      self.x, self.P, y_i = self._update(self.x, self.P, kind, z_i, R_i, extra_args=extra_args_i)
+    if stacked:
+      self.x, self.P, y = self._update_batch_python(self.x, self.P, kind, z, R, extra_args)
       self.normalize_quaternions()
-      y.append(y_i)
+    else:
+      # the update writes the innovation into z, so it works on a copy
+      z_work = np.array(z)
+      y = []
+      for i in range(len(z)):
+        self.x, self.P, y_i = self._update(self.x, self.P, kind, z_work[i], R[i], extra_args=extra_args[i])
+        self.normalize_quaternions()
+        y.append(y_i)
     xk_k, Pk_k = np.copy(self.x).flatten(), np.copy(self.P)
 
     if augment:
@@ -598,11 +705,41 @@ class EKF_sym():
     if self.msckf and kind in self.maha_test_kinds:
       a = np.linalg.inv(H.dot(P).dot(H.T) + R)
       maha_dist = y.T.dot(a.dot(y))
-      if maha_dist > chi2_ppf(0.95, y.shape[0]):
+      if maha_dist > self.get_maha_thresh(0.95, y.shape[0]):
         R = 10e16 * R
 
     # *** same below this line ***
 
+    x_new, P = self._kalman_update(x, P, H, y, R)
+    return x_new, P, y.flatten()
+
+  def _update_batch_python(self, x, P, kinds, z, R, extra_args):
+    """Applies independent observations, of kind kinds[i] for z[i], in one stacked update.
+    The measurement noise of the stacked observation is block diagonal."""
+    rows = np.cumsum([0] + [len(z_i) for z_i in z])
+    h = np.zeros(rows[-1], dtype=np.float64)
+    H = np.zeros((rows[-1], self.dim_x), dtype=np.float64)
+    R_stacked = np.zeros((rows[-1], rows[-1]), dtype=np.float64)
+
+    # C functions
+    for i, kind in enumerate(kinds):
+      s = slice(rows[i], rows[i + 1])
+      self.hs[kind](x, extra_args[i], h[s])
+      self.Hs[kind](x, extra_args[i], H[s])
+      R_stacked[s, s] = R[i]
+
+    # y is the "loss"
+    y = np.concatenate(z) - h
+
+    # if using eskf
+    H_mod = np.zeros((x.shape[0], P.shape[0]), dtype=np.float64)
+    self.H_mod(x, H_mod)
+    H = H.dot(H_mod)
+
+    x_new, P = self._kalman_update(x, P, H, y.reshape((-1, 1)), R_stacked)
+    return x_new, P, [y[rows[i]:rows[i + 1]] for i in range(len(kinds))]
+
+  def _kalman_update(self, x, P, H, y, R):
     # Outlier resilient weighting as described in:
     # "A Kalman Filter for Robust Outlier Detection - Jo-Anne Ting, ..."
     weight = 1  # (1.5)/(1 + np.sum(y**2)/np.sum(R))
@@ -618,7 +755,7 @@ class EKF_sym():
     # inject observed error into state
     x_new = np.zeros(x.shape, dtype=np.float64)
     self.err_function(x, delta_x, x_new)
-    return x_new, P, y.flatten()
+    return x_new, P
 
   def maha_test(self, x, P, kind, z, R, extra_args=[], maha_thresh=0.95):  # pylint: disable=dangerous-default-value
     # init vars
@@ -640,7 +777,7 @@ class EKF_sym():
 
     a = np.linalg.inv(H.dot(P).dot(H.T) + R)
     maha_dist = y.T.dot(a.dot(y))
-    if maha_dist > chi2_ppf(maha_thresh, y.shape[0]):
+    if maha_dist > self.get_maha_thresh(maha_thresh, y.shape[0]):
       return False
     else:
       return True
@@ -652,36 +789,54 @@ class EKF_sym():
     If the kalman state is augmented with
     old states only the main state is smoothed
     '''
-    xk_n = estimates[-1][0]
-    Pk_n = estimates[-1][2]
-    Fk_1 = np.zeros(Pk_n.shape, dtype=np.float64)
-
-    states_smoothed = [xk_n]
-    covs_smoothed = [Pk_n]
-    for k in range(len(estimates) - 2, -1, -1):
-      xk1_n = xk_n
+    xk1 = np.stack([e[0] for e in estimates])
+    xk = np.stack([e[1] for e in estimates])
+    Pk1 = np.stack([e[2] for e in estimates])
+    Pk = np.stack([e[3] for e in estimates])
+    t = np.array([e[4] for e in estimates], dtype=np.float64)
+    return self.rts_smooth_arrays(xk1, xk, Pk1, Pk, t, norm_quats)
+
+  def rts_smooth_arrays(self, xk1, xk, Pk1, Pk, t, norm_quats=False):
+    '''
+    Same as rts_smooth, but on stacked estimates
+    xk1, xk     (vec [n, dim_x]): predicted and updated states
+    Pk1, Pk  (mat [n, dim_err, dim_err]): predicted and updated covariances
+    t               (vec [n]): estimate times
+    The smoother gains only depend on the filter estimates,
+    so they are solved for all steps at once.
+    '''
+    n = xk.shape[0]
+    d1 = self.dim_main
+    d2 = self.dim_main_err
+
+    states_smoothed = np.array(xk, dtype=np.float64)
+    covs_smoothed = np.array(Pk, dtype=np.float64)
+    states_smoothed[-1] = xk1[-1]
+    covs_smoothed[-1] = Pk1[-1]
+    if n < 2:
+      return states_smoothed, covs_smoothed
+
+    # Ck = (Pk1_k^-1 * Fk_1 * Pk_k^T)^T for every step
+    F = np.zeros((n - 1, self.dim_err, self.dim_err), dtype=np.float64)
+    for k in range(n - 1):
+      self.F(xk[k], t[k + 1] - t[k], F[k])
+    FP = np.matmul(F[:, :d2, :d2], np.swapaxes(Pk[:-1, :d2, :d2], 1, 2))
+    C = np.swapaxes(np.linalg.solve(Pk1[1:, :d2, :d2], FP), 1, 2)
+
+    delta_x = np.zeros((self.dim_err, 1), dtype=np.float64)
+    x_new = np.zeros((self.dim_x, 1), dtype=np.float64)
+    for k in range(n - 2, -1, -1):
+      xk1_n = states_smoothed[k + 1]
       if norm_quats:
         xk1_n[3:7] /= np.linalg.norm(xk1_n[3:7])
-      Pk1_n = Pk_n
-
-      xk1_k, _, Pk1_k, _, t2, _, _, _, _ = estimates[k + 1]
-      _, xk_k, _, Pk_k, t1, _, _, _, _ = estimates[k]
-      dt = t2 - t1
-      self.F(xk_k, dt, Fk_1)
-
-      d1 = self.dim_main
-      d2 = self.dim_main_err
-      Ck = np.linalg.solve(Pk1_k[:d2, :d2], Fk_1[:d2, :d2].dot(Pk_k[:d2, :d2].T)).T
-      xk_n = xk_k
-      delta_x = np.zeros((Pk_n.shape[0], 1), dtype=np.float64)
+      Ck = C[k]
+      # the last smoothed state is the last prediction itself
+      xk1_k = xk1_n if k == n - 2 else xk1[k + 1]
+
       self.inv_err_function(xk1_k, xk1_n, delta_x)
       delta_x[:d2] = Ck.dot(delta_x[:d2])
-      x_new = np.zeros((xk_n.shape[0], 1), dtype=np.float64)
-      self.err_function(xk_k, delta_x, x_new)
-      xk_n[:d1] = x_new[:d1, 0]
-      Pk_n = Pk_k
-      Pk_n[:d2, :d2] = Pk_k[:d2, :d2] + Ck.dot(Pk1_n[:d2, :d2] - Pk1_k[:d2, :d2]).dot(Ck.T)
-      states_smoothed.append(xk_n)
-      covs_smoothed.append(Pk_n)
-
-    return np.flipud(np.vstack(states_smoothed)), np.stack(covs_smoothed, 0)[::-1]
+      self.err_function(xk[k], delta_x, x_new)
+      states_smoothed[k, :d1] = x_new[:d1, 0]
+      covs_smoothed[k, :d2, :d2] = Pk[k, :d2, :d2] + Ck.dot(covs_smoothed[k + 1, :d2, :d2] - Pk1[k + 1, :d2, :d2]).dot(Ck.T)
+
+    return states_smoothed, covs_smoothed
@@ -62,6 +62,8 @@ cdef extern from "rednose/helpers/ekf_sym.h" namespace "EKFS":
     void predict(double t)
     optional[Estimate] predict_and_update_batch(double t, int kind, vector[MapVectorXd] z, vector[MapMatrixXdr] z,
         vector[vector[double]] extra_args, bool augment)
+    optional[Estimate] predict_and_update_multi(double t, vector[int] kinds, vector[MapVectorXd] z, vector[MapMatrixXdr] R,
+        vector[vector[double]] extra_args)
 
 # Functions like `numpy_to_matrix` are not possible, cython requires default
 # constructor for return variable types which aren't available with Eigen::Map
@@ -174,6 +176,42 @@ cdef class EKF_sym:
       extra_args,
     )
 
+  def predict_and_update_multi(self, double t, kinds, z, R, extra_args=None):
+    """Predicts to t once and applies observations of different kinds, one z and R per kind, in a single stacked update"""
+    if extra_args is None:
+      extra_args = [[] for _ in kinds]
+
+    # the maps point into these, so they're kept alive until the update is done
+    z_b = [np.ascontiguousarray(zi, dtype=np.double) for zi in z]
+    R_b = [np.ascontiguousarray(Ri, dtype=np.double) for Ri in R]
+
+    cdef vector[MapVectorXd] z_map
+    cdef np.ndarray[np.float64_t, ndim=1, mode='c'] zi_b
+    for zi_b in z_b:
+      z_map.push_back(MapVectorXd(<double*> zi_b.data, zi_b.shape[0]))
+
+    cdef vector[MapMatrixXdr] R_map
+    cdef np.ndarray[np.float64_t, ndim=2, mode='c'] Ri_b
+    for Ri_b in R_b:
+      R_map.push_back(MapMatrixXdr(<double*> Ri_b.data, Ri_b.shape[0], Ri_b.shape[1]))
+
+    cdef optional[Estimate] res = self.ekf.predict_and_update_multi(t, kinds, z_map, R_map, extra_args)
+    if not res.has_value():
+      return None
+
+    cdef VectorXd tmpvec
+    return (
+      vector_to_numpy(res.value().xk1),
+      vector_to_numpy(res.value().xk),
+      matrix_to_numpy(res.value().Pk1),
+      matrix_to_numpy(res.value().Pk),
+      res.value().t,
+      kinds,
+      [vector_to_numpy(tmpvec) for tmpvec in res.value().y],
+      z,
+      extra_args,
+    )
+
   def augment(self):
     raise NotImplementedError()  # TODO
 
@@ -49,3 +49,14 @@ class KalmanFilter:
       R = self.get_R(kind, len(data))
 
     self.filter.predict_and_update_batch(t, kind, data, R)
+
+  def predict_and_observe_multi(self, t, observations):
+    """Observations of different kinds at time t, as (kind, data, R) with R None for the default noise,
+    applied after a single predict in one stacked update"""
+    kinds, z, R = [], [], []
+    for kind, data, R_i in observations:
+      kinds.append(kind)
+      z.append(np.atleast_1d(data).astype(np.float64).ravel())
+      R.append(self.obs_noise[kind] if R_i is None else np.atleast_2d(R_i))
+
+    self.filter.predict_and_update_multi(t, kinds, z, R)
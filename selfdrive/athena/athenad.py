@@ -26,7 +26,7 @@ from websocket import (ABNF, WebSocketException, WebSocketTimeoutException,
 import cereal.messaging as messaging
 from cereal import log
 from cereal.services import service_list
-from common.api import Api
+from common.api import Api, get_session
 from common.basedir import PERSIST
 from common.file_helpers import CallbackReader
 from common.params import Params
@@ -233,10 +233,10 @@ def _do_upload(upload_item, callback=None):
     if callback:
       f = CallbackReader(f, callback, size)
 
-    return requests.put(upload_item.url,
-                        data=f,
-                        headers={**upload_item.headers, 'Content-Length': str(size)},
-                        timeout=30)
+    return get_session().put(upload_item.url,
+                             data=f,
+                             headers={**upload_item.headers, 'Content-Length': str(size)},
+                             timeout=30)
 
 
 # security: user should be able to request any message from their car
@@ -1,9 +1,10 @@
 import os
-from typing import Any, Dict, List
+from collections.abc import Mapping
+from typing import Any, Dict, List, Tuple
 
 from common.params import Params
 from common.basedir import BASEDIR
-from selfdrive.car.fingerprints import eliminate_incompatible_cars, all_legacy_fingerprint_cars
+from selfdrive.car.fingerprints import eliminate_incompatible_cars, all_legacy_fingerprint_cars, get_brand_names
 from selfdrive.car.vin import get_vin, VIN_UNKNOWN
 from selfdrive.car.fw_versions import get_fw_versions, match_fw_to_car
 from selfdrive.swaglog import cloudlog
@@ -56,12 +57,31 @@ def load_interfaces(brand_names):
   return ret
 
 
+class LazyInterfaces(Mapping):
+  """(CarInterface, CarController, CarState) by car model, a brand's modules are imported on first lookup"""
+  def __init__(self, brand_names: Dict[str, List[str]]):
+    self.brand_names = brand_names
+    self.brand_by_model = {model_name: brand_name for brand_name, model_names in brand_names.items() for model_name in model_names}
+    self.loaded: Dict[str, Tuple[Any, Any, Any]] = {}
+
+  def __getitem__(self, model_name: str) -> Tuple[Any, Any, Any]:
+    if model_name not in self.loaded:
+      brand_name = self.brand_by_model[model_name]
+      self.loaded.update(load_interfaces({brand_name: self.brand_names[brand_name]}))
+    return self.loaded[model_name]
+
+  def __iter__(self):
+    return iter(self.brand_by_model)
+
+  def __len__(self) -> int:
+    return len(self.brand_by_model)
+
+
 def get_interface_attr(attr: str) -> Dict[str, Any]:
   # returns given attribute from each interface
   brand_names = {}
-  for car_folder in sorted([x[0] for x in os.walk(BASEDIR + '/selfdrive/car')]):
+  for brand_name in get_brand_names():
     try:
-      brand_name = car_folder.split('/')[-1]
       attr_data = getattr(__import__(f'selfdrive.car.{brand_name}.values', fromlist=[attr]), attr, None)
       brand_names[brand_name] = attr_data
     except (ImportError, OSError):
@@ -79,9 +99,10 @@ def _get_interface_names() -> Dict[str, List[str]]:
   return brand_names
 
 
-# imports from directory selfdrive/car/<name>/
+# only values.py of each brand in selfdrive/car/<name>/ is imported here,
+# the interface of the fingerprinted car is imported when looked up
 interface_names = _get_interface_names()
-interfaces = load_interfaces(interface_names)
+interfaces = LazyInterfaces(interface_names)
 
 
 # **** for use live only ****
@@ -1,16 +1,25 @@
 import os
+from functools import lru_cache
+from typing import List
+
 from common.basedir import BASEDIR
 
 
+@lru_cache(maxsize=None)
+def get_brand_names() -> List[str]:
+  # brands are the folders in selfdrive/car with a values.py, subfolders are not brands
+  car_dir = os.path.join(BASEDIR, 'selfdrive/car')
+  return sorted(e.name for e in os.scandir(car_dir) if e.is_dir() and os.path.isfile(os.path.join(e.path, 'values.py')))
+
+
 def get_attr_from_cars(attr, result=dict, combine_brands=True):
   # read all the folders in selfdrive/car and return a dict where:
   # - keys are all the car models
   # - values are attr values from all car folders
   result = result()
 
-  for car_folder in [x[0] for x in os.walk(BASEDIR + '/selfdrive/car')]:
+  for car_name in get_brand_names():
     try:
-      car_name = car_folder.split('/')[-1]
       values = __import__(f'selfdrive.car.{car_name}.values', fromlist=[attr])
       if hasattr(values, attr):
         attr_values = getattr(values, attr)
@@ -1,16 +1,14 @@
 #!/usr/bin/env python3
 import struct
 import traceback
-from typing import Any, List
+from typing import Any, Dict, List, Set, Tuple
 from collections import defaultdict
 from dataclasses import dataclass
 
-from tqdm import tqdm
-
 import panda.python.uds as uds
 from cereal import car
 from selfdrive.car.fingerprints import FW_VERSIONS, get_attr_from_cars
-from selfdrive.car.isotp_parallel_query import IsoTpParallelQuery
+from selfdrive.car.isotp_parallel_query import IsoTpMultiQuery, IsoTpQuery
 from selfdrive.swaglog import cloudlog
 
 Ecu = car.CarParams.Ecu
@@ -184,11 +182,6 @@ REQUESTS: List[Request] = [
 ]
 
 
-def chunks(l, n=128):
-  for i in range(0, len(l), n):
-    yield l[i:i + n]
-
-
 def build_fw_dict(fw_versions):
   fw_versions_dict = {}
   for fw in fw_versions:
@@ -198,34 +191,64 @@ def build_fw_dict(fw_versions):
   return fw_versions_dict
 
 
-def match_fw_to_car_fuzzy(fw_versions_dict, log=True, exclude=None):
-  """Do a fuzzy FW match. This function will return a match, and the number of firmware version
-  that were matched uniquely to that specific car. If multiple ECUs uniquely match to different cars
-  the match is rejected."""
+# These ECUs are known to be shared between models (EPS only between hybrid/ICE version)
+# Getting this exactly right isn't crucial, but excluding camera and radar makes it almost
+# impossible to get 3 matching versions, even if two models with shared parts are released at the same
+# time and only one is in our database.
+FUZZY_EXCLUDE_ECUS = [Ecu.fwdCamera, Ecu.fwdRadar, Ecu.eps, Ecu.debug]
 
-  # These ECUs are known to be shared between models (EPS only between hybrid/ICE version)
-  # Getting this exactly right isn't crucial, but excluding camera and radar makes it almost
-  # impossible to get 3 matching versions, even if two models with shared parts are released at the same
-  # time and only one is in our database.
-  exclude_types = [Ecu.fwdCamera, Ecu.fwdRadar, Ecu.eps, Ecu.debug]
+# The FW version of these ECUs is required for an exact match
+ESSENTIAL_ECUS = [Ecu.engine, Ecu.eps, Ecu.esp, Ecu.fwdRadar, Ecu.fwdCamera, Ecu.vsa]
 
-  # Build lookup table from (addr, subaddr, fw) to list of candidate cars
-  all_fw_versions = defaultdict(list)
-  for candidate, fw_by_addr in FW_VERSIONS.items():
-    if candidate == exclude:
-      continue
 
-    for addr, fws in fw_by_addr.items():
-      if addr[0] in exclude_types:
+@dataclass
+class FwIndex:
+  candidates: Set[str]
+  # (ecu_type, addr, sub_addr) -> all cars with that ECU
+  candidates_by_ecu: Dict[Tuple, Set[str]]
+  # ((ecu_type, addr, sub_addr), version) -> cars that accept the version on that ECU
+  candidates_by_version: Dict[Tuple, Set[str]]
+  # (addr, sub_addr, version) -> cars with that version on a non shared ECU, used for fuzzy matching
+  fuzzy_candidates: Dict[Tuple, List[str]]
+
+
+def build_fw_index(fw_versions):
+  """Build the inverted index from ECU FW versions to candidate cars, so matching
+  is done with set operations instead of walking the whole database."""
+  candidates_by_ecu: Dict[Tuple, Set[str]] = defaultdict(set)
+  candidates_by_version: Dict[Tuple, Set[str]] = defaultdict(set)
+  fuzzy_candidates: Dict[Tuple, List[str]] = defaultdict(list)
+
+  for candidate, fw_by_addr in fw_versions.items():
+    for ecu, fws in fw_by_addr.items():
+      # Virtual debug ecu doesn't need to match the database
+      if ecu[0] == Ecu.debug:
         continue
+
+      candidates_by_ecu[ecu].add(candidate)
       for f in fws:
-        all_fw_versions[(addr[1], addr[2], f)].append(candidate)
+        candidates_by_version[(ecu, f)].add(candidate)
+        if ecu[0] not in FUZZY_EXCLUDE_ECUS:
+          fuzzy_candidates[(ecu[1], ecu[2], f)].append(candidate)
+
+  return FwIndex(set(fw_versions.keys()), dict(candidates_by_ecu), dict(candidates_by_version), dict(fuzzy_candidates))
+
+
+FW_INDEX = build_fw_index(FW_VERSIONS)
+
+
+def match_fw_to_car_fuzzy(fw_versions_dict, log=True, exclude=None, index=FW_INDEX):
+  """Do a fuzzy FW match. This function will return a match, and the number of firmware version
+  that were matched uniquely to that specific car. If multiple ECUs uniquely match to different cars
+  the match is rejected."""
 
   match_count = 0
   candidate = None
   for addr, version in fw_versions_dict.items():
     # All cars that have this FW response on the specified address
-    candidates = all_fw_versions[(addr[0], addr[1], version)]
+    candidates = index.fuzzy_candidates.get((addr[0], addr[1], version), [])
+    if exclude is not None:
+      candidates = [c for c in candidates if c != exclude]
 
     if len(candidates) == 1:
       match_count += 1
@@ -243,40 +266,23 @@ def match_fw_to_car_fuzzy(fw_versions_dict, log=True, exclude=None):
     return set()
 
 
-def match_fw_to_car_exact(fw_versions_dict):
+def match_fw_to_car_exact(fw_versions_dict, index=FW_INDEX):
   """Do an exact FW match. Returns all cars that match the given
   FW versions for a list of "essential" ECUs. If an ECU is not considered
   essential the FW version can be missing to get a fingerprint, but if it's present it
   needs to match the database."""
-  invalid = []
-  candidates = FW_VERSIONS
-
-  for candidate, fws in candidates.items():
-    for ecu, expected_versions in fws.items():
-      ecu_type = ecu[0]
-      addr = ecu[1:]
-      found_version = fw_versions_dict.get(addr, None)
-      ESSENTIAL_ECUS = [Ecu.engine, Ecu.eps, Ecu.esp, Ecu.fwdRadar, Ecu.fwdCamera, Ecu.vsa]
-      #if ecu_type == Ecu.esp and candidate in [TOYOTA.RAV4, TOYOTA.COROLLA, TOYOTA.HIGHLANDER] and found_version is None:
-      #  continue
-
-      # On some Toyota models, the engine can show on two different addresses
-      #if ecu_type == Ecu.engine and candidate in [TOYOTA.CAMRY, TOYOTA.COROLLA_TSS2, TOYOTA.CHR, TOYOTA.LEXUS_IS] and found_version is None:
-      #  continue
-
-      # Ignore non essential ecus
-      if ecu_type not in ESSENTIAL_ECUS and found_version is None:
-        continue
+  invalid: Set[str] = set()
 
-      # Virtual debug ecu doesn't need to match the database
-      if ecu_type == Ecu.debug:
-        continue
+  for ecu, candidates in index.candidates_by_ecu.items():
+    found_version = fw_versions_dict.get(ecu[1:], None)
 
-      if found_version not in expected_versions:
-        invalid.append(candidate)
-        break
+    # Ignore non essential ecus
+    if ecu[0] not in ESSENTIAL_ECUS and found_version is None:
+      continue
+
+    invalid |= candidates - index.candidates_by_version.get((ecu, found_version), set())
 
-  return set(candidates.keys()) - set(invalid)
+  return index.candidates - invalid
 
 
 def match_fw_to_car(fw_versions, allow_fuzzy=True):
@@ -322,19 +328,22 @@ def get_fw_versions(logcan, sendcan, extra=None, timeout=0.1, debug=False, progr
 
   addrs.insert(0, parallel_addrs)
 
+  # All requests to all ECUs are scheduled at once, requests to the same ECU run in this order
+  queries = []
+  for i, addr in enumerate(addrs):
+    for r in REQUESTS:
+      query_addrs = [(a, s) for (b, a, s) in addr if b in (r.brand, 'any')]
+      if query_addrs:
+        t = 2 * timeout if i == 0 else timeout
+        queries.append(IsoTpQuery(r.bus, query_addrs, r.request, r.response, r.rx_offset, t))
+
   fw_versions = {}
-  for i, addr in enumerate(tqdm(addrs, disable=not progress)):
-    for addr_chunk in chunks(addr):
-      for r in REQUESTS:
-        try:
-          addrs = [(a, s) for (b, a, s) in addr_chunk if b in (r.brand, 'any')]
-
-          if addrs:
-            query = IsoTpParallelQuery(sendcan, logcan, r.bus, addrs, r.request, r.response, r.rx_offset, debug=debug)
-            t = 2 * timeout if i == 0 else timeout
-            fw_versions.update(query.get_data(t))
-        except Exception:
-          cloudlog.warning(f"FW query exception: {traceback.format_exc()}")
+  try:
+    query = IsoTpMultiQuery(sendcan, logcan, queries, debug=debug)
+    for data in query.get_data(progress=progress):
+      fw_versions.update(data)
+  except Exception:
+    cloudlog.warning(f"FW query exception: {traceback.format_exc()}")
 
   # Build capnp list to put into CarParams
   car_fw = []
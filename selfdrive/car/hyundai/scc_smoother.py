@@ -144,9 +144,10 @@ class SccSmoother:
 
     self.active_cam = road_limit_speed > 0 and left_dist > 0
 
-    if road_speed_limiter.roadLimitSpeed is not None:
-      camSpeedFactor = clip(road_speed_limiter.roadLimitSpeed.camSpeedFactor, 1.0, 1.1)
-      self.over_speed_limit = road_speed_limiter.roadLimitSpeed.camLimitSpeedLeftDist > 0 and \
+    limit = road_speed_limiter.get_limit()
+    if limit is not None:
+      camSpeedFactor = clip(limit.cam_speed_factor, 1.0, 1.1)
+      self.over_speed_limit = limit.cam_limit_speed_left_dist > 0 and \
                               0 < road_limit_speed * camSpeedFactor < clu11_speed + 2
     else:
       self.over_speed_limit = False
@@ -1,7 +1,10 @@
 import time
 from collections import defaultdict
+from dataclasses import dataclass
 from functools import partial
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
+
+from tqdm import tqdm
 
 import cereal.messaging as messaging
 from selfdrive.swaglog import cloudlog
@@ -146,3 +149,179 @@ class IsoTpParallelQuery:
         break
 
     return results
+
+
+@dataclass
+class IsoTpQuery:
+  bus: int
+  addrs: List[Tuple[int, Optional[int]]]
+  request: List[bytes]
+  response: List[bytes]
+  response_offset: int = 0x8
+  timeout: float = 0.1
+
+
+class EcuQuery:
+  """State of one request sequence to a single ECU"""
+  def __init__(self, query_idx, query, addr):
+    self.query_idx = query_idx
+    self.bus = query.bus
+    self.addr = addr
+    self.rx_addr = get_rx_addr_for_tx_addr(addr[0], rx_offset=query.response_offset)
+    self.request = query.request
+    self.response = query.response
+    self.timeout = query.timeout
+
+    # an ECU handles one request at a time, and responses are only told apart by rx address
+    self.channels = (('tx', self.bus, addr[0]), ('rx', self.bus, self.rx_addr))
+    self.counter = 0
+    self.last_rx_time = 0.
+    self.msg: Optional[IsoTpMessage] = None
+
+
+class IsoTpMultiQuery:
+  """Runs many IsoTpQuery at once, over multiple buses.
+
+  Requests to the same ECU are sent one after another in query order, all other ECUs are queried
+  in parallel. Every ECU times out on its own, so the query is done as soon as every ECU has
+  either answered or timed out, instead of after the sum of all timeouts.
+  """
+  def __init__(self, sendcan, logcan, queries: List[IsoTpQuery], debug=False):
+    self.sendcan = sendcan
+    self.logcan = logcan
+    self.queries = queries
+    self.debug = debug
+
+    self.ecu_queries = [EcuQuery(i, q, a if isinstance(a, tuple) else (a, None))
+                        for i, q in enumerate(queries) for a in q.addrs]
+    # (bus, rx_addr) -> messages, only for ECUs with a request in flight
+    self.msg_buffer: Dict[Tuple[int, int], list] = {}
+
+  def rx(self):
+    """Drain can socket and sort messages for the active ECUs into buffers, without
+    reading the data of all other messages. Returns the updated buffers."""
+    updated = set()
+    for dat in messaging.drain_sock_raw(self.logcan, wait_for_one=True):
+      for msg in messaging.log_from_bytes(dat).can:
+        key = (msg.src, msg.address)
+        buf = self.msg_buffer.get(key)
+        if buf is not None:
+          buf.append((msg.address, msg.busTime, msg.dat, msg.src))
+          updated.add(key)
+    return updated
+
+  def _can_tx(self, tx_addr, dat, bus):
+    """Helper function to send single message"""
+    msg = [tx_addr, 0, dat, bus]
+    self.sendcan.send(can_list_to_can_capnp([msg], msgtype='sendcan'))
+
+  def _can_rx(self, ecu):
+    """Helper function to retrieve the messages of an ECU from its buffer"""
+    key = (ecu.bus, ecu.rx_addr)
+    msgs = self.msg_buffer[key]
+    if ecu.addr[1] is not None:
+      # Filter based on subadress, no other ECU on this address is active
+      msgs = [m for m in msgs if m[2][0] == ecu.addr[1]]
+    self.msg_buffer[key] = []
+
+    if len(msgs):
+      ecu.last_rx_time = time.monotonic()
+    return msgs
+
+  def _start(self, ecu):
+    self.msg_buffer[(ecu.bus, ecu.rx_addr)] = []
+    sub_addr = ecu.addr[1]
+    can_client = CanClient(self._can_tx, partial(self._can_rx, ecu), ecu.addr[0], ecu.rx_addr,
+                           ecu.bus, sub_addr=sub_addr, debug=self.debug)
+    max_len = 8 if sub_addr is None else 7
+    ecu.msg = IsoTpMessage(can_client, timeout=0, max_len=max_len, debug=self.debug)
+    ecu.msg.send(ecu.request[0])
+    ecu.last_rx_time = time.monotonic()
+
+  def _process(self, ecu, results):
+    """Handle the messages of an ECU. Returns True when the ECU is done, also when it failed."""
+    try:
+      return self._process_response(ecu, results)
+    except Exception:
+      cloudlog.exception(f"Error processing UDS response: {ecu.addr}")
+      return True
+
+  def _process_response(self, ecu, results):
+    dat: Optional[bytes] = ecu.msg.recv()
+    if not dat:
+      return False
+
+    expected_response = ecu.response[ecu.counter]
+    if dat[:len(expected_response)] != expected_response:
+      cloudlog.warning(f"iso-tp query bad response: 0x{dat.hex()}")
+      return True
+
+    if ecu.counter + 1 < len(ecu.request):
+      ecu.counter += 1
+      ecu.msg.send(ecu.request[ecu.counter])
+      ecu.last_rx_time = time.monotonic()
+      return False
+
+    results[ecu.query_idx][ecu.addr] = dat[len(expected_response):]
+    return True
+
+  def get_data(self, total_timeout=None, progress=False):
+    """Returns the responses of every query, as a list of {(addr, sub_addr): data}"""
+    if total_timeout is None:
+      # the time an ECU would need when every request times out after 10 responses
+      per_channel: Dict[Tuple, float] = defaultdict(float)
+      for ecu in self.ecu_queries:
+        per_channel[ecu.channels[0]] += 10 * ecu.timeout
+      total_timeout = max(per_channel.values(), default=0.)
+
+    messaging.drain_sock_raw(self.logcan)
+    self.msg_buffer = {}
+
+    results: List[Dict] = [{} for _ in self.queries]
+    pending = list(self.ecu_queries)
+    active: List[EcuQuery] = []
+    busy = set()
+
+    start_time = time.monotonic()
+    with tqdm(total=len(pending), disable=not progress) as pbar:
+      while True:
+        # start the next request of every idle ECU
+        for ecu in list(pending):
+          if busy.isdisjoint(ecu.channels):
+            pending.remove(ecu)
+            try:
+              self._start(ecu)
+            except Exception:
+              # the other ECUs are still queried
+              cloudlog.exception(f"Error sending UDS request: {ecu.addr}")
+              self.msg_buffer.pop((ecu.bus, ecu.rx_addr), None)
+              pbar.update(1)
+              continue
+            busy.update(ecu.channels)
+            active.append(ecu)
+
+        if not active:
+          break
+
+        if time.monotonic() - start_time > total_timeout:
+          cloudlog.warning("iso-tp query timeout while receiving data")
+          break
+
+        updated = self.rx()
+
+        done = []
+        for ecu in active:
+          if (ecu.bus, ecu.rx_addr) in updated and self._process(ecu, results):
+            done.append(ecu)
+          elif time.monotonic() - ecu.last_rx_time > ecu.timeout:
+            if ecu.counter > 0:
+              cloudlog.warning(f"iso-tp query timeout after receiving response: {ecu.addr}")
+            done.append(ecu)
+
+        for ecu in done:
+          active.remove(ecu)
+          busy.difference_update(ecu.channels)
+          del self.msg_buffer[(ecu.bus, ecu.rx_addr)]
+        pbar.update(len(done))
+
+    return results
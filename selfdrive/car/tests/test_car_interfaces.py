@@ -5,7 +5,7 @@ from parameterized import parameterized
 
 from cereal import car
 from selfdrive.car.fingerprints import all_known_cars
-from selfdrive.car.car_helpers import interfaces
+from selfdrive.car.car_helpers import LazyInterfaces, interface_names, interfaces
 from selfdrive.car.fingerprints import _FINGERPRINTS as FINGERPRINTS
 
 class TestCarInterfaces(unittest.TestCase):
@@ -67,5 +67,16 @@ class TestCarInterfaces(unittest.TestCase):
     if not car_params.radarOffCan and hasattr(radar_interface, '_update') and hasattr(radar_interface, 'trigger_msg'):
       radar_interface._update([radar_interface.trigger_msg])
 
+  def test_interfaces_imported_on_lookup(self):
+    lazy_interfaces = LazyInterfaces(interface_names)
+    self.assertEqual(set(lazy_interfaces), {c for model_names in interface_names.values() for c in model_names})
+    self.assertEqual(lazy_interfaces.loaded, {})
+
+    CarInterface, _, _ = lazy_interfaces["mock"]
+    self.assertEqual(CarInterface.__module__, "selfdrive.car.mock.interface")
+    self.assertEqual(set(lazy_interfaces.loaded), set(interface_names["mock"]))
+    with self.assertRaises(KeyError):
+      lazy_interfaces["UNKNOWN CAR"]
+
 if __name__ == "__main__":
   unittest.main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+import random
+import unittest
+from collections import defaultdict
+
+from cereal import car
+from selfdrive.car.fw_versions import ESSENTIAL_ECUS, FUZZY_EXCLUDE_ECUS, build_fw_index, \
+                                      match_fw_to_car, match_fw_to_car_exact, match_fw_to_car_fuzzy
+
+Ecu = car.CarParams.Ecu
+
+ECUS = [(Ecu.engine, 0x7e0, None), (Ecu.transmission, 0x7e1, None), (Ecu.esp, 0x7d1, None),
+        (Ecu.eps, 0x7d4, None), (Ecu.fwdRadar, 0x7d0, None), (Ecu.fwdCamera, 0x7c4, None),
+        (Ecu.debug, 0x7d2, None)]
+
+
+def synthetic_fw_versions(n_cars, rng, versions_per_ecu=4):
+  """FW database where some of the versions are shared between cars, like related models"""
+  fw_versions = {}
+  for i in range(n_cars):
+    car_versions = {}
+    for ecu in rng.sample(ECUS, k=rng.randint(4, len(ECUS))):
+      versions = [f'{ecu[1]:x}-{i}-{j}'.encode() for j in range(rng.randint(1, versions_per_ecu))]
+      if i > 0 and rng.random() < 0.3:
+        versions += fw_versions[f'CAR_{rng.randrange(i)}'].get(ecu, [])[:2]
+      car_versions[ecu] = versions
+    fw_versions[f'CAR_{i}'] = car_versions
+  return fw_versions
+
+
+def reference_exact(fw_versions_db, fw_versions_dict):
+  # walks every car and ECU, as done before the index
+  invalid = []
+  for candidate, fws in fw_versions_db.items():
+    for ecu, expected_versions in fws.items():
+      found_version = fw_versions_dict.get(ecu[1:], None)
+      if ecu[0] not in ESSENTIAL_ECUS and found_version is None:
+        continue
+      if ecu[0] == Ecu.debug:
+        continue
+      if found_version not in expected_versions:
+        invalid.append(candidate)
+        break
+  return set(fw_versions_db.keys()) - set(invalid)
+
+
+def reference_fuzzy(fw_versions_db, fw_versions_dict, exclude=None):
+  # rebuilds the lookup table on every call, as done before the index
+  all_fw_versions = defaultdict(list)
+  for candidate, fw_by_addr in fw_versions_db.items():
+    if candidate == exclude:
+      continue
+    for addr, fws in fw_by_addr.items():
+      if addr[0] in FUZZY_EXCLUDE_ECUS:
+        continue
+      for f in fws:
+        all_fw_versions[(addr[1], addr[2], f)].append(candidate)
+
+  match_count = 0
+  candidate = None
+  for addr, version in fw_versions_dict.items():
+    candidates = all_fw_versions[(addr[0], addr[1], version)]
+    if len(candidates) == 1:
+      match_count += 1
+      if candidate is None:
+        candidate = candidates[0]
+      elif candidate != candidates[0]:
+        return set()
+  return {candidate} if match_count >= 2 else set()
+
+
+def random_fw_dict(fw_versions_db, rng, max_cars=3):
+  """FW responses mixing versions from several cars, some ECUs missing and some unknown versions"""
+  cars = rng.sample(list(fw_versions_db.keys()), k=rng.randint(1, max_cars))
+  fw_versions_dict = {}
+  for c in cars:
+    for ecu, versions in fw_versions_db[c].items():
+      r = rng.random()
+      if r < 0.2:
+        continue
+      elif r < 0.3:
+        fw_versions_dict[ecu[1:]] = b'\xde\xad\xbe\xef'
+      else:
+        fw_versions_dict[ecu[1:]] = rng.choice(versions)
+  return fw_versions_dict
+
+
+FW_VERSIONS = synthetic_fw_versions(100, random.Random(0))
+FW_INDEX = build_fw_index(FW_VERSIONS)
+
+
+class TestFwFingerprint(unittest.TestCase):
+  def test_fw_fingerprint(self):
+    for car_model, ecus in FW_VERSIONS.items():
+      with self.subTest(car_model=car_model):
+        for _ in range(20):
+          fw_versions_dict = {ecu[1:]: random.choice(fw_versions) for ecu, fw_versions in ecus.items()}
+          self.assertIn(car_model, match_fw_to_car_exact(fw_versions_dict, index=FW_INDEX))
+
+  def test_matches_reference(self):
+    rng = random.Random(0)
+    for _ in range(500):
+      fw_versions_dict = random_fw_dict(FW_VERSIONS, rng)
+      self.assertEqual(match_fw_to_car_exact(fw_versions_dict, index=FW_INDEX), reference_exact(FW_VERSIONS, fw_versions_dict))
+
+      exclude = rng.choice([None, *FW_VERSIONS.keys()])
+      self.assertEqual(match_fw_to_car_fuzzy(fw_versions_dict, log=False, exclude=exclude, index=FW_INDEX),
+                       reference_fuzzy(FW_VERSIONS, fw_versions_dict, exclude=exclude))
+
+  def test_empty_response(self):
+    self.assertEqual(match_fw_to_car_fuzzy({}, log=False, index=FW_INDEX), set())
+    self.assertEqual(match_fw_to_car_exact({}, index=FW_INDEX), reference_exact(FW_VERSIONS, {}))
+    self.assertEqual(match_fw_to_car([]), (True, set()))
+
+  def test_index_skips_debug_ecus(self):
+    index = build_fw_index({'CAR': {(Ecu.debug, 0x7d0, None): [b'a'], (Ecu.engine, 0x7e0, None): [b'b']}})
+    self.assertEqual(set(index.candidates_by_ecu), {(Ecu.engine, 0x7e0, None)})
+    self.assertEqual(index.fuzzy_candidates, {(0x7e0, None, b'b'): ['CAR']})
+
+
+if __name__ == "__main__":
+  unittest.main()
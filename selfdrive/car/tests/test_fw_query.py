@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+import heapq
+import time
+import unittest
+from collections import defaultdict
+
+import cereal.messaging as messaging
+from cereal import car
+from selfdrive.boardd.boardd import can_list_to_can_capnp
+from selfdrive.car.fw_versions import HYUNDAI_VERSION_REQUEST_LONG, HYUNDAI_VERSION_RESPONSE, \
+                                      TESTER_PRESENT_REQUEST, TESTER_PRESENT_RESPONSE, UDS_VERSION_REQUEST, \
+                                      UDS_VERSION_RESPONSE, get_fw_versions
+from selfdrive.car.isotp_parallel_query import IsoTpMultiQuery, IsoTpQuery
+
+Ecu = car.CarParams.Ecu
+
+# rate of the can packets sent by boardd
+CAN_PACKET_DT = 0.01
+
+
+class SimEcu:
+  """ISO-TP ECU answering known requests with a fixed delay, silent on unknown requests"""
+  def __init__(self, bus, tx_addr, responses, rx_offset=0x8, sub_addr=None, delay=0.005):
+    self.bus = bus
+    self.tx_addr = tx_addr
+    self.rx_addr = tx_addr + rx_offset
+    self.responses = responses
+    self.sub_addr = sub_addr
+    self.delay = delay
+
+    self.requests = []
+    self.overlapping_requests = 0
+    self.pending_frames = []
+
+  def _frame(self, dat):
+    if self.sub_addr is not None:
+      dat = bytes([self.sub_addr]) + dat
+    return (self.rx_addr, dat.ljust(8, b'\x00'), self.bus)
+
+  def rx(self, addr, dat, bus):
+    """Handle a frame sent by the tester, returns the frames to send back"""
+    if bus != self.bus or addr != self.tx_addr:
+      return []
+    if self.sub_addr is not None:
+      if dat[0] != self.sub_addr:
+        return []
+      dat = dat[1:]
+
+    pci = dat[0] >> 4
+    if pci == 0x0:
+      if self.pending_frames:
+        self.overlapping_requests += 1
+      request = dat[1:1 + (dat[0] & 0xf)]
+      self.requests.append(request)
+      if request not in self.responses:
+        return []
+
+      response = self.responses[request]
+      max_len = 7 if self.sub_addr is None else 6
+      if len(response) <= max_len:
+        return [self._frame(bytes([len(response)]) + response)]
+
+      # first frame, the rest is sent after flow control
+      first, rest = response[:max_len - 1], response[max_len - 1:]
+      self.pending_frames = [self._frame(bytes([0x20 | ((i + 1) & 0xf)]) + rest[j:j + max_len])
+                             for i, j in enumerate(range(0, len(rest), max_len))]
+      return [self._frame(bytes([0x10 | (len(response) >> 8), len(response) & 0xff]) + first)]
+
+    if pci == 0x3:
+      frames, self.pending_frames = self.pending_frames, []
+      return frames
+    return []
+
+
+class FakeCan:
+  """sendcan and logcan socket pair connected to simulated ECUs, with unrelated bus traffic"""
+  def __init__(self, ecus, noise_msgs=50):
+    self.ecus = ecus
+    self.noise = [(0x100 + i, 0, b'\x00' * 8, i % 3) for i in range(noise_msgs)]
+    # responses on a queried address, but on another bus
+    self.noise += [(ecu.rx_addr, 0, b'\x03\x7f\x22\x31'.ljust(8, b'\x00'), ecu.bus + 1) for ecu in ecus]
+    self.queue = []
+    self.next_packet_time = time.monotonic()
+    self.sent = 0
+
+  def send(self, dat):
+    now = time.monotonic()
+    for msg in messaging.log_from_bytes(dat).sendcan:
+      self.sent += 1
+      for ecu in self.ecus:
+        for frame in ecu.rx(msg.address, bytes(msg.dat), msg.src):
+          heapq.heappush(self.queue, (now + ecu.delay, self.sent, frame))
+
+  def receive(self, non_blocking=False):
+    if not non_blocking:
+      # boardd sends a packet at a fixed rate, or earlier to deliver a response
+      wake_time = self.next_packet_time
+      if self.queue:
+        wake_time = min(wake_time, self.queue[0][0])
+      time.sleep(max(0., wake_time - time.monotonic()))
+
+    now = time.monotonic()
+    msgs = []
+    while self.queue and self.queue[0][0] <= now:
+      addr, dat, bus = heapq.heappop(self.queue)[2]
+      msgs.append([addr, 0, dat, bus])
+
+    if non_blocking and not msgs:
+      return None
+
+    self.next_packet_time = now + CAN_PACKET_DT
+    return can_list_to_can_capnp(self.noise + msgs)
+
+
+class FailingCan(FakeCan):
+  """FakeCan that fails to send the n-th frame to an address"""
+  def __init__(self, ecus, fail_frames):
+    super().__init__(ecus)
+    self.fail_frames = fail_frames
+    self.frames = defaultdict(int)
+
+  def send(self, dat):
+    for msg in messaging.log_from_bytes(dat).sendcan:
+      n = self.frames[msg.address]
+      self.frames[msg.address] += 1
+      if self.fail_frames.get(msg.address) == n:
+        raise OSError("send failed")
+    super().send(dat)
+
+
+VERSION_REQUEST = [TESTER_PRESENT_REQUEST, UDS_VERSION_REQUEST]
+VERSION_RESPONSE = [TESTER_PRESENT_RESPONSE, UDS_VERSION_RESPONSE]
+
+
+def version_ecu(bus, addr, version, **kwargs):
+  return SimEcu(bus, addr, {TESTER_PRESENT_REQUEST: TESTER_PRESENT_RESPONSE,
+                            UDS_VERSION_REQUEST: UDS_VERSION_RESPONSE + version}, **kwargs)
+
+
+class TestIsoTpMultiQuery(unittest.TestCase):
+  def test_multiple_buses(self):
+    ecus = [
+      version_ecu(1, 0x7e0, b'engine-version-multi-frame'),
+      version_ecu(1, 0x7d1, b'esp'),
+      version_ecu(1, 0x7d4, b'eps', delay=0.05),
+      version_ecu(0, 0x750, b'sub-addr-multi-frame', sub_addr=0xf),
+      version_ecu(0, 0x750, b'sub', sub_addr=0x6d),
+      version_ecu(0, 0x7c0, b'offset', rx_offset=0x6a),
+    ]
+    can = FakeCan(ecus)
+    queries = [
+      IsoTpQuery(1, [(0x7e0, None), (0x7d1, None), (0x7d4, None), (0x7e1, None)], VERSION_REQUEST, VERSION_RESPONSE),
+      IsoTpQuery(0, [(0x750, 0xf), (0x750, 0x6d), (0x750, 0x5d)], VERSION_REQUEST, VERSION_RESPONSE),
+      IsoTpQuery(0, [0x7c0], VERSION_REQUEST, VERSION_RESPONSE, response_offset=0x6a),
+    ]
+    results = IsoTpMultiQuery(can, can, queries).get_data()
+
+    self.assertEqual(results, [
+      {(0x7e0, None): b'engine-version-multi-frame', (0x7d1, None): b'esp', (0x7d4, None): b'eps'},
+      {(0x750, 0xf): b'sub-addr-multi-frame', (0x750, 0x6d): b'sub'},
+      {(0x7c0, None): b'offset'},
+    ])
+    for ecu in ecus:
+      self.assertEqual(ecu.requests, VERSION_REQUEST)
+      self.assertEqual(ecu.overlapping_requests, 0)
+
+  def test_missing_ecus_time_out_concurrently(self):
+    can = FakeCan([version_ecu(1, 0x7e0, b'engine')])
+    timeout = 0.1
+    queries = [IsoTpQuery(bus, [(addr, None) for addr in range(0x700, 0x7f0, 0x10)], [req], [resp], timeout=timeout)
+               for bus in (0, 1) for req, resp in zip(VERSION_REQUEST, VERSION_RESPONSE)]
+
+    start_time = time.monotonic()
+    results = IsoTpMultiQuery(can, can, queries).get_data()
+    elapsed = time.monotonic() - start_time
+
+    self.assertEqual(results[3], {(0x7e0, None): b'engine'})
+    # both requests to an ECU time out one after another, all ECUs time out at once
+    self.assertLess(elapsed, 2 * timeout + 0.1)
+    self.assertGreater(elapsed, 2 * timeout)
+
+  def test_requests_to_same_ecu_in_order(self):
+    responses = {UDS_VERSION_REQUEST: UDS_VERSION_RESPONSE + b'uds',
+                 HYUNDAI_VERSION_REQUEST_LONG: HYUNDAI_VERSION_RESPONSE + b'\xf1\x00long version'}
+    # a response with a shifted address could be mistaken for another ECU
+    ecus = [SimEcu(1, 0x7e0, responses), SimEcu(1, 0x7c8, responses, rx_offset=0x20)]
+    can = FakeCan(ecus)
+    queries = [
+      IsoTpQuery(1, [(0x7e0, None)], [UDS_VERSION_REQUEST], [UDS_VERSION_RESPONSE]),
+      IsoTpQuery(1, [(0x7e0, None)], [HYUNDAI_VERSION_REQUEST_LONG], [HYUNDAI_VERSION_RESPONSE]),
+      IsoTpQuery(1, [(0x7c8, None)], [UDS_VERSION_REQUEST], [UDS_VERSION_RESPONSE], response_offset=0x20),
+    ]
+    results = IsoTpMultiQuery(can, can, queries).get_data()
+
+    self.assertEqual(results, [{(0x7e0, None): b'uds'}, {(0x7e0, None): b'\xf1\x00long version'},
+                               {(0x7c8, None): b'uds'}])
+    self.assertEqual(ecus[0].requests, [UDS_VERSION_REQUEST, HYUNDAI_VERSION_REQUEST_LONG])
+    self.assertEqual(ecus[0].overlapping_requests, 0)
+
+  def test_bad_response(self):
+    can = FakeCan([SimEcu(1, 0x7e0, {TESTER_PRESENT_REQUEST: b'\x7f\x3e\x11'})])
+    results = IsoTpMultiQuery(can, can, [IsoTpQuery(1, [0x7e0], VERSION_REQUEST, VERSION_RESPONSE)]).get_data()
+    self.assertEqual(results, [{}])
+    self.assertEqual(can.ecus[0].requests, [TESTER_PRESENT_REQUEST])
+
+  def test_failing_ecu(self):
+    ecus = [version_ecu(1, addr, b'version') for addr in (0x7e0, 0x7d1, 0x7d4)]
+    # the first request to 0x7d1 and the second to 0x7d4 fail to send
+    can = FailingCan(ecus, {0x7d1: 0, 0x7d4: 1})
+    queries = [IsoTpQuery(1, [0x7e0, 0x7d1, 0x7d4], VERSION_REQUEST, VERSION_RESPONSE),
+               IsoTpQuery(1, [0x7d1], VERSION_REQUEST, VERSION_RESPONSE)]
+    results = IsoTpMultiQuery(can, can, queries).get_data()
+
+    self.assertEqual(results, [{(0x7e0, None): b'version'}, {(0x7d1, None): b'version'}])
+    self.assertEqual(ecus[2].requests, [TESTER_PRESENT_REQUEST])
+
+  def test_get_fw_versions(self):
+    ecu = SimEcu(1, 0x7e0, {HYUNDAI_VERSION_REQUEST_LONG: HYUNDAI_VERSION_RESPONSE + b'\xf1\x00engine version'})
+    can = FakeCan([ecu])
+    extra = {"hyundai": {"CAR": {(Ecu.engine, 0x7e0, None): []}}}
+    car_fw = get_fw_versions(can, can, extra=extra)
+
+    self.assertEqual(len(car_fw), 1)
+    self.assertEqual(car_fw[0].ecu, "engine")
+    self.assertEqual(car_fw[0].address, 0x7e0)
+    self.assertEqual(car_fw[0].fwVersion, b'\xf1\x00engine version')
+
+
+if __name__ == "__main__":
+  unittest.main()
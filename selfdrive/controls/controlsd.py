@@ -6,7 +6,7 @@ from numbers import Number
 from cereal import car, log
 from common.numpy_fast import clip, interp
 from common.realtime import sec_since_boot, config_realtime_process, Priority, Ratekeeper, DT_CTRL
-from common.profiler import Profiler
+from common.instrumentation import LoopStats
 from common.params import Params, put_nonblocking
 import cereal.messaging as messaging
 from common.conversions import Conversions as CV
@@ -214,8 +214,8 @@ class Controls:
       self.startup_event = None
 
     # controlsd is driven by can recv, expected at 100Hz
-    self.rk = Ratekeeper(100, print_delay_threshold=None)
-    self.prof = Profiler(False)  # off by default
+    self.stats = LoopStats("controlsd")
+    self.rk = Ratekeeper(100, print_delay_threshold=None, stats=self.stats)
 
   def update_events(self, CS):
     """Compute carEvents from carState"""
@@ -416,6 +416,9 @@ class Controls:
 
     # Update carState from CAN
     can_strs = messaging.drain_sock_raw(self.can_sock, wait_for_one=True)
+    # the wait for CAN is timed on its own, the other sections and total only time the work
+    self.stats.checkpoint("can_wait")
+    self.stats.start()
     CS = self.CI.update(self.CC, can_strs)
 
     self.sm.update(0)
@@ -842,38 +845,39 @@ class Controls:
 
   def step(self):
     start_time = sec_since_boot()
-    self.prof.checkpoint("Ratekeeper", ignore=True)
+    self.stats.start()
 
     # Sample data from sockets and get a carState
     CS = self.data_sample()
     cloudlog.timestamp("Data sampled")
-    self.prof.checkpoint("Sample")
+    self.stats.checkpoint("sample")
 
     self.update_events(CS)
     cloudlog.timestamp("Events updated")
+    self.stats.checkpoint("events")
 
     if not self.read_only and self.initialized:
       # Update control state
       self.state_transition(CS)
-      self.prof.checkpoint("State transition")
+      self.stats.checkpoint("state_transition")
 
     # Compute actuators (runs PID loops and lateral MPC)
     CC, lac_log = self.state_control(CS)
 
-    self.prof.checkpoint("State Control")
+    self.stats.checkpoint("state_control")
 
     # Publish data
     self.publish_logs(CS, start_time, CC, lac_log)
-    self.prof.checkpoint("Sent")
+    self.stats.checkpoint("publish")
 
     self.update_button_timers(CS.buttonEvents)
     self.CS_prev = CS
+    self.stats.end()
 
   def controlsd_thread(self):
     while True:
       self.step()
       self.rk.monitor_time()
-      self.prof.display()
 
 def main(sm=None, pm=None, logcan=None):
   controls = Controls(sm, pm, logcan)
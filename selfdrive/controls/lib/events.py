@@ -1,6 +1,7 @@
 import os
+from collections import defaultdict
 from enum import IntEnum
-from typing import Dict, Union, Callable, List, Optional
+from typing import Dict, Union, Callable, List, Optional, Set
 
 from cereal import log, car
 import cereal.messaging as messaging
@@ -41,13 +42,16 @@ class ET:
 
 # get event name from enum
 EVENT_NAME = {v: k for k, v in EventName.schema.enumerants.items()}
+EVENT_COUNT = max(EVENT_NAME) + 1
 
 
 class Events:
   def __init__(self):
     self.events: List[int] = []
     self.static_events: List[int] = []
-    self.events_prev = dict.fromkeys(EVENTS.keys(), 0)
+    # number of consecutive frames each event was active before this frame, indexed by event id
+    self.events_prev = [0] * EVENT_COUNT
+    self.counted_events: Set[int] = set()
 
   @property
   def names(self) -> List[int]:
@@ -62,22 +66,41 @@ class Events:
     self.events.append(event_name)
 
   def clear(self) -> None:
-    self.events_prev = {k: (v + 1 if k in self.events else 0) for k, v in self.events_prev.items()}
+    # only events active now or in the last frame have counters to update
+    active = set(self.events)
+    for e in self.counted_events - active:
+      self.events_prev[e] = 0
+    for e in active:
+      self.events_prev[e] += 1
+    self.counted_events = active
     self.events = self.static_events.copy()
 
+  def mask(self) -> int:
+    mask = 0
+    for e in self.events:
+      mask |= 1 << e
+    return mask
+
   def any(self, event_type: str) -> bool:
-    return any(event_type in EVENTS.get(e, {}) for e in self.events)
+    return bool(self.mask() & EVENT_TYPE_MASKS.get(event_type, 0))
 
   def create_alerts(self, event_types: List[str], callback_args=None):
     if callback_args is None:
       callback_args = []
 
+    types_mask = 0
+    for et in event_types:
+      types_mask |= EVENT_TYPE_MASKS.get(et, 0)
+
     ret = []
     for e in self.events:
-      types = EVENTS[e].keys()
+      if not types_mask & (1 << e):
+        continue
+
+      alerts = EVENTS[e]
       for et in event_types:
-        if et in types:
-          alert = EVENTS[e][et]
+        if et in alerts:
+          alert = alerts[et]
           if not isinstance(alert, Alert):
             alert = alert(*callback_args)
 
@@ -890,3 +913,15 @@ EVENTS: Dict[int, Dict[str, Union[Alert, AlertCallbackType]]] = {
   },
 
 }
+
+
+def get_event_type_masks() -> Dict[str, int]:
+  # bitmask of the events with an alert of each event type, bit n is event id n
+  masks: Dict[str, int] = defaultdict(int)
+  for event_name, alerts in EVENTS.items():
+    for et in alerts:
+      masks[et] |= 1 << event_name
+  return dict(masks)
+
+
+EVENT_TYPE_MASKS = get_event_type_masks()
@@ -1,5 +1,6 @@
 import numpy as np
 from cereal import log
+from common.capnp_helpers import copy_list, copy_lists
 from common.filter_simple import FirstOrderFilter
 from common.numpy_fast import interp, clip, mean
 from common.realtime import DT_MDL
@@ -30,6 +31,7 @@ class LanePlanner:
     self.ll_x = np.zeros((TRAJECTORY_SIZE,))
     self.lll_y = np.zeros((TRAJECTORY_SIZE,))
     self.rll_y = np.zeros((TRAJECTORY_SIZE,))
+    self.lane_line_ts = np.zeros((TRAJECTORY_SIZE, 2))
     self.lane_width_estimate = FirstOrderFilter(3.7, 9.95, DT_MDL)
     self.lane_width_certainty = FirstOrderFilter(1.0, 0.95, DT_MDL)
     self.lane_width = 3.7
@@ -55,13 +57,17 @@ class LanePlanner:
   def parse_model(self, md):
     lane_lines = md.laneLines
     if len(lane_lines) == 4 and len(lane_lines[0].t) == TRAJECTORY_SIZE:
-      self.ll_t = (np.array(lane_lines[1].t) + np.array(lane_lines[2].t))/2
+      if copy_lists(self.lane_line_ts, (lane_lines[1].t, lane_lines[2].t)):
+        np.add(self.lane_line_ts[:, 0], self.lane_line_ts[:, 1], out=self.ll_t)
+        self.ll_t /= 2
       # left and right ll x is the same
-      self.ll_x = lane_lines[1].x
+      copy_list(self.ll_x, lane_lines[1].x)
       # only offset left and right lane lines; offsetting path does not make sense
 
-      self.lll_y = np.array(lane_lines[1].y) + self.camera_offset
-      self.rll_y = np.array(lane_lines[2].y) + self.camera_offset
+      if copy_list(self.lll_y, lane_lines[1].y):
+        self.lll_y += self.camera_offset
+      if copy_list(self.rll_y, lane_lines[2].y):
+        self.rll_y += self.camera_offset
       self.lll_prob = md.laneLineProbs[1]
       self.rll_prob = md.laneLineProbs[2]
       self.lll_std = md.laneLineStds[1]
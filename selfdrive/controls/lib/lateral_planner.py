@@ -1,4 +1,5 @@
 import numpy as np
+from common.capnp_helpers import copy_list, copy_xyz
 from common.realtime import sec_since_boot, DT_MDL
 from common.numpy_fast import interp
 from selfdrive.ntune import ntune_common_get
@@ -23,7 +24,7 @@ class LateralPlanner:
     self.path_xyz = np.zeros((TRAJECTORY_SIZE, 3))
     self.path_xyz_stds = np.ones((TRAJECTORY_SIZE, 3))
     self.plan_yaw = np.zeros((TRAJECTORY_SIZE,))
-    self.t_idxs = np.arange(TRAJECTORY_SIZE)
+    self.t_idxs = np.arange(TRAJECTORY_SIZE, dtype=np.float64)
     self.y_pts = np.zeros(TRAJECTORY_SIZE)
 
     self.lat_mpc = LateralMpc()
@@ -40,12 +41,12 @@ class LateralPlanner:
     # Parse model predictions
     md = sm['modelV2']
     self.LP.parse_model(md)
-    if len(md.position.x) == TRAJECTORY_SIZE and len(md.orientation.x) == TRAJECTORY_SIZE:
-      self.path_xyz = np.column_stack([md.position.x, md.position.y, md.position.z])
-      self.t_idxs = np.array(md.position.t)
-      self.plan_yaw = list(md.orientation.z)
-    if len(md.position.xStd) == TRAJECTORY_SIZE:
-      self.path_xyz_stds = np.column_stack([md.position.xStd, md.position.yStd, md.position.zStd])
+    position, orientation = md.position, md.orientation
+    if len(position.x) == TRAJECTORY_SIZE and len(orientation.x) == TRAJECTORY_SIZE:
+      copy_xyz(self.path_xyz, position)
+      copy_list(self.t_idxs, position.t)
+      copy_list(self.plan_yaw, orientation.z)
+    copy_xyz(self.path_xyz_stds, position, std=True)
 
     # Lane change logic
     lane_change_prob = self.LP.l_lane_change_prob + self.LP.r_lane_change_prob
@@ -2,7 +2,7 @@
 import os
 import numpy as np
 
-from common.realtime import sec_since_boot
+from common.realtime import sec_since_boot, DT_MDL
 from common.numpy_fast import clip, interp
 from selfdrive.swaglog import cloudlog
 from selfdrive.modeld.constants import index_function
@@ -231,14 +231,52 @@ class LongitudinalMpc:
     self.status = False
     self.crash_cnt = 0.0
     self.solution_status = 0
+    # last converged solution, used to warm start after a failed solve
+    self.x_warm = np.zeros((N+1, X_DIM))
+    self.u_warm = np.zeros((N,1))
+    self.warm_start_valid = False
+    self.reset_cnt = 0
     # timers
     self.solve_time = 0.0
     self.time_qp_solution = 0.0
     self.time_linearization = 0.0
     self.time_integrator = 0.0
+    self.run_time = 0.0
     self.x0 = np.zeros(X_DIM)
     self.set_weights()
 
+  def reset_solution(self):
+    """Reset the solver iterate after a failed solve, keeping weights and parameters.
+
+    The last converged solution is shifted forward by one model step and used as the
+    initial guess. If the warm started solve fails as well, fall back to a zero trajectory.
+    """
+    self.solver.reset()
+    self.reset_cnt += 1
+    if self.warm_start_valid:
+      t_shifted = T_IDXS + DT_MDL
+      for j in range(X_DIM):
+        self.x_sol[:,j] = np.interp(t_shifted, T_IDXS, self.x_warm[:,j])
+      self.u_sol[:,0] = np.interp(t_shifted[:-1], T_IDXS[:-1], self.u_warm[:,0])
+      # position is relative to the current ego position
+      self.x_sol[:,0] -= self.x_sol[0,0]
+      self.x_sol[0,1:] = self.x0[1:]
+      # only try to warm start once per converged solution
+      self.warm_start_valid = False
+    else:
+      self.x_sol[:] = 0.0
+      self.u_sol[:] = 0.0
+
+    for i in range(N+1):
+      self.solver.set(i, 'x', self.x_sol[i])
+    for i in range(N):
+      self.solver.set(i, 'u', self.u_sol[i])
+
+    self.v_solution = self.x_sol[:,1]
+    self.a_solution = self.x_sol[:,2]
+    self.j_solution = self.u_sol[:,0]
+    self.prev_a = np.interp(T_IDXS + 0.05, T_IDXS, self.a_solution)
+
   def set_weights(self, prev_accel_constraint=True):
     if self.e2e:
       self.set_weights_for_xva_policy()
@@ -381,8 +419,7 @@ class LongitudinalMpc:
     self.run()
 
   def run(self):
-    # t0 = sec_since_boot()
-    # reset = 0
+    t0 = sec_since_boot()
     for i in range(N+1):
       self.solver.set(i, 'p', self.params[i])
     self.solver.constraints_set(0, "lbx", self.x0)
@@ -395,7 +432,6 @@ class LongitudinalMpc:
     self.time_integrator = float(self.solver.get_stats('time_sim')[0])
 
     # qp_iter = self.solver.get_stats('statistics')[-1][-1] # SQP_RTI specific
-    # print(f"long_mpc timings: tot {self.solve_time:.2e}, qp {self.time_qp_solution:.2e}, lin {self.time_linearization:.2e}, integrator {self.time_integrator:.2e}, qp_iter {qp_iter}")
     # res = self.solver.get_residuals()
     # print(f"long_mpc residuals: {res[0]:.2e}, {res[1]:.2e}, {res[2]:.2e}, {res[3]:.2e}")
     # self.solver.print_statistics()
@@ -415,10 +451,14 @@ class LongitudinalMpc:
     if self.solution_status != 0:
       if t > self.last_cloudlog_t + 5.0:
         self.last_cloudlog_t = t
-        cloudlog.warning(f"Long mpc reset, solution_status: {self.solution_status}")
-      self.reset()
-      # reset = 1
-    # print(f"long_mpc timings: total internal {self.solve_time:.2e}, external: {(sec_since_boot() - t0):.2e} qp {self.time_qp_solution:.2e}, lin {self.time_linearization:.2e} qp_iter {qp_iter}, reset {reset}")
+        cloudlog.warning(f"Long mpc reset, solution_status: {self.solution_status}, warm start: {self.warm_start_valid}")
+      self.reset_solution()
+    else:
+      self.x_warm[:] = self.x_sol
+      self.u_warm[:] = self.u_sol
+      self.warm_start_valid = True
+
+    self.run_time = sec_since_boot() - t0
 
 
 if __name__ == "__main__":
@@ -13,6 +13,7 @@ from selfdrive.controls.lib.longitudinal_mpc_lib.long_mpc import LongitudinalMpc
 from selfdrive.controls.lib.longitudinal_mpc_lib.long_mpc import T_IDXS as T_IDXS_MPC
 from selfdrive.controls.lib.drive_helpers import V_CRUISE_MAX, CONTROL_N
 from selfdrive.swaglog import cloudlog
+from selfdrive.statsd import statlog
 from common.params import Params
 
 LON_MPC_STEP = 0.2  # first step is 0.2s
@@ -140,4 +141,10 @@ class Planner:
 
     longitudinalPlan.solverExecutionTime = self.mpc.solve_time
 
+    # per-solve timings, aggregated into percentiles by statsd
+    statlog.sample("long_mpc_solve_time", self.mpc.solve_time)
+    statlog.sample("long_mpc_qp_time", self.mpc.time_qp_solution)
+    statlog.sample("long_mpc_run_time", self.mpc.run_time)
+    statlog.gauge("long_mpc_reset_count", self.mpc.reset_cnt)
+
     pm.send('longitudinalPlan', plan_send)
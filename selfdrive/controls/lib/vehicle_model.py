@@ -11,11 +11,13 @@ The system is defined by
 x_dot = A*x + B*u
 
 A depends on longitudinal speed, u [m/s], and vehicle parameters CP
+
+The curvature functions and steady_state_sols also take numpy arrays, to
+evaluate many speeds and angles at once.
 """
-from typing import Tuple
+from typing import Optional, Tuple
 
 import numpy as np
-from numpy.linalg import solve
 
 from cereal import car
 
@@ -38,14 +40,28 @@ class VehicleModel:
 
     self.cF_orig = CP.tireStiffnessFront
     self.cR_orig = CP.tireStiffnessRear
+    self.params: Optional[Tuple[float, float]] = None
     self.update_params(1.0, CP.steerRatio)
 
   def update_params(self, stiffness_factor: float, steer_ratio: float) -> None:
     """Update the vehicle model with a new stiffness factor and steer ratio"""
+    # called every control cycle, the parameters only change when paramsd updates them
+    if (stiffness_factor, steer_ratio) == self.params:
+      return
+    self.params = (stiffness_factor, steer_ratio)
+
     self.cF = stiffness_factor * self.cF_orig
     self.cR = stiffness_factor * self.cR_orig
     self.sR = steer_ratio
 
+    # the parts of the model that don't depend on the speed
+    self.sf = calc_slip_factor(self)
+    # A * u without the -u term, and the steering column of B, see create_dyn_state_matrices
+    self.A_u = (-(self.cF + self.cR) / self.m, -(self.cF * self.aF - self.cR * self.aR) / self.m,
+                -(self.cF * self.aF - self.cR * self.aR) / self.j, -(self.cF * self.aF**2 + self.cR * self.aR**2) / self.j)
+    self.B_sa = ((self.cF + self.chi * self.cR) / self.m / self.sR,
+                 (self.cF * self.aF - self.chi * self.cR * self.aR) / self.j / self.sR)
+
   def steady_state_sol(self, sa: float, u: float, roll: float) -> np.ndarray:
     """Returns the steady state solution.
 
@@ -65,6 +81,22 @@ class VehicleModel:
     else:
       return kin_ss_sol(sa, u, self)
 
+  def steady_state_sols(self, sa: np.ndarray, u: np.ndarray, roll: np.ndarray) -> np.ndarray:
+    """Returns the steady state solutions for arrays of inputs, see steady_state_sol.
+
+    Returns:
+      Nx2 matrix with the steady state solutions (lateral speed, rotational speed)
+    """
+    sa, u, roll = np.broadcast_arrays(np.asarray(sa, dtype=np.float64), np.asarray(u, dtype=np.float64),
+                                      np.asarray(roll, dtype=np.float64))
+    dyn = u > 0.1
+    sol = np.empty(u.shape + (2,))
+    sol[dyn] = np.stack(solve_dyn_ss(sa[dyn], u[dyn], roll[dyn], self), axis=-1)
+    kin = ~dyn
+    sol[kin, 0] = self.aR / self.sR / self.l * u[kin] * sa[kin]
+    sol[kin, 1] = 1. / self.sR / self.l * u[kin] * sa[kin]
+    return sol
+
   def calc_curvature(self, sa: float, u: float, roll: float) -> float:
     """Returns the curvature. Multiplied by the speed this will give the yaw rate.
 
@@ -88,8 +120,7 @@ class VehicleModel:
     Returns:
       Curvature factor [1/m]
     """
-    sf = calc_slip_factor(self)
-    return (1. - self.chi) / (1. - sf * u**2) / self.l
+    return (1. - self.chi) / (1. - self.sf * u**2) / self.l
 
   def get_steer_from_curvature(self, curv: float, u: float, roll: float) -> float:
     """Calculates the required steering wheel angle for a given curvature
@@ -115,12 +146,10 @@ class VehicleModel:
     Returns:
       Roll compensation curvature [rad]
     """
-    sf = calc_slip_factor(self)
-
-    if abs(sf) < 1e-6:
+    if abs(self.sf) < 1e-6:
       return 0
     else:
-      return (ACCELERATION_DUE_TO_GRAVITY * roll) / ((1 / sf) - u**2)
+      return (ACCELERATION_DUE_TO_GRAVITY * roll) / ((1 / self.sf) - u**2)
 
   def get_steer_from_yaw_rate(self, yaw_rate: float, u: float, roll: float) -> float:
     """Calculates the required steering wheel angle for a given yaw_rate
@@ -219,9 +248,26 @@ def dyn_ss_sol(sa: float, u: float, roll: float, VM: VehicleModel) -> np.ndarray
   Returns:
     2x1 matrix with steady state solution
   """
-  A, B = create_dyn_state_matrices(u, VM)
-  inp = np.array([[sa], [roll]])
-  return -solve(A, B) @ inp
+  x0, x1 = solve_dyn_ss(sa, u, roll, VM)
+  return np.array([[x0], [x1]])
+
+
+def solve_dyn_ss(sa, u, roll, VM: VehicleModel):
+  """Solves Ax = -Bu in closed form, for scalars or arrays of inputs
+
+  Returns:
+    lateral speed and rotational speed
+  """
+  A_u = VM.A_u
+  a00, a01, a10, a11 = A_u[0] / u, A_u[1] / u - u, A_u[2] / u, A_u[3] / u
+
+  # roll only acts on the lateral speed
+  b0, b1 = VM.B_sa
+  r0 = ACCELERATION_DUE_TO_GRAVITY * roll - b0 * sa
+  r1 = -b1 * sa
+
+  det = a00 * a11 - a01 * a10
+  return (a11 * r0 - a01 * r1) / det, (a00 * r1 - a10 * r0) / det
 
 
 def calc_slip_factor(VM):
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 from cereal import car
+from common.instrumentation import LoopStats
 from common.params import Params
 from common.realtime import Priority, config_realtime_process
 from selfdrive.swaglog import cloudlog
@@ -32,14 +33,22 @@ def plannerd_thread(sm=None, pm=None):
   if pm is None:
     pm = messaging.PubMaster(['longitudinalPlan', 'lateralPlan'])
 
+  stats = LoopStats("plannerd")
+
   while True:
     sm.update()
 
     if sm.updated['modelV2']:
+      stats.start()
       lateral_planner.update(sm)
+      stats.checkpoint("lateral_update")
       lateral_planner.publish(sm, pm)
+      stats.checkpoint("lateral_publish")
       longitudinal_planner.update(sm)
+      stats.checkpoint("longitudinal_update")
       longitudinal_planner.publish(sm, pm)
+      stats.checkpoint("longitudinal_publish")
+      stats.end()
 
 
 def main(sm=None, pm=None):
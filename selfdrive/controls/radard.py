@@ -7,6 +7,7 @@ import cereal.messaging as messaging
 from cereal import car
 from common.numpy_fast import interp
 from common.params import Params
+from common.instrumentation import LoopStats
 from common.realtime import Ratekeeper, Priority, config_realtime_process
 from selfdrive.controls.lib.cluster.fastcluster_py import cluster_points_centroid
 from selfdrive.controls.lib.radar_helpers import Cluster, Track, RADAR_TO_CAMERA
@@ -201,7 +202,8 @@ def radard_thread(sm=None, pm=None, can_sock=None):
 
   RI = RadarInterface(CP)
 
-  rk = Ratekeeper(1.0 / CP.radarTimeStep, print_delay_threshold=None)
+  stats = LoopStats("radard")
+  rk = Ratekeeper(1.0 / CP.radarTimeStep, print_delay_threshold=None, stats=stats)
   RD = RadarD(CP.radarTimeStep, RI.delay)
 
   # TODO: always log leads once we can hide them conditionally
@@ -209,7 +211,9 @@ def radard_thread(sm=None, pm=None, can_sock=None):
 
   while 1:
     can_strings = messaging.drain_sock_raw(can_sock, wait_for_one=True)
+    stats.start()
     rr = RI.update(can_strings)
+    stats.checkpoint("radar_interface")
 
     if rr is None:
       continue
@@ -218,6 +222,7 @@ def radard_thread(sm=None, pm=None, can_sock=None):
 
     dat = RD.update(sm, rr, enable_lead)
     dat.radarState.cumLagMs = -rk.remaining*1000.
+    stats.checkpoint("update")
 
     pm.send('radarState', dat)
 
@@ -233,6 +238,8 @@ def radard_thread(sm=None, pm=None, can_sock=None):
         "vRel": float(tracks[ids].vRel),
       }
     pm.send('liveTracks', dat)
+    stats.checkpoint("publish")
+    stats.end()
 
     rk.monitor_time()
 
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+import random
+import unittest
+
+from cereal import car
+from common.realtime import DT_CTRL
+from selfdrive.controls.lib.events import ET, EVENTS, EVENT_NAME, Alert, Events
+
+EventName = car.CarEvent.EventName
+
+EVENT_TYPES = [v for k, v in vars(ET).items() if not k.startswith('_')]
+# events without alert callbacks, callbacks need a SubMaster
+STATIC_ALERT_EVENTS = [e for e, alerts in EVENTS.items() if all(isinstance(a, Alert) for a in alerts.values())]
+DELAYED_ALERT_EVENTS = [e for e in STATIC_ALERT_EVENTS if any(a.creation_delay > 0 for a in EVENTS[e].values())]
+
+
+class ReferenceEvents:
+  """Events as implemented before the bitmasks"""
+  def __init__(self):
+    self.events = []
+    self.static_events = []
+    self.events_prev = dict.fromkeys(EVENTS.keys(), 0)
+
+  def add(self, event_name, static=False):
+    if static:
+      self.static_events.append(event_name)
+    self.events.append(event_name)
+
+  def clear(self):
+    self.events_prev = {k: (v + 1 if k in self.events else 0) for k, v in self.events_prev.items()}
+    self.events = self.static_events.copy()
+
+  def any(self, event_type):
+    return any(event_type in EVENTS.get(e, {}) for e in self.events)
+
+  def create_alerts(self, event_types):
+    ret = []
+    for e in self.events:
+      for et in event_types:
+        if et in EVENTS[e]:
+          alert = EVENTS[e][et]
+          if DT_CTRL * (self.events_prev[e] + 1) >= alert.creation_delay:
+            ret.append(f"{EVENT_NAME[e]}/{et}")
+    return ret
+
+
+class TestEvents(unittest.TestCase):
+  def test_matches_reference(self):
+    rng = random.Random(0)
+    events, ref = Events(), ReferenceEvents()
+    created = set()
+    for frame in range(2000):
+      # events with a creation delay stay active for a while, so the delay is reached sometimes
+      persistent = DELAYED_ALERT_EVENTS if rng.random() < 0.99 else []
+      for e in persistent + rng.sample(STATIC_ALERT_EVENTS, k=rng.randint(0, 2)):
+        static = rng.random() < 0.001
+        events.add(e, static=static)
+        ref.add(e, static=static)
+
+      self.assertEqual(events.names, ref.events)
+      for et in EVENT_TYPES:
+        self.assertEqual(events.any(et), ref.any(et), f"frame {frame}: {et}")
+
+      event_types = rng.sample(EVENT_TYPES, k=rng.randint(1, 3))
+      alerts = [a.alert_type for a in events.create_alerts(event_types)]
+      self.assertEqual(alerts, ref.create_alerts(event_types))
+      created.update(alerts)
+
+      events.clear()
+      ref.clear()
+      for e in EVENTS:
+        self.assertEqual(events.events_prev[e], ref.events_prev[e])
+
+    delayed_alerts = {f"{EVENT_NAME[e]}/{et}" for e in DELAYED_ALERT_EVENTS for et, a in EVENTS[e].items() if a.creation_delay > 0}
+    self.assertTrue(created & delayed_alerts)
+
+  def test_any_unknown_event(self):
+    events = Events()
+    self.assertFalse(events.any(ET.ENABLE))
+    events.add(EventName.buttonEnable)
+    self.assertTrue(events.any(ET.ENABLE))
+    self.assertFalse(events.any(ET.IMMEDIATE_DISABLE))
+    self.assertFalse(events.any('unknownType'))
+
+  def test_msg_round_trip(self):
+    events = Events()
+    for e in [EventName.buttonEnable, EventName.doorOpen, EventName.pcmDisable]:
+      events.add(e)
+    msg = events.to_msg()
+    self.assertTrue(msg[0].enable)
+    self.assertTrue(msg[1].noEntry)
+
+    received = Events()
+    received.add_from_msg(msg)
+    self.assertEqual(received.names, events.names)
+    self.assertEqual(received.any(ET.USER_DISABLE), events.any(ET.USER_DISABLE))
+
+
+if __name__ == "__main__":
+  unittest.main()
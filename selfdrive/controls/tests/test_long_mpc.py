@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from cereal import car, log
+from common.realtime import DT_MDL
+from selfdrive.car.hyundai.interface import CarInterface
+from selfdrive.car.hyundai.values import CAR
+from selfdrive.controls.lib.longitudinal_mpc_lib.long_mpc import LongitudinalMpc, N, T_IDXS, X_DIM
+from selfdrive.controls.lib.longitudinal_planner import Planner
+
+
+class FailingSolver:
+  """Solver that reports a failed solve while fail is set"""
+  def __init__(self, solver):
+    self.solver = solver
+    self.fail = False
+
+  def solve(self):
+    status = self.solver.solve()
+    return 4 if self.fail else status
+
+  def __getattr__(self, name):
+    return getattr(self.solver, name)
+
+
+def run_mpc(mpc, steps=1):
+  carstate = car.CarState.new_message(vEgo=20., cruiseGap=2)
+  radarstate = log.RadarState.new_message()
+  mpc.set_accel_limits(-1.2, 1.2)
+  mpc.set_cur_state(20., 0.)
+  for _ in range(steps):
+    mpc.update(carstate, radarstate, 25.)
+
+
+class TestLongitudinalMpc(unittest.TestCase):
+  def setUp(self):
+    self.mpc = LongitudinalMpc()
+    self.mpc.solver = FailingSolver(self.mpc.solver)
+    run_mpc(self.mpc, 10)
+    self.assertEqual(self.mpc.solution_status, 0)
+    self.assertTrue(self.mpc.warm_start_valid)
+
+  def test_failed_solve_warm_start(self):
+    x_warm, u_warm = self.mpc.x_sol.copy(), self.mpc.u_sol.copy()
+
+    self.mpc.solver.fail = True
+    run_mpc(self.mpc)
+    self.assertEqual(self.mpc.reset_cnt, 1)
+    self.assertFalse(self.mpc.warm_start_valid)
+
+    # the last converged solution shifted by one step, relative to the current position and state
+    t_shifted = T_IDXS + DT_MDL
+    x_expected = np.column_stack([np.interp(t_shifted, T_IDXS, x_warm[:, j]) for j in range(X_DIM)])
+    x_expected[:, 0] -= x_expected[0, 0]
+    x_expected[0, 1:] = self.mpc.x0[1:]
+    u_expected = np.interp(t_shifted[:-1], T_IDXS[:-1], u_warm[:, 0])
+    np.testing.assert_allclose(self.mpc.x_sol, x_expected)
+    np.testing.assert_allclose(self.mpc.u_sol[:, 0], u_expected)
+    np.testing.assert_allclose(self.mpc.v_solution, x_expected[:, 1])
+    for i in range(N + 1):
+      np.testing.assert_allclose(self.mpc.solver.get(i, 'x'), x_expected[i])
+    for i in range(N):
+      np.testing.assert_allclose(self.mpc.solver.get(i, 'u'), u_expected[i:i + 1])
+
+    # a second failure starts from zero
+    run_mpc(self.mpc)
+    self.assertEqual(self.mpc.reset_cnt, 2)
+    np.testing.assert_array_equal(self.mpc.x_sol, np.zeros((N + 1, X_DIM)))
+    np.testing.assert_array_equal(self.mpc.u_sol, np.zeros((N, 1)))
+
+    # and a converged solve can be used again
+    self.mpc.solver.fail = False
+    run_mpc(self.mpc)
+    self.assertEqual(self.mpc.solution_status, 0)
+    self.assertTrue(self.mpc.warm_start_valid)
+    self.assertEqual(self.mpc.reset_cnt, 2)
+
+  def test_reset_count_gauge(self):
+    planner = Planner(CarInterface.get_params(CAR.SONATA))
+    planner.mpc = self.mpc
+    self.mpc.solver.fail = True
+    run_mpc(self.mpc)
+
+    msgs = {'radarState': log.RadarState.new_message()}
+    sm = mock.MagicMock(logMonoTime={'modelV2': 0})
+    sm.all_checks.return_value = True
+    sm.__getitem__.side_effect = msgs.__getitem__
+    with mock.patch("selfdrive.controls.lib.longitudinal_planner.statlog") as statlog:
+      planner.publish(sm, mock.MagicMock())
+    statlog.gauge.assert_called_once_with("long_mpc_reset_count", 1)
+
+
+if __name__ == "__main__":
+  unittest.main()
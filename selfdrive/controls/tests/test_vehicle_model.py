@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+import math
+import unittest
+
+import numpy as np
+
+from selfdrive.car.hyundai.interface import CarInterface
+from selfdrive.car.hyundai.values import CAR
+from selfdrive.controls.lib.vehicle_model import VehicleModel, create_dyn_state_matrices, dyn_ss_sol
+
+
+class TestVehicleModel(unittest.TestCase):
+  def setUp(self):
+    CP = CarInterface.get_params(CAR.SONATA)
+    self.VM = VehicleModel(CP)
+
+  def test_dyn_ss_sol_matches_solve(self):
+    for stiffness_factor, steer_ratio in ((1.0, 15.3), (0.6, 12.0), (1.8, 19.5)):
+      self.VM.update_params(stiffness_factor, steer_ratio)
+      for u in np.linspace(0.2, 50, 20):
+        for sa in np.radians(np.linspace(-90, 90, 7)):
+          for roll in np.radians((-5, 0, 3)):
+            A, B = create_dyn_state_matrices(u, self.VM)
+            expected = -np.linalg.solve(A, B) @ np.array([[sa], [roll]])
+            np.testing.assert_allclose(dyn_ss_sol(sa, u, roll, self.VM), expected, rtol=1e-9, atol=1e-15)
+
+  def test_steady_state_sols(self):
+    rng = np.random.default_rng(0)
+    sa = rng.uniform(-1, 1, 500)
+    u = rng.uniform(0, 40, 500)
+    u[:20] = 0.05  # kinematic model
+    roll = rng.uniform(-0.1, 0.1, 500)
+
+    sols = self.VM.steady_state_sols(sa, u, roll)
+    for i in range(len(u)):
+      np.testing.assert_allclose(sols[i], self.VM.steady_state_sol(sa[i], u[i], roll[i])[:, 0], rtol=1e-12, atol=1e-15)
+
+    curvatures = self.VM.calc_curvature(sa, u, roll)
+    steers = self.VM.get_steer_from_curvature(curvatures, u, roll)
+    for i in range(len(u)):
+      self.assertEqual(curvatures[i], self.VM.calc_curvature(sa[i], u[i], roll[i]))
+    np.testing.assert_allclose(steers, sa, rtol=1e-9, atol=1e-12)
+
+  def test_update_params(self):
+    curvature = self.VM.calc_curvature(0.1, 20, 0)
+    self.VM.update_params(1.0, self.VM.sR * 2)
+    self.assertAlmostEqual(self.VM.calc_curvature(0.1, 20, 0), curvature / 2)
+    self.VM.update_params(0.5, self.VM.sR)
+    self.assertNotAlmostEqual(self.VM.calc_curvature(0.1, 20, 0), curvature / 2)
+
+  def test_round_trip_yaw_rate(self):
+    for u in np.linspace(1, 30, 15):
+      for roll in np.radians((-5, 0, 5)):
+        for sa in np.radians(np.linspace(-90, 90, 9)):
+          yaw_rate = self.VM.yaw_rate(sa, u, roll)
+          self.assertAlmostEqual(self.VM.get_steer_from_yaw_rate(yaw_rate, u, roll), sa)
+          self.assertTrue(math.isfinite(yaw_rate))
+
+
+if __name__ == "__main__":
+  unittest.main()
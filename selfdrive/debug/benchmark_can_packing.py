@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""Times packing and unpacking of panda USB CAN buffers at realistic CAN rates.
+
+The output is checked to be identical to the previous implementation on random
+messages first, including CAN-FD lengths and extended addresses.
+"""
+import argparse
+import io
+import random
+import time
+from contextlib import redirect_stdout
+
+from panda import pack_can_buffer, unpack_can_buffer
+from panda.python import CANPACKET_HEAD_SIZE, DLC_TO_LEN, LEN_TO_DLC
+
+
+def legacy_pack_can_buffer(arr):
+  snds = [b'']
+  idx = 0
+  for address, _, dat, bus in arr:
+    assert len(dat) in LEN_TO_DLC
+    extended = 1 if address >= 0x800 else 0
+    data_len_code = LEN_TO_DLC[len(dat)]
+    header = bytearray(5)
+    word_4b = address << 3 | extended << 2
+    header[0] = (data_len_code << 4) | (bus << 1)
+    header[1] = word_4b & 0xFF
+    header[2] = (word_4b >> 8) & 0xFF
+    header[3] = (word_4b >> 16) & 0xFF
+    header[4] = (word_4b >> 24) & 0xFF
+    snds[idx] += header + dat
+    if len(snds[idx]) > 256:
+      snds.append(b'')
+      idx += 1
+
+  for idx in range(len(snds)):
+    tx = b''
+    counter = 0
+    for i in range(0, len(snds[idx]), 63):
+      tx += bytes([counter]) + snds[idx][i:i+63]
+      counter += 1
+    snds[idx] = tx
+  return snds
+
+
+def legacy_unpack_can_buffer(dat):
+  ret = []
+  counter = 0
+  tail = bytearray()
+  for i in range(0, len(dat), 64):
+    if counter != dat[i]:
+      break
+    counter += 1
+    chunk = tail + dat[i+1:i+64]
+    tail = bytearray()
+    pos = 0
+    while pos < len(chunk):
+      data_len = DLC_TO_LEN[(chunk[pos]>>4)]
+      pckt_len = CANPACKET_HEAD_SIZE + data_len
+      if pckt_len <= len(chunk[pos:]):
+        header = chunk[pos:pos+CANPACKET_HEAD_SIZE]
+        bus = (header[0] >> 1) & 0x7
+        address = (header[4] << 24 | header[3] << 16 | header[2] << 8 | header[1]) >> 3
+        returned = (header[1] >> 1) & 0x1
+        rejected = header[1] & 0x1
+        data = chunk[pos + CANPACKET_HEAD_SIZE:pos + CANPACKET_HEAD_SIZE + data_len]
+        if returned:
+          bus += 128
+        if rejected:
+          bus += 192
+        ret.append((address, 0, data, bus))
+        pos += pckt_len
+      else:
+        tail = chunk[pos:]
+        break
+  return ret
+
+
+def random_msgs(rng, n, fd=False):
+  lengths = DLC_TO_LEN if fd else DLC_TO_LEN[:9]
+  msgs = []
+  for _ in range(n):
+    address = rng.randrange(0x800) if rng.random() < 0.8 else rng.randrange(0x800, 0x20000000)
+    msgs.append([address, 0, bytes(rng.getrandbits(8) for _ in range(rng.choice(lengths))), rng.randrange(3)])
+  return msgs
+
+
+def usb_recv_buffers(rng, msgs):
+  """Bulk reads from the panda, with returned/rejected flags and sometimes a truncated last packet"""
+  stream = bytearray()
+  for tx in pack_can_buffer(msgs):
+    for i in range(0, len(tx), 64):
+      stream += tx[i+1:i+64]
+
+  pos = 0
+  while pos < len(stream):
+    stream[pos + 1] |= rng.randrange(4)
+    pos += CANPACKET_HEAD_SIZE + DLC_TO_LEN[stream[pos] >> 4]
+
+  # a bulk read is at most 16 kB, 256 USB packets
+  reads = []
+  for start in range(0, max(len(stream), 1), 256 * 63):
+    dat = bytearray()
+    for counter, i in enumerate(range(start, min(start + 256 * 63, len(stream)), 63)):
+      dat += bytes([counter]) + stream[i:i+63]
+    reads.append(bytes(dat[:-rng.randrange(1, 4)] if rng.random() < 0.5 else dat))
+  return reads
+
+
+def check_identical(rng, iterations=500):
+  for _ in range(iterations):
+    msgs = random_msgs(rng, rng.randrange(100), fd=rng.random() < 0.5)
+    assert pack_can_buffer(msgs) == legacy_pack_can_buffer(msgs)
+
+    dat = usb_recv_buffers(rng, msgs)[0]
+    if rng.random() < 0.1 and len(dat) > 64:
+      dat = dat[:64] + b'\xff' + dat[65:]  # lost packet
+    with redirect_stdout(io.StringIO()):
+      assert unpack_can_buffer(dat) == legacy_unpack_can_buffer(dat)
+
+
+def timeit(f, batches):
+  t = time.monotonic()
+  for b in batches:
+    f(b)
+  return time.monotonic() - t
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Benchmark panda CAN buffer packing",
+                                   formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+  parser.add_argument("--buses", type=int, default=3)
+  parser.add_argument("--rate", type=int, default=100, help="Batches per second, like boardd")
+  parser.add_argument("--msgs", type=int, default=40, help="Messages per bus per batch")
+  parser.add_argument("--seconds", type=int, default=10, help="Seconds of CAN traffic")
+  args = parser.parse_args()
+
+  rng = random.Random(0)
+  check_identical(rng)
+
+  n_batches = args.rate * args.seconds
+  n_msgs = args.buses * args.msgs
+  print(f"{n_batches} batches of {n_msgs} messages, {args.seconds} s of traffic")
+
+  for fd in (False, True):
+    batches = [random_msgs(rng, n_msgs, fd=fd) for _ in range(n_batches)]
+    recv_batches = [dat for b in batches for dat in usb_recv_buffers(rng, b)]
+    for name, new, old, data in [("pack", pack_can_buffer, legacy_pack_can_buffer, batches),
+                                 ("unpack", unpack_can_buffer, legacy_unpack_can_buffer, recv_batches)]:
+      t_new, t_old = timeit(new, data), timeit(old, data)
+      print(f"{name}{' (CAN-FD)' if fd else ''}: {t_old / args.seconds * 100:.1f}% -> {t_new / args.seconds * 100:.1f}% of a core, "
+            f"{n_msgs * n_batches / t_new / 1e3:.0f}k msgs/s ({t_old / t_new:.1f}x)")
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""Times exact and fuzzy FW matching on synthetic FW responses.
+
+A synthetic database with versions shared between related models is used, sized like the
+Hyundai/Kia/Genesis table. Responses have random dropped ECUs and unknown versions,
+so both the exact match and the fuzzy fallback are exercised.
+"""
+import argparse
+import random
+import time
+
+from selfdrive.car.fw_versions import build_fw_index, match_fw_to_car_exact, match_fw_to_car_fuzzy
+from selfdrive.car.tests.test_fw_fingerprint import random_fw_dict, reference_exact, reference_fuzzy, \
+                                                    synthetic_fw_versions
+
+
+def timeit(f, responses):
+  t = time.monotonic()
+  results = [f(r) for r in responses]
+  return (time.monotonic() - t) / len(responses), results
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Benchmark FW matching on synthetic FW responses")
+  parser.add_argument("-n", type=int, default=1000, help="Number of synthetic responses")
+  parser.add_argument("--cars", type=int, default=90, help="Number of cars in the synthetic database")
+  args = parser.parse_args()
+
+  rng = random.Random(0)
+  db = synthetic_fw_versions(args.cars, rng, versions_per_ecu=8)
+  responses = [random_fw_dict(db, rng, max_cars=1) for _ in range(args.n)]
+  n_versions = sum(len(v) for fws in db.values() for v in fws.values())
+  print(f"{len(db)} cars, {n_versions} FW versions, {len(responses)} responses")
+
+  t = time.monotonic()
+  index = build_fw_index(db)
+  print(f"build index: {(time.monotonic() - t) * 1e3:.3f} ms")
+
+  for name, new, old in [("exact", lambda d: match_fw_to_car_exact(d, index=index), lambda d: reference_exact(db, d)),
+                         ("fuzzy", lambda d: match_fw_to_car_fuzzy(d, log=False, index=index), lambda d: reference_fuzzy(db, d))]:
+    t_new, res_new = timeit(new, responses)
+    t_old, res_old = timeit(old, responses)
+    assert res_new == res_old, f"{name} match results differ"
+    print(f"{name}: {t_old * 1e6:.1f} us -> {t_new * 1e6:.1f} us per response ({t_old / t_new:.1f}x)")
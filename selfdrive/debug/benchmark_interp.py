@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""Times common.numpy_fast.interp on the kinds of tables and inputs used in controls.
+
+Every case is checked to give identical results to the previous linear scan
+implementation before being timed.
+"""
+import argparse
+import timeit
+
+import numpy as np
+
+from common.numpy_fast import Interpolator, interp
+from selfdrive.controls.lib.drive_helpers import CONTROL_N
+from selfdrive.controls.lib.longitudinal_planner import A_CRUISE_MAX_BP, A_CRUISE_MAX_VALS
+from selfdrive.modeld.constants import T_IDXS
+
+
+def legacy_interp(x, xp, fp):
+  N = len(xp)
+
+  def get_interp(xv):
+    hi = 0
+    while hi < N and xv > xp[hi]:
+      hi += 1
+    low = hi - 1
+    return fp[-1] if hi == N and xv > xp[low] else (
+      fp[0] if hi == 0 else
+      (xv - xp[low]) * (fp[hi] - fp[low]) / (xp[hi] - xp[low]) + fp[low])
+
+  return [get_interp(v) for v in x] if hasattr(x, '__iter__') else get_interp(x)
+
+
+# name, x, xp, fp
+CASES = [
+  ("scalar, 2 point list", 0.12, [0.0, 0.2], [0.0, 1.0]),
+  ("scalar, 4 point list", 17.3, A_CRUISE_MAX_BP, A_CRUISE_MAX_VALS),
+  ("scalar, 17 point list", 0.35, T_IDXS[:CONTROL_N], list(np.linspace(20., 25., CONTROL_N))),
+  ("scalar, 17 point array", 0.35, np.array(T_IDXS[:CONTROL_N]), np.linspace(20., 25., CONTROL_N)),
+  ("scalar, 33 point array, end", 9.9, np.array(T_IDXS), np.linspace(20., 25., len(T_IDXS))),
+  ("33 point list", list(np.linspace(-1, 11, 33)), np.array(T_IDXS), np.linspace(20., 25., len(T_IDXS))),
+  ("33 point array", np.linspace(-1, 11, 33), np.array(T_IDXS), np.linspace(20., 25., len(T_IDXS))),
+]
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Benchmark common.numpy_fast.interp")
+  parser.add_argument("-n", type=int, default=100000, help="Calls per case")
+  args = parser.parse_args()
+
+  for name, x, xp, fp in CASES:
+    interpolator = Interpolator(xp, fp)
+    expected = legacy_interp(x, xp, fp)
+    np.testing.assert_array_equal(interp(x, xp, fp), expected)
+    np.testing.assert_array_equal(interpolator(x), expected)
+
+    t_old = timeit.timeit(lambda: legacy_interp(x, xp, fp), number=args.n) / args.n
+    t_new = timeit.timeit(lambda: interp(x, xp, fp), number=args.n) / args.n
+    t_interpolator = timeit.timeit(lambda: interpolator(x), number=args.n) / args.n
+    t_np = timeit.timeit(lambda: np.interp(x, xp, fp), number=args.n) / args.n
+    print(f"{name:28s} legacy {t_old * 1e6:6.2f} us, interp {t_new * 1e6:6.2f} us ({t_old / t_new:4.1f}x), "
+          f"Interpolator {t_interpolator * 1e6:6.2f} us ({t_old / t_interpolator:4.1f}x), np.interp {t_np * 1e6:6.2f} us")
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""Times reading modelV2 into numpy arrays in the lateral planner, per model frame.
+
+The arrays and the path from LanePlanner.get_d_path are checked to be identical to
+building new arrays from the capnp lists every frame, like before the preallocated buffers.
+"""
+import argparse
+import time
+
+import numpy as np
+
+import cereal.messaging as messaging
+from common.capnp_helpers import copy_list, copy_xyz
+from selfdrive.controls.lib.lane_planner import LanePlanner, TRAJECTORY_SIZE
+from selfdrive.modeld.constants import T_IDXS
+
+
+class LegacyLanePlanner(LanePlanner):
+  def parse_model(self, md):
+    lane_lines = md.laneLines
+    if len(lane_lines) == 4 and len(lane_lines[0].t) == TRAJECTORY_SIZE:
+      self.ll_t = (np.array(lane_lines[1].t) + np.array(lane_lines[2].t))/2
+      self.ll_x = lane_lines[1].x
+      self.lll_y = np.array(lane_lines[1].y) + self.camera_offset
+      self.rll_y = np.array(lane_lines[2].y) + self.camera_offset
+      self.lll_prob = md.laneLineProbs[1]
+      self.rll_prob = md.laneLineProbs[2]
+      self.lll_std = md.laneLineStds[1]
+      self.rll_std = md.laneLineStds[2]
+
+
+def legacy_parse_path(md):
+  if len(md.position.x) == TRAJECTORY_SIZE and len(md.orientation.x) == TRAJECTORY_SIZE:
+    path_xyz = np.column_stack([md.position.x, md.position.y, md.position.z])
+    t_idxs = np.array(md.position.t)
+    plan_yaw = list(md.orientation.z)
+  if len(md.position.xStd) == TRAJECTORY_SIZE:
+    path_xyz_stds = np.column_stack([md.position.xStd, md.position.yStd, md.position.zStd])
+  return path_xyz, t_idxs, plan_yaw, path_xyz_stds
+
+
+class PathBuffers:
+  def __init__(self):
+    self.path_xyz = np.zeros((TRAJECTORY_SIZE, 3))
+    self.path_xyz_stds = np.ones((TRAJECTORY_SIZE, 3))
+    self.plan_yaw = np.zeros((TRAJECTORY_SIZE,))
+    self.t_idxs = np.arange(TRAJECTORY_SIZE, dtype=np.float64)
+
+  def parse_path(self, md):
+    # as in LateralPlanner.update
+    position, orientation = md.position, md.orientation
+    if len(position.x) == TRAJECTORY_SIZE and len(orientation.x) == TRAJECTORY_SIZE:
+      copy_xyz(self.path_xyz, position)
+      copy_list(self.t_idxs, position.t)
+      copy_list(self.plan_yaw, orientation.z)
+    copy_xyz(self.path_xyz_stds, position, std=True)
+    return self.path_xyz, self.t_idxs, self.plan_yaw, self.path_xyz_stds
+
+
+def random_model_msg(rng):
+  msg = messaging.new_message('modelV2')
+  md = msg.modelV2
+  t = np.array(T_IDXS)
+  for field in ('position', 'orientation', 'velocity', 'orientationRate'):
+    xyzt = getattr(md, field)
+    xyzt.t = t.tolist()
+    for name in ('x', 'y', 'z', 'xStd', 'yStd', 'zStd'):
+      setattr(xyzt, name, rng.normal(size=TRAJECTORY_SIZE).astype(np.float32).tolist())
+  md.position.x = (10 * t + rng.normal(size=TRAJECTORY_SIZE)).astype(np.float32).tolist()
+
+  lane_lines = md.init('laneLines', 4)
+  for i, y in enumerate((-5.4, -1.8, 1.8, 5.4)):
+    lane_lines[i].t = (t + rng.normal(scale=0.01, size=TRAJECTORY_SIZE)).astype(np.float32).tolist()
+    lane_lines[i].x = np.sort(rng.uniform(0, 150, size=TRAJECTORY_SIZE)).astype(np.float32).tolist()
+    lane_lines[i].y = (y + rng.normal(scale=0.1, size=TRAJECTORY_SIZE)).astype(np.float32).tolist()
+  md.laneLineProbs = rng.uniform(0.6, 1.0, size=4).tolist()
+  md.laneLineStds = rng.uniform(0.0, 0.4, size=4).tolist()
+  md.meta.desireState = [0.] * 8
+  return messaging.log_from_bytes(msg.to_bytes()).modelV2
+
+
+def timeit(frames, lane_planner, parse_path):
+  t = time.monotonic()
+  for md in frames:
+    lane_planner.parse_model(md)
+    parse_path(md)
+  return (time.monotonic() - t) / len(frames)
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Benchmark reading modelV2 in the lateral planner")
+  parser.add_argument("-n", type=int, default=2000, help="Number of model frames")
+  args = parser.parse_args()
+
+  rng = np.random.default_rng(0)
+  frames = [random_model_msg(rng) for _ in range(args.n)]
+
+  new_lp, legacy_lp = LanePlanner(), LegacyLanePlanner()
+  buffers = PathBuffers()
+  for md in frames[:100]:
+    for lp in (new_lp, legacy_lp):
+      lp.parse_model(md)
+    legacy_path = legacy_parse_path(md)
+    new_path = buffers.parse_path(md)
+    for legacy, new in zip(legacy_path, new_path):
+      np.testing.assert_array_equal(new, legacy)
+    for name in ('ll_t', 'll_x', 'lll_y', 'rll_y'):
+      np.testing.assert_array_equal(getattr(new_lp, name), getattr(legacy_lp, name))
+
+    v_ego = rng.uniform(0, 30)
+    legacy_d_path = legacy_lp.get_d_path(v_ego, legacy_path[1], legacy_path[0].copy())
+    new_d_path = new_lp.get_d_path(v_ego, new_path[1], new_path[0].copy())
+    np.testing.assert_array_equal(new_d_path, legacy_d_path)
+
+  t_old = timeit(frames, LegacyLanePlanner(), legacy_parse_path)
+  t_new = timeit(frames, LanePlanner(), PathBuffers().parse_path)
+  print(f"modelV2 parsing: {t_old * 1e6:.1f} us -> {t_new * 1e6:.1f} us per frame ({t_old / t_new:.1f}x)")
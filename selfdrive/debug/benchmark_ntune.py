@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""Measures ntune_get throughput, with the config files unchanged and while they're
+rewritten as fast as possible so the watcher keeps reloading them.
+"""
+import argparse
+import json
+import tempfile
+import threading
+import time
+
+import selfdrive.ntune as ntune
+from selfdrive.ntune import VALID_RANGES, ntune_common_get, ntune_scc_get
+
+
+def run(n):
+  t = time.monotonic()
+  for _ in range(n):
+    ntune_common_get('steerRateCost')
+    ntune_common_get('steerActuatorDelay')
+    ntune_scc_get('sccGasFactor')
+    ntune_scc_get('sccBrakeFactor')
+  return 4 * n / (time.monotonic() - t)
+
+
+def rewrite_configs(stop):
+  i = 0
+  while not stop.is_set():
+    for group in ("common", "scc"):
+      config = {key: default for key, (_, _, default) in VALID_RANGES[group].items()}
+      config[next(iter(config))] += (i % 2) * 0.01
+      with open(f"{ntune.CONF_PATH}{group}.json", 'w') as f:
+        json.dump(config, f)
+    i += 1
+    time.sleep(0.001)
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Benchmark ntune_get")
+  parser.add_argument("-n", type=int, default=250000, help="Iterations, each gets 4 values")
+  args = parser.parse_args()
+
+  ntune.CONF_PATH = tempfile.mkdtemp() + '/'
+  ntune.RELOAD_INTERVAL = 0.01
+
+  print(f"configs unchanged: {run(args.n) / 1e6:.2f} M ntune_get/s")
+
+  stop = threading.Event()
+  writer = threading.Thread(target=rewrite_configs, args=(stop,))
+  writer.start()
+  rate = run(args.n)
+  stop.set()
+  writer.join()
+  print(f"configs rewritten: {rate / 1e6:.2f} M ntune_get/s")
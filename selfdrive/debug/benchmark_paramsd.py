@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""Times the paramsd estimator on the inputs of a process replay segment, per message.
+
+Every liveLocationKalman and carState is applied with one stacked update in ParamsLearner.
+It's compared to applying the observations one by one, like before the stacked update,
+and the liveParameters estimates of both have to match within tolerance.
+"""
+import argparse
+import math
+import time
+
+import numpy as np
+
+from selfdrive.locationd.paramsd import ParamsLearner
+from selfdrive.locationd.models.car_kf import ObservationKind, States
+from selfdrive.test.openpilotci import get_url
+from selfdrive.test.process_replay.process_replay import CONFIGS
+from selfdrive.test.process_replay.test_processes import original_segments
+from tools.lib.logreader import LogReader
+
+PARAMSD_INPUTS = next(cfg for cfg in CONFIGS if cfg.proc_name == "paramsd").pub_sub.keys()
+
+ESTIMATES = {
+  "steerRatio": States.STEER_RATIO,
+  "stiffnessFactor": States.STIFFNESS,
+  "angleOffsetDeg": States.ANGLE_OFFSET,
+  "roll": States.ROAD_ROLL,
+}
+TOLERANCE = {
+  "steerRatio": 1e-3,
+  "stiffnessFactor": 1e-4,
+  "angleOffsetDeg": 1e-3,
+  "roll": 1e-4,
+}
+
+
+class SequentialParamsLearner(ParamsLearner):
+  def __init__(self, *args, **kwargs):
+    super().__init__(*args, **kwargs)
+    self.kf.predict_and_observe_multi = self.observe_sequential
+
+  def observe_sequential(self, t, observations):
+    for kind, data, R in observations:
+      if kind in (ObservationKind.STIFFNESS, ObservationKind.STEER_RATIO):
+        # the current estimate after the other observations
+        data = self.kf.x[States.STIFFNESS if kind == ObservationKind.STIFFNESS else States.STEER_RATIO]
+      self.kf.predict_and_observe(t, kind, np.atleast_2d(data), None if R is None else np.array([np.atleast_2d(R)]))
+
+
+def load_segment(segment, rlog=None):
+  lr = LogReader(rlog if rlog is not None else get_url(*segment.rsplit("--", 1)))
+  msgs = list(lr)
+  CP = next(m.carParams for m in msgs if m.which() == "carParams")
+  inputs = [m for m in msgs if m.which() in PARAMSD_INPUTS]
+  return CP, sorted(inputs, key=lambda m: m.logMonoTime)
+
+
+def replay(learner, msgs):
+  times = {which: [] for which in PARAMSD_INPUTS}
+  estimates = []
+  for m in msgs:
+    which = m.which()
+    t = time.process_time_ns()
+    learner.handle_log(m.logMonoTime * 1e-9, which, getattr(m, which))
+    times[which].append(time.process_time_ns() - t)
+    if which == "liveLocationKalman":
+      x = learner.kf.x
+      estimates.append([math.degrees(x[s][0]) if name == "angleOffsetDeg" else x[s][0] for name, s in ESTIMATES.items()])
+  return times, np.array(estimates)
+
+
+if __name__ == "__main__":
+  segments = dict(original_segments)
+  parser = argparse.ArgumentParser(description="Benchmark the paramsd estimator on a process replay segment")
+  parser.add_argument("--car", default="HYUNDAI", choices=list(segments), help="Process replay segment to use")
+  parser.add_argument("--rlog", help="Local rlog to use instead of downloading the segment")
+  args = parser.parse_args()
+
+  CP, msgs = load_segment(segments[args.car], args.rlog)
+  print(f"{len(msgs)} messages, {CP.carFingerprint}")
+
+  def new_learner(cls):
+    return cls(CP, CP.steerRatio, 1.0, 0.0)
+
+  times_seq, est_seq = replay(new_learner(SequentialParamsLearner), msgs)
+  times_new, est_new = replay(new_learner(ParamsLearner), msgs)
+
+  for i, name in enumerate(ESTIMATES):
+    diff = np.max(np.abs(est_new[:, i] - est_seq[:, i]), initial=0)
+    print(f"{name}: max diff {diff:.2e}")
+    assert diff < TOLERANCE[name], f"{name} differs by {diff}"
+
+  for which in times_new:
+    t_seq, t_new = np.mean(times_seq[which]) / 1e3, np.mean(times_new[which]) / 1e3
+    print(f"{which}: {t_seq:.1f} us -> {t_new:.1f} us CPU per message ({t_seq / t_new:.1f}x)")
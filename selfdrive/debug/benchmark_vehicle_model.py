@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""Times the vehicle model per control cycle, and over a grid of speeds and steering angles.
+
+The legacy model recomputes the slip factor on every call and solves the steady state
+with np.linalg.solve on the A and B matrices, like before the parameters were cached.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from selfdrive.car.hyundai.interface import CarInterface
+from selfdrive.car.hyundai.values import CAR
+from selfdrive.controls.lib.vehicle_model import VehicleModel, calc_slip_factor, create_dyn_state_matrices, kin_ss_sol
+
+
+class LegacyVehicleModel(VehicleModel):
+  def update_params(self, stiffness_factor, steer_ratio):
+    self.cF = stiffness_factor * self.cF_orig
+    self.cR = stiffness_factor * self.cR_orig
+    self.sR = steer_ratio
+
+  @property
+  def sf(self):
+    return calc_slip_factor(self)
+
+  def steady_state_sol(self, sa, u, roll):
+    if u > 0.1:
+      A, B = create_dyn_state_matrices(u, self)
+      return -np.linalg.solve(A, B) @ np.array([[sa], [roll]])
+    else:
+      return kin_ss_sol(sa, u, self)
+
+
+def control_cycle(VM, steer_angle, v_ego, roll, desired_curvature):
+  # as in controlsd and the lateral controllers
+  VM.update_params(1.0, 15.0)
+  curvature = VM.calc_curvature(steer_angle, v_ego, roll)
+  steer = VM.get_steer_from_curvature(desired_curvature, v_ego, roll)
+  return curvature, steer
+
+
+def timeit(f, n):
+  t = time.monotonic()
+  for _ in range(n):
+    f()
+  return (time.monotonic() - t) / n
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Benchmark the vehicle model")
+  parser.add_argument("-n", type=int, default=20000, help="Number of control cycles")
+  args = parser.parse_args()
+
+  CP = CarInterface.get_params(CAR.SONATA)
+  legacy, new = LegacyVehicleModel(CP), VehicleModel(CP)
+
+  t_old = timeit(lambda: control_cycle(legacy, 0.1, 20., 0.02, 0.002), args.n)
+  t_new = timeit(lambda: control_cycle(new, 0.1, 20., 0.02, 0.002), args.n)
+  assert control_cycle(legacy, 0.1, 20., 0.02, 0.002) == control_cycle(new, 0.1, 20., 0.02, 0.002)
+  print(f"control cycle: {t_old * 1e6:.2f} us -> {t_new * 1e6:.2f} us ({t_old / t_new:.1f}x)")
+
+  t_old = timeit(lambda: legacy.steady_state_sol(0.1, 20., 0.02), args.n)
+  t_new = timeit(lambda: new.steady_state_sol(0.1, 20., 0.02), args.n)
+  print(f"steady_state_sol: {t_old * 1e6:.2f} us -> {t_new * 1e6:.2f} us ({t_old / t_new:.1f}x)")
+
+  # speeds and steering angles, like a lateral tuning sweep
+  u, sa = np.meshgrid(np.linspace(0, 40, 41), np.radians(np.linspace(-90, 90, 37)))
+  u, sa = u.ravel(), sa.ravel()
+  roll = np.zeros_like(u)
+
+  def legacy_grid():
+    sols = np.array([legacy.steady_state_sol(sa[i], u[i], roll[i])[:, 0] for i in range(len(u))])
+    curvatures = np.array([legacy.calc_curvature(sa[i], u[i], roll[i]) for i in range(len(u))])
+    return sols, curvatures
+
+  def new_grid():
+    return new.steady_state_sols(sa, u, roll), new.calc_curvature(sa, u, roll)
+
+  for old, vectorized in zip(legacy_grid(), new_grid()):
+    np.testing.assert_allclose(vectorized, old, rtol=1e-9, atol=1e-12)
+  n = max(args.n // 1000, 3)
+  t_old = timeit(legacy_grid, n)
+  t_new = timeit(new_grid, n)
+  print(f"{len(u)} point grid: {t_old * 1e3:.2f} ms -> {t_new * 1e3:.3f} ms ({t_old / t_new:.0f}x)")
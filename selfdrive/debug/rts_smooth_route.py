@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""Replays the paramsd observations of a route through CarKalman and RTS smooths the estimates.
+
+Every segment is processed in its own process. Smoothing restarts whenever paramsd resets
+the filter time (car stopped or not in the linear steering region), since the filter
+doesn't propagate over those gaps.
+"""
+import argparse
+import math
+from multiprocessing import Pool
+
+import numpy as np
+
+from cereal import car
+from rednose.helpers.ekf_sym import EKF_sym
+from selfdrive.locationd.models.car_kf import States
+from selfdrive.locationd.models.constants import GENERATED_DIR
+from selfdrive.locationd.paramsd import ParamsLearner
+from selfdrive.swaglog import cloudlog
+from tools.lib.logreader import LogReader
+from tools.lib.route import Route
+
+# upper bound of filter updates per message in ParamsLearner.handle_log, it applies
+# the observations of a message in one stacked update
+UPDATES_PER_MSG = {
+  'liveLocationKalman': 1,
+  'carState': 1,
+}
+
+
+class EstimateBuffer:
+  """Preallocated storage for filter estimates, split in chunks of continuous filter time"""
+  def __init__(self, size, dim_x, dim_err):
+    self.t = np.zeros(size, dtype=np.float64)
+    self.xk1 = np.zeros((size, dim_x), dtype=np.float64)
+    self.xk = np.zeros((size, dim_x), dtype=np.float64)
+    self.Pk1 = np.zeros((size, dim_err, dim_err), dtype=np.float64)
+    self.Pk = np.zeros((size, dim_err, dim_err), dtype=np.float64)
+    self.n = 0
+    self.chunk_starts = [0]
+
+  def append(self, estimate):
+    xk1, xk, Pk1, Pk, t = estimate[:5]
+    self.t[self.n] = t
+    self.xk1[self.n] = xk1
+    self.xk[self.n] = xk
+    self.Pk1[self.n] = Pk1
+    self.Pk[self.n] = Pk
+    self.n += 1
+
+  def new_chunk(self):
+    if self.chunk_starts[-1] != self.n:
+      self.chunk_starts.append(self.n)
+
+  def smooth(self, ekf):
+    states = np.zeros_like(self.xk[:self.n])
+    covs = np.zeros_like(self.Pk[:self.n])
+    for start, end in zip(self.chunk_starts, self.chunk_starts[1:] + [self.n]):
+      if end > start:
+        s = slice(start, end)
+        states[s], covs[s] = ekf.rts_smooth_arrays(self.xk1[s], self.xk[s], self.Pk1[s], self.Pk[s], self.t[s])
+    return states, covs
+
+
+class RecordingEKF(EKF_sym):
+  def __init__(self, estimates, *args, **kwargs):
+    super().__init__(*args, **kwargs)
+    self.estimates = estimates
+
+  def _rewind_and_update(self, t, kind, z, R, extra_args, augment=False):
+    # both batch and stacked updates of different kinds go through here
+    if self.filter_time is not None and t < self.filter_time:
+      # rewound estimates would be out of order, messages are replayed sorted so this is rare
+      self.logger.warning(f"skipping out of order observation at {t:.3f} with filter at {self.filter_time:.3f}")
+      return None
+
+    ret = super()._rewind_and_update(t, kind, z, R, extra_args, augment)
+    if ret is not None:
+      self.estimates.append(ret)
+    return ret
+
+  def set_filter_time(self, t):
+    super().set_filter_time(t)
+    self.estimates.new_chunk()
+
+
+def smooth_segment(args):
+  log_path, cp_bytes = args
+  CP = car.CarParams.from_bytes(cp_bytes)
+
+  msgs = [m for m in LogReader(log_path) if m.which() in UPDATES_PER_MSG]
+  msgs.sort(key=lambda m: m.logMonoTime)
+
+  learner = ParamsLearner(CP, CP.steerRatio, 1.0, 0.0)
+  kf = learner.kf
+  dim_x, dim_err = kf.initial_x.shape[0], kf.P_initial.shape[0]
+  estimates = EstimateBuffer(sum(UPDATES_PER_MSG[m.which()] for m in msgs), dim_x, dim_err)
+
+  # the python filter records its estimates and supports smoothing
+  kf.filter = RecordingEKF(estimates, GENERATED_DIR, kf.name, kf.Q, kf.initial_x, kf.P_initial, dim_x, dim_err,
+                           global_vars=kf.global_vars, logger=cloudlog)
+  kf.filter.set_global("mass", CP.mass)
+  kf.filter.set_global("rotational_inertia", CP.rotationalInertia)
+  kf.filter.set_global("center_to_front", CP.centerToFront)
+  kf.filter.set_global("center_to_rear", CP.wheelbase - CP.centerToFront)
+  kf.filter.set_global("stiffness_front", CP.tireStiffnessFront)
+  kf.filter.set_global("stiffness_rear", CP.tireStiffnessRear)
+
+  for m in msgs:
+    learner.handle_log(m.logMonoTime * 1e-9, m.which(), getattr(m, m.which()))
+
+  states, covs = estimates.smooth(kf.filter)
+  return {
+    't': estimates.t[:estimates.n],
+    'x_filtered': estimates.xk[:estimates.n],
+    'x_smoothed': states,
+    'std_smoothed': np.sqrt(np.diagonal(covs, axis1=1, axis2=2)),
+  }
+
+
+def get_car_params(log_paths):
+  for log_path in log_paths:
+    if log_path is None:
+      continue
+    for msg in LogReader(log_path):
+      if msg.which() == 'carParams':
+        return msg.carParams.as_builder().to_bytes()
+  raise ValueError("no carParams found in route")
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="RTS smooth the paramsd estimates of a route",
+                                   formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+  parser.add_argument("route", help="The route name to use")
+  parser.add_argument("--workers", type=int, default=None, help="Number of segments processed in parallel")
+  parser.add_argument("--out", default=None, help="Output npz file, defaults to <route>_smoothed.npz")
+  args = parser.parse_args()
+
+  log_paths = Route(args.route).log_paths()
+  cp_bytes = get_car_params(log_paths)
+
+  with Pool(args.workers) as pool:
+    results = pool.map(smooth_segment, [(p, cp_bytes) for p in log_paths if p is not None])
+
+  out = {k: np.concatenate([r[k] for r in results]) for k in results[0]}
+  fn = args.out if args.out is not None else f"{args.route.replace('|', '_')}_smoothed.npz"
+  np.savez(fn, **out)
+
+  x = out['x_smoothed']
+  print(f"{len(out['t'])} estimates saved to {fn}")
+  print(f"steer ratio: {np.median(x[:, States.STEER_RATIO]):.2f}, stiffness: {np.median(x[:, States.STIFFNESS]):.2f}, "
+        f"angle offset: {math.degrees(np.median(x[:, States.ANGLE_OFFSET])):.2f} deg")
@@ -0,0 +1,27 @@
+import os
+import threading
+from typing import Dict
+
+# sysfs attributes regenerate their value on every read from offset 0, so they're opened once
+# and read with pread instead of opening the file for every read
+_fds: Dict[str, int] = {}
+_lock = threading.Lock()
+
+
+def read_sysfs(path: str, size: int = 4096) -> str:
+  fd = _fds.get(path)
+  if fd is None:
+    with _lock:
+      fd = _fds.get(path)
+      if fd is None:
+        fd = _fds[path] = os.open(path, os.O_RDONLY | os.O_CLOEXEC)
+
+  try:
+    return os.pread(fd, size, 0).decode()
+  except OSError:
+    # e.g. the device went away, open it again on the next read
+    with _lock:
+      if _fds.get(path) == fd:
+        del _fds[path]
+        os.close(fd)
+    raise
@@ -2,82 +2,170 @@
 import json
 import lzma
 import hashlib
+import queue
 import requests
+import stat
 import struct
 import subprocess
+import threading
 import time
 import os
-from typing import Generator
+from functools import lru_cache
+from typing import Dict, Generator, Iterable, Iterator, NamedTuple, TypeVar, Union
 
-SPARSE_CHUNK_FMT = struct.Struct('H2xI4x')
+SPARSE_HEADER_FMT = struct.Struct('<IHHHHIIII')
+SPARSE_CHUNK_FMT = struct.Struct('<H2xI4x')
 
+# size of the downloaded, decompressed and written chunks, a multiple of the sparse block size
+CHUNK_SIZE = 4 * 1024 * 1024
+# chunks buffered between two stages of the flashing pipeline
+QUEUE_SIZE = 4
+DOWNLOAD_TIMEOUT = 60
 
-class StreamingDecompressor:
-  def __init__(self, url: str) -> None:
-    self.buf = b""
+# raw hashes of the partitions flashed by this process, so they don't have to be read back to verify
+flashed_hashes: Dict[str, str] = {}
 
-    self.req = requests.get(url, stream=True, headers={'Accept-Encoding': None})
-    self.it = self.req.iter_content(chunk_size=1024 * 1024)
-    self.decompressor = lzma.LZMADecompressor(format=lzma.FORMAT_AUTO)
-    self.eof = False
-    self.sha256 = hashlib.sha256()
+T = TypeVar('T')
+_DONE = object()
 
-  def read(self, length: int) -> bytes:
-    while len(self.buf) < length:
-      self.req.raise_for_status()
 
-      try:
-        compressed = next(self.it)
-      except StopIteration:
-        self.eof = True
-        break
-      out = self.decompressor.decompress(compressed)
-      self.buf += out
+class Fill(NamedTuple):
+  pattern: bytes  # 4 bytes, repeated
+  length: int
+
 
-    result = self.buf[:length]
-    self.buf = self.buf[length:]
+def threaded(it: Iterator[T], stop: threading.Event) -> Generator[T, None, None]:
+  """Runs a pipeline stage in its own thread, passing on its items and its exception through a bounded queue.
+  Setting stop ends all stages of the pipeline."""
+  q: queue.Queue = queue.Queue(QUEUE_SIZE)
 
-    self.sha256.update(result)
-    return result
+  def put(item) -> None:
+    while not stop.is_set():
+      try:
+        q.put(item, timeout=0.1)
+        return
+      except queue.Full:
+        pass
+
+  def run() -> None:
+    try:
+      for item in it:
+        put((item, None))
+        if stop.is_set():
+          return
+      put((_DONE, None))
+    except Exception as e:
+      put((_DONE, e))
+
+  threading.Thread(target=run, daemon=True).start()
+  while True:
+    try:
+      item, e = q.get(timeout=0.1)
+    except queue.Empty:
+      if stop.is_set():
+        raise Exception("Flashing stopped")
+      continue
+
+    if item is _DONE:
+      if e is not None:
+        raise e
+      return
+    yield item
+
+
+def download(url: str) -> Generator[bytes, None, None]:
+  with requests.get(url, stream=True, headers={'Accept-Encoding': None}, timeout=DOWNLOAD_TIMEOUT) as r:
+    r.raise_for_status()
+    yield from r.iter_content(chunk_size=CHUNK_SIZE)
+
+
+def decompress(chunks: Iterable[bytes], sha256) -> Generator[bytes, None, None]:
+  decompressor = lzma.LZMADecompressor(format=lzma.FORMAT_AUTO)
+  for compressed in chunks:
+    out = decompressor.decompress(compressed, CHUNK_SIZE)
+    while True:
+      if out:
+        sha256.update(out)
+        yield out
+      if decompressor.needs_input or decompressor.eof:
+        break
+      out = decompressor.decompress(b"", CHUNK_SIZE)
+
+
+class StreamReader:
+  """Reads from a stream of chunks, without copying them where possible"""
+  def __init__(self, chunks: Iterable[bytes]) -> None:
+    self.chunks = iter(chunks)
+    self.buf = memoryview(b"")
+
+  def read_some(self, length: int) -> memoryview:
+    """Up to length bytes, less at the end of a chunk, nothing at the end of the stream"""
+    if not self.buf:
+      self.buf = memoryview(next(self.chunks, b""))
+    out, self.buf = self.buf[:length], self.buf[length:]
+    return out
+
+  def read(self, length: int) -> Union[bytes, memoryview]:
+    """length bytes, less only at the end of the stream"""
+    out = self.read_some(length)
+    if len(out) == length:
+      return out
+
+    parts = [out]
+    n = len(out)
+    while n < length:
+      part = self.read_some(length - n)
+      if not part:
+        break
+      parts.append(part)
+      n += len(part)
+    return b"".join(parts)
 
 
-def unsparsify(f: StreamingDecompressor) -> Generator[bytes, None, None]:
+def unsparsify(f: StreamReader) -> Generator[Union[memoryview, Fill], None, None]:
   # https://source.android.com/devices/bootloader/images#sparse-format
-  magic = struct.unpack("I", f.read(4))[0]
+  magic, major, minor, _, _, block_sz, _, num_chunks, _ = SPARSE_HEADER_FMT.unpack(f.read(SPARSE_HEADER_FMT.size))
   assert(magic == 0xed26ff3a)
-
-  # Version
-  major = struct.unpack("H", f.read(2))[0]
-  minor = struct.unpack("H", f.read(2))[0]
   assert(major == 1 and minor == 0)
 
-  f.read(2)  # file header size
-  f.read(2)  # chunk header size
-
-  block_sz = struct.unpack("I", f.read(4))[0]
-  f.read(4)  # total blocks
-  num_chunks = struct.unpack("I", f.read(4))[0]
-  f.read(4)  # crc checksum
-
   for _ in range(num_chunks):
-    chunk_type, out_blocks = SPARSE_CHUNK_FMT.unpack(f.read(12))
+    chunk_type, out_blocks = SPARSE_CHUNK_FMT.unpack(f.read(SPARSE_CHUNK_FMT.size))
 
     if chunk_type == 0xcac1:  # Raw
-      # TODO: yield in smaller chunks. Yielding only block_sz is too slow. Largest observed data chunk is 252 MB.
-      yield f.read(out_blocks * block_sz)
+      remaining = out_blocks * block_sz
+      while remaining > 0:
+        data = f.read_some(remaining)
+        if not data:
+          raise Exception("Sparse image truncated")
+        remaining -= len(data)
+        yield data
     elif chunk_type == 0xcac2:  # Fill
-      filler = f.read(4) * (block_sz // 4)
-      for _ in range(out_blocks):
-        yield filler
+      yield Fill(bytes(f.read(4)), out_blocks * block_sz)
     elif chunk_type == 0xcac3:  # Don't care
-      yield b""
+      pass
     else:
       raise Exception("Unhandled sparse chunk type")
 
-# noop wrapper with same API as unsparsify() for non sparse images
-def noop(f: StreamingDecompressor) -> Generator[bytes, None, None]:
-  while not f.eof:
-    yield f.read(1024 * 1024)
+
+@lru_cache(maxsize=None)
+def fill_buffer(pattern: bytes) -> memoryview:
+  return memoryview(pattern * (CHUNK_SIZE // len(pattern)))
+
+
+def fill_pieces(fill: Fill) -> Generator[memoryview, None, None]:
+  filler = fill_buffer(fill.pattern)
+  for pos in range(0, fill.length, len(filler)):
+    yield filler[:fill.length - pos]
+
+
+def hashed(chunks: Iterable[Union[bytes, memoryview, Fill]], sha256) -> Generator[Union[bytes, memoryview, Fill], None, None]:
+  for chunk in chunks:
+    if isinstance(chunk, Fill):
+      for piece in fill_pieces(chunk):
+        sha256.update(piece)
+    else:
+      sha256.update(chunk)
+    yield chunk
 
 
 def get_target_slot_number() -> int:
@@ -104,14 +192,16 @@ def verify_partition(target_slot_number: int, partition: dict) -> bool:
   path = get_partition_path(target_slot_number, partition)
   partition_size = partition['size']
 
+  if flashed_hashes.get(path) == partition['hash_raw'].lower():
+    return True
+
   with open(path, 'rb+') as out:
     if full_check:
       raw_hash = hashlib.sha256()
 
       pos = 0
-      chunk_size = 1024 * 1024
       while pos < partition_size:
-        n = min(chunk_size, partition_size - pos)
+        n = min(CHUNK_SIZE, partition_size - pos)
         raw_hash.update(out.read(n))
         pos += n
 
@@ -123,6 +213,7 @@ def verify_partition(target_slot_number: int, partition: dict) -> bool:
 
 def clear_partition_hash(target_slot_number: int, partition: dict) -> None:
   path = get_partition_path(target_slot_number, partition)
+  flashed_hashes.pop(path, None)
   with open(path, 'wb+') as out:
     partition_size = partition['size']
 
@@ -138,31 +229,53 @@ def flash_partition(target_slot_number: int, partition: dict, cloudlog):
     cloudlog.info(f"Already flashed {partition['name']}")
     return
 
-  downloader = StreamingDecompressor(partition['url'])
-
   # Clear hash before flashing in case we get interrupted
   full_check = partition['full_check']
   if not full_check:
     clear_partition_hash(target_slot_number, partition)
 
   path = get_partition_path(target_slot_number, partition)
+  stop = threading.Event()
   with open(path, 'wb+') as out:
-    # Flash partition
-    last_p = 0
+    # holes in a new file read as zeros, on the partition itself zeros have to be written
+    seek_zeros = stat.S_ISREG(os.fstat(out.fileno()).st_mode)
+
+    # download, decompress, unsparsify, hash and write run in their own threads
+    sha256 = hashlib.sha256()
     raw_hash = hashlib.sha256()
-    f = unsparsify if partition['sparse'] else noop
-    for chunk in f(downloader):
-      raw_hash.update(chunk)
-      out.write(chunk)
-      p = int(out.tell() / partition['size'] * 100)
-      if p != last_p:
-        last_p = p
-        print(f"Installing {partition['name']}: {p}", flush=True)
+    chunks = threaded(decompress(threaded(download(partition['url']), stop), sha256), stop)
+    data = threaded(unsparsify(StreamReader(chunks)), stop) if partition['sparse'] else chunks
+
+    try:
+      # Flash partition
+      last_p = 0
+      for chunk in threaded(hashed(data, raw_hash), stop):
+        if not isinstance(chunk, Fill):
+          out.write(chunk)
+        elif seek_zeros and chunk.pattern == b"\x00" * 4:
+          out.seek(chunk.length, os.SEEK_CUR)
+        else:
+          for piece in fill_pieces(chunk):
+            out.write(piece)
+
+        p = int(out.tell() / partition['size'] * 100)
+        if p != last_p:
+          last_p = p
+          print(f"Installing {partition['name']}: {p}", flush=True)
+
+      # the uncompressed hash is of the whole stream
+      for _ in chunks:
+        pass
+    finally:
+      stop.set()
+
+    if seek_zeros:
+      out.truncate()
 
     if raw_hash.hexdigest().lower() != partition['hash_raw'].lower():
       raise Exception(f"Raw hash mismatch '{raw_hash.hexdigest().lower()}'")
 
-    if downloader.sha256.hexdigest().lower() != partition['hash'].lower():
+    if sha256.hexdigest().lower() != partition['hash'].lower():
       raise Exception("Uncompressed hash mismatch")
 
     if out.tell() != partition['size']:
@@ -173,6 +286,8 @@ def flash_partition(target_slot_number: int, partition: dict, cloudlog):
     if not full_check:
       out.write(partition['hash_raw'].lower().encode())
 
+  flashed_hashes[path] = partition['hash_raw'].lower()
+
 
 def swap(manifest_path: str, target_slot_number: int, cloudlog) -> None:
   update = json.load(open(manifest_path))
@@ -400,11 +400,7 @@ class Tici(HardwareBase):
       pass
 
   def get_screen_brightness(self):
-    try:
-      with open("/sys/class/backlight/panel0-backlight/brightness") as f:
-        return int(float(f.read()) / 10.23)
-    except Exception:
-      return 0
+    return self.read_param_file("/sys/class/backlight/panel0-backlight/brightness", lambda x: int(float(x) / 10.23))
 
   def set_power_save(self, powersave_enabled):
     # amplifier, 100mW at idle
@@ -430,11 +426,10 @@ class Tici(HardwareBase):
       affine_irq(5, irq) # camerad
 
   def get_gpu_usage_percent(self):
-    try:
-      used, total = open('/sys/class/kgsl/kgsl-3d0/gpubusy').read().strip().split()
+    def parse(gpubusy):
+      used, total = gpubusy.strip().split()
       return 100.0 * int(used) / int(total)
-    except Exception:
-      return 0
+    return self.read_param_file("/sys/class/kgsl/kgsl-3d0/gpubusy", parse)
 
   def initialize_hardware(self):
     self.amplifier.initialize_configuration()
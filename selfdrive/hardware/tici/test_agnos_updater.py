@@ -1,8 +1,21 @@
 #!/usr/bin/env python3
+import functools
+import hashlib
+import http.server
 import json
+import logging
+import lzma
 import os
+import random
+import shutil
+import struct
+import tempfile
+import threading
 import unittest
 import requests
+from unittest import mock
+
+from selfdrive.hardware.tici import agnos
 
 AGNOS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)))
 MANIFEST = os.path.join(AGNOS_DIR, "agnos.json")
@@ -22,5 +35,120 @@ class TestAgnosUpdater(unittest.TestCase):
         assert img['hash'] == img['hash_raw']
 
 
+BLOCK_SIZE = 4096
+
+
+def sparse_image(chunks):
+  """Android sparse image of (type, data) chunks, and the raw image"""
+  body, raw = b"", b""
+  total_blocks = 0
+  for chunk_type, data in chunks:
+    if chunk_type == 0xcac1:
+      blocks = len(data) // BLOCK_SIZE
+      body += struct.pack("<HHII", chunk_type, 0, blocks, 12 + len(data)) + data
+      raw += data
+    else:
+      pattern, blocks = data
+      body += struct.pack("<HHII", chunk_type, 0, blocks, 16) + pattern
+      raw += pattern * (blocks * BLOCK_SIZE // 4)
+    total_blocks += blocks
+  header = struct.pack("<IHHHHIIII", 0xed26ff3a, 1, 0, 28, 12, BLOCK_SIZE, total_blocks, len(chunks), 0)
+  return header + body, raw
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+  def log_message(self, *args):
+    pass
+
+
+class TestFlashPartition(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(QuietHandler, directory=self.tmpdir))
+    threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    # loopback image file instead of the partition
+    self.path = os.path.join(self.tmpdir, "partition")
+    with open(self.path, "wb") as f:
+      f.write(b"\xff" * BLOCK_SIZE)
+    agnos.flashed_hashes.clear()
+    patcher = mock.patch.object(agnos, "get_partition_path", return_value=self.path)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def tearDown(self):
+    self.server.shutdown()
+    self.server.server_close()
+    shutil.rmtree(self.tmpdir)
+
+  def partition(self, image, raw, sparse, full_check):
+    with open(os.path.join(self.tmpdir, "image.xz"), "wb") as f:
+      f.write(lzma.compress(image, preset=0))
+    return {
+      "name": "test",
+      "url": f"http://127.0.0.1:{self.server.server_address[1]}/image.xz",
+      "hash": hashlib.sha256(image).hexdigest(),
+      "hash_raw": hashlib.sha256(raw).hexdigest(),
+      "size": len(raw),
+      "sparse": sparse,
+      "full_check": full_check,
+    }
+
+  def flash(self, partition):
+    with mock.patch("builtins.print"):
+      agnos.flash_partition(0, partition, logging)
+
+  def read_partition(self, size):
+    with open(self.path, "rb") as f:
+      return f.read(size)
+
+  def test_sparse(self):
+    rng = random.Random(0)
+    data = rng.randbytes(agnos.CHUNK_SIZE + 3 * BLOCK_SIZE)
+    image, raw = sparse_image([
+      (0xcac1, data),
+      (0xcac2, (b"\x00" * 4, 2 * agnos.CHUNK_SIZE // BLOCK_SIZE + 5)),
+      (0xcac1, data[:BLOCK_SIZE]),
+      (0xcac2, (b"\xde\xad\xbe\xef", agnos.CHUNK_SIZE // BLOCK_SIZE + 1)),
+      (0xcac2, (b"\x00" * 4, 3)),
+    ])
+
+    for full_check in (True, False):
+      with self.subTest(full_check=full_check):
+        agnos.flashed_hashes.clear()
+        partition = self.partition(image, raw, True, full_check)
+        self.flash(partition)
+        self.assertEqual(self.read_partition(len(raw)), raw)
+        self.assertTrue(agnos.verify_partition(0, partition))
+
+        # verifies by reading the partition, like in a new process
+        agnos.flashed_hashes.clear()
+        self.assertTrue(agnos.verify_partition(0, partition))
+
+  def test_not_sparse(self):
+    raw = random.Random(0).randbytes(2 * agnos.CHUNK_SIZE + 1000)
+    partition = self.partition(raw, raw, False, True)
+    self.flash(partition)
+    self.assertEqual(self.read_partition(len(raw) + 1), raw)
+    agnos.flashed_hashes.clear()
+    self.assertTrue(agnos.verify_partition(0, partition))
+
+  def test_hash_mismatch(self):
+    raw = random.Random(0).randbytes(10 * BLOCK_SIZE)
+    partition = self.partition(raw, raw, False, False)
+    partition["hash_raw"] = hashlib.sha256(b"other").hexdigest()
+    with self.assertRaisesRegex(Exception, "Raw hash mismatch"):
+      self.flash(partition)
+    self.assertFalse(agnos.verify_partition(0, partition))
+
+  def test_download_error(self):
+    raw = random.Random(0).randbytes(10 * BLOCK_SIZE)
+    partition = self.partition(raw, raw, False, True)
+    partition["url"] += ".missing"
+    with self.assertRaises(requests.exceptions.HTTPError):
+      self.flash(partition)
+    self.assertFalse(agnos.verify_partition(0, partition))
+
+
 if __name__ == "__main__":
   unittest.main()
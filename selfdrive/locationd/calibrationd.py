@@ -10,12 +10,13 @@ import gc
 import os
 import capnp
 import numpy as np
-from typing import List, NoReturn, Optional
+from typing import List, NoReturn, Optional, Tuple
 
 from cereal import car, log
 import cereal.messaging as messaging
 from common.conversions import Conversions as CV
-from common.params import Params, put_nonblocking
+from common.params import Params
+from common.params_snapshot import ParamSnapshot
 from common.realtime import set_realtime_priority
 from common.transformations.model import model_height
 from common.transformations.camera import get_view_frame_from_road_frame
@@ -34,6 +35,8 @@ INPUTS_NEEDED = 5   # Minimum blocks needed for valid calibration
 INPUTS_WANTED = 50   # We want a little bit more than we need for stability
 MAX_ALLOWED_SPREAD = np.radians(2)
 RPY_INIT = np.array([0.0,0.0,0.0])
+# CalibrationParams is saved after a block when rpy [rad] or validBlocks changed by more than these
+CALIBRATION_TOLERANCES = [1e-3, 1e-3, 1e-3, INPUTS_NEEDED - 0.5]
 
 # These values are needed to accommodate biggest modelframe
 PITCH_LIMITS = np.array([-0.09074112085129739, 0.14907572052989657])
@@ -51,32 +54,50 @@ def is_calibration_valid(rpy: np.ndarray) -> bool:
   return (PITCH_LIMITS[0] < rpy[1] < PITCH_LIMITS[1]) and (YAW_LIMITS[0] < rpy[2] < YAW_LIMITS[1])
 
 
-def sanity_clip(rpy: np.ndarray) -> np.ndarray:
+def decode_calibration(dat: bytes) -> Optional[List[float]]:
+  msg = log.Event.from_bytes(dat)
+  rpy = list(msg.liveCalibration.rpyCalib)
+  if len(rpy) != 3:
+    return None
+  return rpy + [msg.liveCalibration.validBlocks]
+
+
+def sanity_clip(rpy: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
   if np.isnan(rpy).any():
     rpy = RPY_INIT
-  return np.array([rpy[0],
-                   np.clip(rpy[1], PITCH_LIMITS[0] - .005, PITCH_LIMITS[1] + .005),
-                   np.clip(rpy[2], YAW_LIMITS[0] - .005, YAW_LIMITS[1] + .005)])
+  if out is None:
+    out = np.empty(3)
+  out[0] = rpy[0]
+  out[1] = np.clip(rpy[1], PITCH_LIMITS[0] - .005, PITCH_LIMITS[1] + .005)
+  out[2] = np.clip(rpy[2], YAW_LIMITS[0] - .005, YAW_LIMITS[1] + .005)
+  return out
 
 
 class Calibrator:
   def __init__(self, param_put: bool = False):
     self.param_put = param_put
 
+    # scratch arrays for the per-message math
+    self.eulers = np.zeros((2, 3))  # smooth rpy, observed rpy
+    self.rot = np.zeros((3, 3))
+    self.new_rpy = np.zeros(3)
+    self.block_sum = np.zeros(3)
+    self.block_weighted = np.zeros(3)
+
     self.CP = car.CarParams.from_bytes(Params().get("CarParams", block=True))
 
     # Read saved calibration
     params = Params()
-    calibration_params = params.get("CalibrationParams")
+    self.snapshot = ParamSnapshot("CalibrationParams", CALIBRATION_TOLERANCES)
     self.wide_camera = TICI and params.get_bool('EnableWideCamera')
     rpy_init = RPY_INIT
     valid_blocks = 0
 
-    if param_put and calibration_params:
+    if param_put:
       try:
-        msg = log.Event.from_bytes(calibration_params)
-        rpy_init = np.array(msg.liveCalibration.rpyCalib)
-        valid_blocks = msg.liveCalibration.validBlocks
+        saved = self.snapshot.load(decode_calibration)
+        if saved is not None:
+          rpy_init, valid_blocks = saved[:3], int(saved[3])
       except Exception:
         cloudlog.exception("Error reading cached CalibrationParams")
 
@@ -95,6 +116,8 @@ class Calibrator:
       self.valid_blocks = valid_blocks
 
     self.rpys = np.tile(self.rpy, (INPUTS_WANTED, 1))
+    # the valid blocks only change when a block is done, their stats are kept until then
+    self.stats_key: Optional[Tuple[int, int]] = None
 
     self.idx = 0
     self.block_idx = 0
@@ -113,7 +136,12 @@ class Calibrator:
     after_current = list(range(min(self.valid_blocks, self.block_idx + 1), self.valid_blocks))
     return before_current + after_current
 
-  def update_status(self) -> None:
+  def update_stats(self) -> None:
+    stats_key = (self.block_idx, self.valid_blocks)
+    if stats_key == self.stats_key:
+      return
+    self.stats_key = stats_key
+
     valid_idxs = self.get_valid_idxs()
     if valid_idxs:
       rpys = self.rpys[valid_idxs]
@@ -124,6 +152,9 @@ class Calibrator:
     else:
       self.calib_spread = np.zeros(3)
 
+  def update_status(self) -> None:
+    self.update_stats()
+
     if self.valid_blocks < INPUTS_NEEDED:
       self.cal_status = Calibration.UNCALIBRATED
     elif is_calibration_valid(self.rpy):
@@ -136,9 +167,9 @@ class Calibrator:
     if max(self.calib_spread) > MAX_ALLOWED_SPREAD and self.cal_status == Calibration.CALIBRATED:
       self.reset(self.rpys[self.block_idx - 1], valid_blocks=INPUTS_NEEDED, smooth_from=self.rpy)
 
-    write_this_cycle = (self.idx == 0) and (self.block_idx % (INPUTS_WANTED//5) == 5)
-    if self.param_put and write_this_cycle:
-      put_nonblocking("CalibrationParams", self.get_msg().to_bytes())
+    # after every block, skipped if the calibration didn't change
+    if self.param_put and self.idx == 0 and self.valid_blocks > 0:
+      self.snapshot.save([*self.get_smooth_rpy(), self.valid_blocks], lambda _: self.get_msg().to_bytes())
 
   def handle_v_ego(self, v_ego: float) -> None:
     self.v_ego = v_ego
@@ -150,6 +181,7 @@ class Calibrator:
       return self.rpy
 
   def handle_cam_odom(self, trans: List[float], rot: List[float], trans_std: List[float]) -> Optional[np.ndarray]:
+    """Returns the observed rpy if the message is used, the array is reused by the next call"""
     self.old_rpy_weight = min(0.0, self.old_rpy_weight - 1/SMOOTH_CYCLES)
 
     straight_and_fast = ((self.v_ego > MIN_SPEED_FILTER) and (trans[0] > MIN_SPEED_FILTER) and (abs(rot[2]) < MAX_YAW_RATE_FILTER))
@@ -162,13 +194,19 @@ class Calibrator:
     if not (straight_and_fast and certain_if_calib):
       return None
 
-    observed_rpy = np.array([0,
-                             -np.arctan2(trans[2], trans[0]),
-                             np.arctan2(trans[1], trans[0])])
-    new_rpy = euler_from_rot(rot_from_euler(self.get_smooth_rpy()).dot(rot_from_euler(observed_rpy)))
-    new_rpy = sanity_clip(new_rpy)
-
-    self.rpys[self.block_idx] = (self.idx*self.rpys[self.block_idx] + (BLOCK_SIZE - self.idx) * new_rpy) / float(BLOCK_SIZE)
+    eulers = self.eulers
+    eulers[0] = self.get_smooth_rpy()
+    eulers[1, 0] = 0
+    eulers[1, 1] = -np.arctan2(trans[2], trans[0])
+    eulers[1, 2] = np.arctan2(trans[1], trans[0])
+    rots = rot_from_euler(eulers)
+    new_rpy = sanity_clip(euler_from_rot(np.dot(rots[0], rots[1], out=self.rot)), out=self.new_rpy)
+
+    block_rpy = self.rpys[self.block_idx]
+    np.multiply(self.idx, block_rpy, out=self.block_sum)
+    np.multiply(BLOCK_SIZE - self.idx, new_rpy, out=self.block_weighted)
+    self.block_sum += self.block_weighted
+    np.divide(self.block_sum, float(BLOCK_SIZE), out=block_rpy)
     self.idx = (self.idx + 1) % BLOCK_SIZE
     if self.idx == 0:
       self.block_idx += 1
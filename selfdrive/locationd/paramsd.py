@@ -7,7 +7,9 @@ import numpy as np
 
 import cereal.messaging as messaging
 from cereal import car
-from common.params import Params, put_nonblocking
+from common.instrumentation import LoopStats
+from common.params import Params
+from common.params_snapshot import ParamSnapshot, pack_values, unpack_values
 from common.realtime import set_realtime_priority, DT_MDL
 from common.numpy_fast import clip
 from selfdrive.locationd.models.car_kf import CarKalman, ObservationKind, States
@@ -19,6 +21,26 @@ MAX_ANGLE_OFFSET_DELTA = 20 * DT_MDL  # Max 20 deg/s
 ROLL_MAX_DELTA = np.radians(20.0) * DT_MDL  # 20deg in 1 second is well within curvature limits
 ROLL_MIN, ROLL_MAX = math.radians(-10), math.radians(10)
 
+# steerRatio, stiffnessFactor and angleOffsetAverageDeg are saved when one changes by more than its tolerance
+LIVE_PARAMETERS_TOLERANCES = [0.01, 0.001, 0.01]
+SAVE_INTERVAL = 200  # liveLocationKalman frames, 10s
+
+
+def decode_live_parameters(dat, car_fingerprint):
+  return unpack_values(dat, car_fingerprint, len(LIVE_PARAMETERS_TOLERANCES))
+
+
+def decode_legacy_live_parameters(dat, car_fingerprint):
+  """LiveParameters is json, saved before LiveParametersSnapshot and still read by older versions"""
+  try:
+    params = json.loads(dat)
+    if params.get('carFingerprint', None) == car_fingerprint:
+      return [params['steerRatio'], params['stiffnessFactor'], params['angleOffsetAverageDeg']]
+  except (ValueError, KeyError, TypeError, AttributeError):
+    pass
+  return None
+
+
 class ParamsLearner:
   def __init__(self, CP, steer_ratio, stiffness_factor, angle_offset, P_initial=None):
     self.kf = CarKalman(GENERATED_DIR, steer_ratio, stiffness_factor, angle_offset, P_initial)
@@ -62,27 +84,23 @@ class ParamsLearner:
       yaw_rate_valid = yaw_rate_valid and abs(yaw_rate) < 1  # rad/s
 
       if self.active:
+        # all observations of a message are applied in one stacked update
+        observations = []
         if msg.posenetOK:
 
           if yaw_rate_valid:
-            self.kf.predict_and_observe(t,
-                                        ObservationKind.ROAD_FRAME_YAW_RATE,
-                                        np.array([[-yaw_rate]]),
-                                        np.array([np.atleast_2d(yaw_rate_std**2)]))
+            observations.append((ObservationKind.ROAD_FRAME_YAW_RATE, -yaw_rate, yaw_rate_std**2))
 
-          self.kf.predict_and_observe(t,
-                                      ObservationKind.ROAD_ROLL,
-                                      np.array([[self.roll]]),
-                                      np.array([np.atleast_2d(roll_std**2)]))
-        self.kf.predict_and_observe(t, ObservationKind.ANGLE_OFFSET_FAST, np.array([[0]]))
+          observations.append((ObservationKind.ROAD_ROLL, self.roll, roll_std**2))
+        observations.append((ObservationKind.ANGLE_OFFSET_FAST, 0, None))
 
         # We observe the current stiffness and steer ratio (with a high observation noise) to bound
         # the respective estimate STD. Otherwise the STDs keep increasing, causing rapid changes in the
         # states in longer routes (especially straight stretches).
-        stiffness = float(self.kf.x[States.STIFFNESS])
-        steer_ratio = float(self.kf.x[States.STEER_RATIO])
-        self.kf.predict_and_observe(t, ObservationKind.STIFFNESS, np.array([[stiffness]]))
-        self.kf.predict_and_observe(t, ObservationKind.STEER_RATIO, np.array([[steer_ratio]]))
+        x = self.kf.x
+        observations.append((ObservationKind.STIFFNESS, x[States.STIFFNESS], None))
+        observations.append((ObservationKind.STEER_RATIO, x[States.STEER_RATIO], None))
+        self.kf.predict_and_observe_multi(t, observations)
 
     elif which == 'carState':
       self.steering_angle = msg.steeringAngleDeg
@@ -93,8 +111,10 @@ class ParamsLearner:
       self.active = self.speed > 5 and in_linear_region
 
       if self.active:
-        self.kf.predict_and_observe(t, ObservationKind.STEER_ANGLE, np.array([[math.radians(msg.steeringAngleDeg)]]))
-        self.kf.predict_and_observe(t, ObservationKind.ROAD_FRAME_X_SPEED, np.array([[self.speed]]))
+        self.kf.predict_and_observe_multi(t, [
+          (ObservationKind.STEER_ANGLE, math.radians(msg.steeringAngleDeg), None),
+          (ObservationKind.ROAD_FRAME_X_SPEED, self.speed, None),
+        ])
 
     if not self.active:
       # Reset time when stopped so uncertainty doesn't grow
@@ -119,14 +139,17 @@ def main(sm=None, pm=None):
 
   min_sr, max_sr = 0.5 * CP.steerRatio, 2.0 * CP.steerRatio
 
-  params = params_reader.get("LiveParameters")
-
-  # Check if car model matches
+  # binary, under a new key so older versions can still json.loads LiveParameters, which is left alone
+  snapshot = ParamSnapshot("LiveParametersSnapshot", LIVE_PARAMETERS_TOLERANCES)
+  params = snapshot.load(lambda dat: decode_live_parameters(dat, CP.carFingerprint))
+  if params is None:
+    legacy_params = params_reader.get("LiveParameters")
+    if legacy_params is not None:
+      params = decode_legacy_live_parameters(legacy_params, CP.carFingerprint)
   if params is not None:
-    params = json.loads(params)
-    if params.get('carFingerprint', None) != CP.carFingerprint:
-      cloudlog.info("Parameter learner found parameters for wrong car.")
-      params = None
+    params = dict(zip(('steerRatio', 'stiffnessFactor', 'angleOffsetAverageDeg'), list(params)))
+  elif params_reader.get("LiveParametersSnapshot") is not None or params_reader.get("LiveParameters") is not None:
+    cloudlog.info("Parameter learner found parameters for wrong car, or corrupted parameters.")
 
   # Check if starting values are sane
   if params is not None:
@@ -158,13 +181,17 @@ def main(sm=None, pm=None):
   angle_offset_average = params['angleOffsetAverageDeg']
   angle_offset = angle_offset_average
 
+  stats = LoopStats("paramsd")
+
   while True:
     sm.update()
+    stats.start()
     if sm.all_checks():
       for which in sorted(sm.updated.keys(), key=lambda x: sm.logMonoTime[x]):
         if sm.updated[which]:
           t = sm.logMonoTime[which] * 1e-9
           learner.handle_log(t, which, sm[which])
+          stats.checkpoint(which)
 
     if sm.updated['liveLocationKalman']:
       x = learner.kf.x
@@ -201,16 +228,13 @@ def main(sm=None, pm=None):
 
       msg.valid = sm.all_checks()
 
-      if sm.frame % 1200 == 0:  # once a minute
-        params = {
-          'carFingerprint': CP.carFingerprint,
-          'steerRatio': liveParameters.steerRatio,
-          'stiffnessFactor': liveParameters.stiffnessFactor,
-          'angleOffsetAverageDeg': liveParameters.angleOffsetAverageDeg,
-        }
-        put_nonblocking("LiveParameters", json.dumps(params))
+      if sm.frame % SAVE_INTERVAL == 0:
+        snapshot.save([liveParameters.steerRatio, liveParameters.stiffnessFactor, liveParameters.angleOffsetAverageDeg],
+                      lambda values: pack_values(CP.carFingerprint, values))
 
       pm.send('liveParameters', msg)
+      stats.checkpoint("liveParameters")
+      stats.end()
 
 
 if __name__ == "__main__":
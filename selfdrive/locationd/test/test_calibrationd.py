@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+import random
+import unittest
+
+import numpy as np
+
+from cereal import car
+from common.params import Params
+from selfdrive.locationd.calibrationd import BLOCK_SIZE, INPUTS_NEEDED, INPUTS_WANTED, MAX_VEL_ANGLE_STD, MAX_YAW_RATE_FILTER, \
+                                            MIN_SPEED_FILTER, SMOOTH_CYCLES, Calibration, Calibrator, sanity_clip
+from common.transformations.orientation import rot_from_euler, euler_from_rot
+
+
+class RecomputingCalibrator(Calibrator):
+  """Recomputes the block stats and allocates new arrays on every message, like before the stats were kept"""
+  def update_stats(self):
+    self.stats_key = None
+    super().update_stats()
+
+  def handle_cam_odom(self, trans, rot, trans_std):
+    self.old_rpy_weight = min(0.0, self.old_rpy_weight - 1/SMOOTH_CYCLES)
+    if not (self.v_ego > MIN_SPEED_FILTER and trans[0] > MIN_SPEED_FILTER and abs(rot[2]) < MAX_YAW_RATE_FILTER):
+      return None
+    if not (np.arctan2(trans_std[1], trans[0]) < MAX_VEL_ANGLE_STD or self.valid_blocks < INPUTS_NEEDED):
+      return None
+
+    observed_rpy = np.array([0,
+                             -np.arctan2(trans[2], trans[0]),
+                             np.arctan2(trans[1], trans[0])])
+    new_rpy = euler_from_rot(rot_from_euler(self.get_smooth_rpy()).dot(rot_from_euler(observed_rpy)))
+    new_rpy = sanity_clip(new_rpy)
+
+    self.rpys[self.block_idx] = (self.idx*self.rpys[self.block_idx] + (BLOCK_SIZE - self.idx) * new_rpy) / float(BLOCK_SIZE)
+    self.idx = (self.idx + 1) % BLOCK_SIZE
+    if self.idx == 0:
+      self.block_idx += 1
+      self.valid_blocks = max(self.block_idx, self.valid_blocks)
+      self.block_idx = self.block_idx % INPUTS_WANTED
+
+    self.update_status()
+    return new_rpy
+
+
+def camera_odometry(rng, yaw):
+  speed = rng.uniform(5, 30)
+  trans = [speed, speed * (yaw + rng.gauss(0, 0.01)), speed * rng.gauss(0, 0.01)]
+  rot = [0, 0, rng.gauss(0, 0.02)]
+  trans_std = [0.1, rng.uniform(0, 0.2), 0.1]
+  return trans, rot, trans_std
+
+
+def live_calibration_bytes(calibrator):
+  msg = calibrator.get_msg()
+  msg.logMonoTime = 0
+  return msg.to_bytes()
+
+
+class TestCalibrationd(unittest.TestCase):
+  def setUp(self):
+    Params().put("CarParams", car.CarParams.new_message().to_bytes())
+
+  def test_replay_identical(self):
+    rng = random.Random(0)
+    calibrators = [Calibrator(), RecomputingCalibrator()]
+
+    # the mounting changes, so the calibration is reset on a too large spread
+    statuses = set()
+    for yaw in (0, 0.03, -0.03):
+      for _ in range(INPUTS_WANTED * BLOCK_SIZE + 200):
+        msg = camera_odometry(rng, yaw)
+        v_ego = msg[0][0] + rng.gauss(0, 1)
+        rpys = []
+        for c in calibrators:
+          c.handle_v_ego(v_ego)
+          rpy = c.handle_cam_odom(*msg)
+          rpys.append(None if rpy is None else rpy.tobytes())
+        self.assertEqual(rpys[0], rpys[1])
+        self.assertEqual(*[live_calibration_bytes(c) for c in calibrators])
+        statuses.add(calibrators[0].cal_status)
+
+    self.assertEqual(statuses, {Calibration.UNCALIBRATED, Calibration.CALIBRATED, Calibration.INVALID})
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+import json
+import math
+import unittest
+
+import numpy as np
+
+import cereal.messaging as messaging
+from rednose.helpers.ekf_sym import EKF_sym
+from selfdrive.car.hyundai.interface import CarInterface
+from selfdrive.car.hyundai.values import CAR
+from selfdrive.locationd.models.car_kf import CarKalman, ObservationKind, States
+from selfdrive.locationd.models.constants import GENERATED_DIR
+from common.params_snapshot import pack_values
+from selfdrive.locationd.paramsd import ParamsLearner, decode_legacy_live_parameters, decode_live_parameters
+
+GLOBALS = {
+  "mass": 1500.,
+  "rotational_inertia": 2500.,
+  "center_to_front": 1.2,
+  "center_to_rear": 1.5,
+  "stiffness_front": 200000.,
+  "stiffness_rear": 250000.,
+}
+
+
+def new_filter():
+  kf = CarKalman(GENERATED_DIR, 15.0, 1.0, 0.0)
+  for name, val in GLOBALS.items():
+    kf.filter.set_global(name, val)
+  return kf
+
+
+def use_python_filter(kf, global_vals):
+  """Replaces the C++ filter by the python one, like selfdrive/debug/rts_smooth_route.py"""
+  kf.filter = EKF_sym(GENERATED_DIR, kf.name, kf.Q, kf.initial_x, kf.P_initial, kf.initial_x.shape[0], kf.P_initial.shape[0],
+                      global_vars=kf.global_vars)
+  for name, val in global_vals.items():
+    kf.filter.set_global(name, val)
+
+
+def random_observations(rng, n):
+  """Like paramsd: carState at 100 Hz, liveLocationKalman at 20 Hz"""
+  for i in range(n):
+    t = 1.0 + 0.01 * i
+    yield t, [
+      (ObservationKind.STEER_ANGLE, math.radians(rng.normal(0, 5)), None),
+      (ObservationKind.ROAD_FRAME_X_SPEED, rng.uniform(15, 25), None),
+    ]
+    if i % 5 == 0:
+      yield t + 0.005, [
+        (ObservationKind.ROAD_FRAME_YAW_RATE, rng.normal(0, 0.05), rng.uniform(0.001, 0.01)**2),
+        (ObservationKind.ROAD_ROLL, rng.normal(0, 0.02), math.radians(2)**2),
+        (ObservationKind.ANGLE_OFFSET_FAST, 0, None),
+        (ObservationKind.STIFFNESS, rng.normal(1, 0.01), None),
+        (ObservationKind.STEER_RATIO, rng.normal(15, 0.1), None),
+      ]
+
+
+def observe_sequential(kf, t, observations):
+  for kind, data, R in observations:
+    kf.predict_and_observe(t, kind, np.array([[data]]), None if R is None else np.array([np.atleast_2d(R)]))
+
+
+class TestCarKalman(unittest.TestCase):
+  def assertFilterClose(self, kf, expected):
+    np.testing.assert_allclose(kf.x, expected.x, rtol=1e-6, atol=1e-9)
+    np.testing.assert_allclose(kf.P, expected.P, rtol=1e-6, atol=1e-12)
+    self.assertEqual(kf.t, expected.t)
+
+  def test_multi_matches_sequential(self):
+    rng = np.random.default_rng(0)
+    fused, sequential = new_filter(), new_filter()
+    for t, observations in random_observations(rng, 2000):
+      fused.predict_and_observe_multi(t, observations)
+      observe_sequential(sequential, t, observations)
+    self.assertFilterClose(fused, sequential)
+
+    # the estimates moved away from the initial state
+    self.assertGreater(abs(fused.x[States.VELOCITY][0] - CarKalman.initial_x[States.VELOCITY][0]), 1)
+
+  def test_multi_rewind(self):
+    rng = np.random.default_rng(1)
+    in_order, rewound = new_filter(), new_filter()
+    steps = list(random_observations(rng, 50))[:51]
+    for t, observations in steps:
+      in_order.predict_and_observe_multi(t, observations)
+
+    # every other step is observed late, the stacked update after it is replayed
+    rewound.predict_and_observe_multi(*steps[0])
+    for (t0, obs0), (t1, obs1) in zip(steps[1::2], steps[2::2]):
+      rewound.predict_and_observe_multi(t1, obs1)
+      rewound.predict_and_observe_multi(t0, obs0)
+    self.assertFilterClose(rewound, in_order)
+
+  def test_python_filter_multi(self):
+    rng = np.random.default_rng(2)
+    cpp, python = new_filter(), new_filter()
+    use_python_filter(python, GLOBALS)
+    steps = list(random_observations(rng, 500))[:501]
+    for t, observations in steps:
+      cpp.predict_and_observe_multi(t, observations)
+      python.predict_and_observe_multi(t, observations)
+    self.assertFilterClose(python, cpp)
+
+    # late stacked observations are replayed as one
+    rewound = new_filter()
+    use_python_filter(rewound, GLOBALS)
+    rewound.predict_and_observe_multi(*steps[0])
+    for (t0, obs0), (t1, obs1) in zip(steps[1::2], steps[2::2]):
+      rewound.predict_and_observe_multi(t1, obs1)
+      rewound.predict_and_observe_multi(t0, obs0)
+    self.assertFilterClose(rewound, python)
+
+
+def live_location_kalman(rng):
+  msg = messaging.new_message('liveLocationKalman')
+  llk = msg.liveLocationKalman
+  llk.posenetOK = True
+  llk.angularVelocityCalibrated.value = [0., 0., float(rng.normal(0, 0.05))]
+  llk.angularVelocityCalibrated.std = [0.01, 0.01, 0.01]
+  llk.angularVelocityCalibrated.valid = True
+  llk.orientationNED.value = [float(rng.normal(0, 0.02)), 0., 0.]
+  llk.orientationNED.std = [0.01, 0.01, 0.01]
+  llk.orientationNED.valid = True
+  return llk
+
+
+def car_state(rng):
+  msg = messaging.new_message('carState')
+  CS = msg.carState
+  CS.steeringAngleDeg = float(rng.normal(0, 5))
+  CS.vEgo = float(rng.uniform(15, 25))
+  return CS
+
+
+class TestParamsLearner(unittest.TestCase):
+  def test_python_filter(self):
+    CP = CarInterface.get_params(CAR.SONATA)
+    cpp = ParamsLearner(CP, CP.steerRatio, 1.0, 0.0)
+    python = ParamsLearner(CP, CP.steerRatio, 1.0, 0.0)
+    use_python_filter(python.kf, {
+      "mass": CP.mass,
+      "rotational_inertia": CP.rotationalInertia,
+      "center_to_front": CP.centerToFront,
+      "center_to_rear": CP.wheelbase - CP.centerToFront,
+      "stiffness_front": CP.tireStiffnessFront,
+      "stiffness_rear": CP.tireStiffnessRear,
+    })
+
+    rng = np.random.default_rng(3)
+    for i in range(1000):
+      t = 1.0 + 0.01 * i
+      msgs = [('carState', car_state(rng))]
+      if i % 5 == 0:
+        msgs.append(('liveLocationKalman', live_location_kalman(rng)))
+      for which, msg in msgs:
+        for learner in (cpp, python):
+          learner.handle_log(t, which, msg)
+        t += 0.005
+
+    np.testing.assert_allclose(python.kf.x, cpp.kf.x, rtol=1e-6, atol=1e-9)
+    np.testing.assert_allclose(python.kf.P, cpp.kf.P, rtol=1e-6, atol=1e-12)
+    self.assertNotEqual(python.kf.x[States.STEER_RATIO][0], CP.steerRatio)
+
+
+class TestLiveParameters(unittest.TestCase):
+  def test_decode(self):
+    dat = pack_values(CAR.SONATA, [15.3, 1.0, 0.5])
+    np.testing.assert_array_equal(decode_live_parameters(dat, CAR.SONATA), [15.3, 1.0, 0.5])
+    self.assertIsNone(decode_live_parameters(dat, CAR.SONATA_HEV))
+
+  def test_decode_legacy(self):
+    params = {'carFingerprint': CAR.SONATA, 'steerRatio': 15.3, 'stiffnessFactor': 1.0, 'angleOffsetAverageDeg': 0.5}
+    dat = json.dumps(params).encode()
+    self.assertEqual(decode_legacy_live_parameters(dat, CAR.SONATA), [15.3, 1.0, 0.5])
+    self.assertIsNone(decode_legacy_live_parameters(dat, CAR.SONATA_HEV))
+    for dat in (b"garbage", b"[]", json.dumps({'carFingerprint': CAR.SONATA}).encode()):
+      self.assertIsNone(decode_legacy_live_parameters(dat, CAR.SONATA))
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -2,7 +2,6 @@
 import json
 import os
 import random
-import requests
 import threading
 import time
 import traceback
@@ -10,7 +9,7 @@ from pathlib import Path
 
 from cereal import log
 import cereal.messaging as messaging
-from common.api import Api
+from common.api import Api, get_session
 from common.params import Params
 from selfdrive.hardware import TICI
 from selfdrive.loggerd.xattr_cache import getxattr, setxattr
@@ -149,7 +148,7 @@ class Uploader():
         self.last_resp = FakeResponse()
       else:
         with open(fn, "rb") as f:
-          self.last_resp = requests.put(url, data=f, headers=headers, timeout=10)
+          self.last_resp = get_session().put(url, data=f, headers=headers, timeout=10)
     except Exception as e:
       self.last_exc = (e, traceback.format_exc())
       raise
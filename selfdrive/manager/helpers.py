@@ -4,6 +4,17 @@ import fcntl
 import errno
 import signal
 
+import selfdrive.sentry as sentry
+from selfdrive.hardware import HARDWARE
+from selfdrive.swaglog import cloudlog
+from selfdrive.version import get_version, is_dirty
+
+
+def init_logging(dongle_id: str) -> None:
+  sentry.init(sentry.SentryProject.SELFDRIVE)
+  cloudlog.bind_global(dongle_id=dongle_id, version=get_version(), dirty=is_dirty(),
+                       device=HARDWARE.get_device_type())
+
 
 def unblock_stdout() -> None:
   # get a non-blocking stdout
@@ -15,8 +15,8 @@ from common.params import Params, ParamKeyType
 from common.text_window import TextWindow
 from selfdrive.boardd.set_time import set_time
 from selfdrive.hardware import HARDWARE, PC, EON
-from selfdrive.manager.helpers import unblock_stdout
-from selfdrive.manager.process import ensure_running, launcher
+from selfdrive.manager.helpers import init_logging, unblock_stdout
+from selfdrive.manager.process import ensure_running, launcher, start_zygote
 from selfdrive.manager.process_config import managed_processes
 from selfdrive.athena.registration import register, UNREGISTERED_DONGLE_ID
 from selfdrive.swaglog import cloudlog, add_file_handler
@@ -111,13 +111,11 @@ def manager_init() -> None:
   if not is_dirty():
     os.environ['CLEAN'] = '1'
 
-  # init logging
-  sentry.init(sentry.SentryProject.SELFDRIVE)
-  cloudlog.bind_global(dongle_id=dongle_id, version=get_version(), dirty=is_dirty(),
-                       device=HARDWARE.get_device_type())
+  init_logging(dongle_id)
 
 
 def manager_prepare() -> None:
+  start_zygote()
   for p in managed_processes.values():
     p.prepare()
 
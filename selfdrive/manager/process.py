@@ -6,7 +6,9 @@ import time
 import subprocess
 from typing import Optional, List, ValuesView
 from abc import ABC, abstractmethod
-from multiprocessing import Process
+from multiprocessing import Process, forkserver, get_context
+from multiprocessing.context import BaseContext
+from multiprocessing.process import BaseProcess
 
 from setproctitle import setproctitle  # pylint: disable=no-name-in-module
 
@@ -21,9 +23,47 @@ from cereal import log
 
 WATCHDOG_FN = "/dev/shm/wd_"
 ENABLE_WATCHDOG = os.getenv("NO_WATCHDOG") is None
+ENABLE_ZYGOTE = os.getenv("NO_ZYGOTE") is None
 
+# preloaded by the forkserver python processes are started from
+ZYGOTE_MODULE = "selfdrive.manager.zygote_preload"
+
+_zygote: Optional[BaseContext] = None
+
+
+def start_zygote() -> None:
+  """Start the zygote in the background, it preloads the python processes in parallel with manager"""
+  global _zygote
+  if not ENABLE_ZYGOTE or _zygote is not None:
+    return
+
+  ctx = get_context('forkserver')
+  ctx.set_forkserver_preload([ZYGOTE_MODULE])
+  try:
+    forkserver.ensure_running()
+  except Exception:
+    cloudlog.exception("failed to start zygote, forking python processes from manager")
+    return
+  _zygote = ctx
+
+
+def stop_zygote() -> None:
+  global _zygote
+  _zygote = None
+
+
+def log_first_message(name: str, start_time: float) -> None:
+  """Log the time from starting the process until it publishes its first message"""
+  def first_send(s: str) -> None:
+    cloudlog.event("first message", daemon=name, service=s, time_to_first_message=time.monotonic() - start_time)
+
+  messaging.PubMaster.on_first_send = first_send
+
+
+def launcher(proc: str, name: str, start_time: Optional[float] = None) -> None:
+  if start_time is None:
+    start_time = time.monotonic()
 
-def launcher(proc: str, name: str) -> None:
   try:
     # import the process
     mod = importlib.import_module(proc)
@@ -38,6 +78,9 @@ def launcher(proc: str, name: str) -> None:
     cloudlog.bind(daemon=name)
     sentry.set_tag("daemon", name)
 
+    cloudlog.event("process started", daemon=name, time_to_main=time.monotonic() - start_time)
+    log_first_message(name, start_time)
+
     # exec the process
     getattr(mod, 'main')()
   except KeyboardInterrupt:
@@ -57,7 +100,7 @@ def nativelauncher(pargs: List[str], cwd: str, name: str) -> None:
   os.execvp(pargs[0], pargs)
 
 
-def join_process(process: Process, timeout: float) -> None:
+def join_process(process: BaseProcess, timeout: float) -> None:
   # Process().join(timeout) will hang due to a python 3 bug: https://bugs.python.org/issue28382
   # We have to poll the exitcode instead
   t = time.monotonic()
@@ -71,7 +114,7 @@ class ManagerProcess(ABC):
   sigkill = False
   persistent = False
   driverview = False
-  proc: Optional[Process] = None
+  proc: Optional[BaseProcess] = None
   enabled = True
   name = ""
 
@@ -213,7 +256,8 @@ class NativeProcess(ManagerProcess):
 
 
 class PythonProcess(ManagerProcess):
-  def __init__(self, name, module, enabled=True, persistent=False, driverview=False, unkillable=False, sigkill=False, watchdog_max_dt=None):
+  def __init__(self, name, module, enabled=True, persistent=False, driverview=False, unkillable=False, sigkill=False, watchdog_max_dt=None,
+               zygote=True):
     self.name = name
     self.module = module
     self.enabled = enabled
@@ -222,6 +266,8 @@ class PythonProcess(ManagerProcess):
     self.unkillable = unkillable
     self.sigkill = sigkill
     self.watchdog_max_dt = watchdog_max_dt
+    # not fork-safe modules are started by forking manager instead
+    self.zygote = zygote
 
   def prepare(self) -> None:
     if self.enabled:
@@ -237,8 +283,19 @@ class PythonProcess(ManagerProcess):
       return
 
     cloudlog.info(f"starting python {self.module}")
-    self.proc = Process(name=self.name, target=launcher, args=(self.module, self.name))
-    self.proc.start()
+    args = (self.module, self.name, time.monotonic())
+    if self.zygote and _zygote is not None:
+      try:
+        self.proc = _zygote.Process(name=self.name, target=launcher, args=args)
+        self.proc.start()
+      except Exception:
+        cloudlog.exception(f"zygote failed to start {self.name}, forking python processes from manager")
+        stop_zygote()
+        self.proc = None
+
+    if self.proc is None:
+      self.proc = Process(name=self.name, target=launcher, args=args)
+      self.proc.start()
     self.watchdog_seen = False
     self.shutting_down = False
 
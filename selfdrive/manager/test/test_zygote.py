@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import cereal.messaging as messaging
+import selfdrive.manager.process as process
+import selfdrive.manager.zygote as zygote
+from selfdrive.manager.process import PythonProcess, join_process
+
+PROC_MODULE = """
+import os
+
+def main():
+  with open({out!r}, "w") as f:
+    f.write(str(os.getppid()))
+"""
+
+
+class TestZygote(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    sys.path.insert(0, self.tmpdir)
+    self.out = os.path.join(self.tmpdir, "ppid")
+    self.write_module("zygote_test_proc", PROC_MODULE.format(out=self.out))
+    self.write_module("zygote_test_preload", "")
+
+    patcher = mock.patch.multiple(process, ENABLE_ZYGOTE=True, ZYGOTE_MODULE="zygote_test_preload")
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def tearDown(self):
+    process.stop_zygote()
+    sys.path.remove(self.tmpdir)
+    shutil.rmtree(self.tmpdir)
+
+  def write_module(self, name, src):
+    with open(os.path.join(self.tmpdir, f"{name}.py"), "w") as f:
+      f.write(src)
+
+  def start_process(self):
+    """Starts a python process, returns the pid of its parent"""
+    p = PythonProcess("zygote_test", "zygote_test_proc")
+    p.start()
+    join_process(p.proc, 10)
+    self.assertEqual(p.proc.exitcode, 0)
+    with open(self.out) as f:
+      return int(f.read())
+
+  def test_start_from_zygote(self):
+    process.start_zygote()
+    self.assertIsNotNone(process._zygote)
+    self.assertNotEqual(self.start_process(), os.getpid())
+
+  def test_zygote_fails_to_start(self):
+    with mock.patch("multiprocessing.forkserver.ensure_running", side_effect=OSError):
+      process.start_zygote()
+    self.assertIsNone(process._zygote)
+    self.assertEqual(self.start_process(), os.getpid())
+
+  def test_zygote_fails_to_start_process(self):
+    process.start_zygote()
+    with mock.patch.object(process._zygote, "Process", side_effect=OSError):
+      ppid = self.start_process()
+
+    # forked from manager, and from then on too
+    self.assertEqual(ppid, os.getpid())
+    self.assertIsNone(process._zygote)
+
+  def test_preload_modules(self):
+    self.write_module("zygote_test_thread", "import threading, time\nthreading.Thread(target=time.sleep, args=(1,), daemon=True).start()\n")
+    self.write_module("zygote_test_broken", "raise ImportError('broken')\n")
+    threads = threading.active_count()
+    with mock.patch.object(zygote, "cloudlog") as log:
+      preloaded = zygote.preload_modules(["zygote_test_preload", "zygote_test_thread", "zygote_test_broken"])
+
+    self.assertEqual(preloaded, ["zygote_test_preload"])
+    # the thread never ran in the zygote, the process imports the module when it's started
+    self.assertEqual(threading.active_count(), threads)
+    self.assertNotIn("zygote_test_thread", sys.modules)
+    log.warning.assert_called_once()
+    log.exception.assert_called_once()
+
+  def test_no_car_modules(self):
+    with mock.patch.object(zygote, "preload_modules", return_value=[]) as preload_modules:
+      zygote.preload()
+    self.assertFalse(any(m.startswith("selfdrive.car.") for m in preload_modules.call_args.args[0]))
+
+  def test_first_message(self):
+    pm = messaging.PubMaster([])
+    pm.sock["carState"] = mock.Mock()
+    with mock.patch.object(process, "cloudlog") as log:
+      process.log_first_message("controlsd", 0.)
+      for _ in range(3):
+        pm.send("carState", b"")
+
+    self.assertIsNone(messaging.PubMaster.on_first_send)
+    log.event.assert_called_once()
+    self.assertEqual(log.event.call_args.kwargs["service"], "carState")
+    self.assertEqual(pm.sock["carState"].send.call_count, 3)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,84 @@
+"""Preloaded by the zygote, the forkserver python processes are started from.
+
+The zygote is a fresh interpreter started by manager, so processes forked from it don't
+inherit the sockets and memory of manager. It imports all python processes, so starting
+them doesn't import anything. Car brand modules aren't preloaded, every process would
+carry all brands, they are imported for the fingerprinted car only.
+"""
+import importlib
+import os
+import threading
+import time
+from typing import List
+
+from selfdrive.manager.helpers import init_logging
+from selfdrive.manager.process import PythonProcess
+from selfdrive.manager.process_config import managed_processes
+from selfdrive.swaglog import cloudlog
+
+# imported by the processes at runtime, not when importing them
+ZYGOTE_PRELOAD = [
+  # multiprocessing runs the manager script again in every process
+  "selfdrive.manager.manager",
+]
+
+
+def thread_starting_modules(modules: List[str]) -> List[str]:
+  """Imports the modules in a forked child, returns the ones that start a thread on import"""
+  r, w = os.pipe()
+  pid = os.fork()
+  if pid == 0:
+    try:
+      os.close(r)
+      found = []
+      for module in modules:
+        threads = threading.active_count()
+        try:
+          importlib.import_module(module)
+        except BaseException:
+          pass
+        if threading.active_count() != threads:
+          found.append(module)
+      with os.fdopen(w, "wb") as f:
+        f.write("\n".join(found).encode())
+    finally:
+      os._exit(0)
+
+  os.close(w)
+  with os.fdopen(r, "rb") as f:
+    dat = f.read().decode()
+  os.waitpid(pid, 0)
+  return dat.split("\n") if dat else []
+
+
+def preload_modules(modules: List[str]) -> List[str]:
+  """Imports the modules, returns the ones that stay preloaded"""
+  # forked processes only have the forking thread, locks held by other threads are never released.
+  # modules starting a thread are imported by their process when it's started, and it gets its own thread
+  rejected = thread_starting_modules(modules)
+  for module in rejected:
+    cloudlog.warning(f"zygote: {module} starts a thread on import and is not fork-safe, not preloading it, set zygote=False")
+
+  preloaded = []
+  for module in modules:
+    if module in rejected:
+      continue
+    try:
+      importlib.import_module(module)
+    except Exception:
+      # the process fails to import again when it's started
+      cloudlog.exception(f"zygote failed to preload {module}")
+      continue
+    preloaded.append(module)
+  return preloaded
+
+
+def preload() -> None:
+  dongle_id = os.getenv("DONGLE_ID")
+  if dongle_id is not None:
+    init_logging(dongle_id)
+
+  start_time = time.monotonic()
+  modules = [p.module for p in managed_processes.values() if isinstance(p, PythonProcess) and p.enabled and p.zygote]
+  preloaded = preload_modules(modules + ZYGOTE_PRELOAD)
+  cloudlog.info(f"zygote preloaded {len(preloaded)} modules in {time.monotonic() - start_time:.2f} s")
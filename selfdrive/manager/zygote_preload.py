@@ -0,0 +1,4 @@
+"""Imported by the zygote when it starts, see selfdrive/manager/zygote.py"""
+from selfdrive.manager.zygote import preload
+
+preload()
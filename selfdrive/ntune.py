@@ -1,8 +1,9 @@
 import os
-import fcntl
-import signal
 import json
+import time
+import threading
 import weakref
+from collections import namedtuple
 from enum import Enum
 import numpy as np
 
@@ -11,13 +12,10 @@ CONF_LAT_LQR_FILE = '/data/ntune/lat_lqr.json'
 CONF_LAT_INDI_FILE = '/data/ntune/lat_indi.json'
 CONF_LAT_TORQUE_FILE = '/data/ntune/lat_torque_v4.json'
 
-ntunes = {}
-
+# how often the watcher checks the config files for changes
+RELOAD_INTERVAL = 0.5
 
-def file_watch_handler(signum, frame):
-  global ntunes
-  for ntune in ntunes.values():
-    ntune.handle()
+ntunes = {}
 
 
 class LatType(Enum):
@@ -27,25 +25,99 @@ class LatType(Enum):
   TORQUE = 3
 
 
+# key: (min, max, default), configs of groups other than common use the scc ranges
+VALID_RANGES = {
+  "common": {
+    "useLiveSteerRatio": (0., 1., 1.),
+    "steerRatio": (10.0, 20.0, 16.5),
+    "steerActuatorDelay": (0., 0.8, 0.1),
+    "steerRateCost": (0.1, 1.5, 0.4),
+    "pathOffset": (-1.0, 1.0, 0.0),
+  },
+  "scc": {
+    "sccGasFactor": (0.5, 1.5, 1.0),
+    "sccBrakeFactor": (0.5, 1.5, 1.0),
+    "sccCurvatureFactor": (0.5, 1.5, 0.98),
+  },
+  LatType.LQR: {
+    "scale": (500.0, 5000.0, 1600.0),
+    "ki": (0.0, 0.2, 0.01),
+    "dcGain": (0.002, 0.004, 0.0025),
+    "steerLimitTimer": (0.5, 3.0, 2.5),
+  },
+  LatType.INDI: {
+    "actuatorEffectiveness": (0.5, 3.0, 1.8),
+    "timeConstant": (0.5, 3.0, 1.4),
+    "innerLoopGain": (1.0, 5.0, 3.3),
+    "outerLoopGain": (1.0, 5.0, 2.8),
+  },
+  LatType.TORQUE: {
+    "useSteeringAngle": (0., 1., 1.),
+    "maxLatAccel": (0.5, 4.0, 2.0),
+    "friction": (0.0, 0.2, 0.01),
+    "ki_factor": (0.0, 1.0, 0.1),
+    "kd": (0.0, 2.0, 0.0),
+    "deadzone": (0.0, 0.05, 0.0),
+  },
+}
+
+# immutable, validated configs
+SNAPSHOT_TYPES = {name: namedtuple(f"{name.name if isinstance(name, LatType) else name}_config", ranges.keys())
+                  for name, ranges in VALID_RANGES.items()}
+
+
+class ConfigWatcher:
+  """Reloads the configs of nTune objects in a background thread when their files change"""
+  def __init__(self):
+    self.tunes = weakref.WeakSet()
+    self.lock = threading.Lock()
+    self.thread = None
+
+  def add(self, tune):
+    with self.lock:
+      self.tunes.add(tune)
+      if self.thread is None:
+        self.start()
+
+  def start(self):
+    self.thread = threading.Thread(target=self.watcher_thread, name="ntune_watcher", daemon=True)
+    self.thread.start()
+
+  def watcher_thread(self):
+    while True:
+      time.sleep(RELOAD_INTERVAL)
+      with self.lock:
+        tunes = list(self.tunes)
+      for tune in tunes:
+        tune.reload_if_changed()
+      del tunes
+
+
+watcher = ConfigWatcher()
+
+
+def _restart_watcher():
+  # threads don't survive fork
+  watcher.lock = threading.Lock()
+  watcher.thread = None
+  if len(watcher.tunes):
+    watcher.start()
+
+os.register_at_fork(after_in_child=_restart_watcher)
+
+
 class nTune():
 
   def get_ctrl(self):
     return self.ctrl() if self.ctrl is not None else None
 
-  def __del__(self):
-    if self.group is None:
-      ntunes[self.key] = None
-    print('__del__', self)
-
   def __init__(self, CP=None, ctrl=None, group=None):
 
-    self.invalidated = False
     self.CP = CP
     self.ctrl = weakref.ref(ctrl) if ctrl is not None else None
     self.type = LatType.NONE
     self.group = group
     self.config = {}
-    self.key = str(self)
     self.disable_lateral_live_tuning = CP.disableLateralLiveTuning if CP is not None else False
 
     if "LatControlLQR" in str(type(ctrl)):
@@ -65,222 +137,124 @@ class nTune():
     else:
       self.file = CONF_PATH + group + ".json"
 
+    ranges_name = self.type if self.type != LatType.NONE else group
+    if ranges_name not in VALID_RANGES:
+      ranges_name = "scc"
+    self.ranges = VALID_RANGES[ranges_name]
+    self.snapshot_type = SNAPSHOT_TYPES[ranges_name]
+
+    # the latest validated config, replaced as a whole by the watcher
+    self.snapshot = self.snapshot_type(*(default for _, _, default in self.ranges.values()))
+    self.applied = None
+
     if not os.path.exists(CONF_PATH):
       os.makedirs(CONF_PATH)
 
-    self.read()
-
-    if self.group is None:
-      ntunes[self.key] = self
+    self.stat = self.file_stat()
+    if not self.load():
+      self.write_default()
+      self.load()
 
-    try:
-      signal.signal(signal.SIGIO, file_watch_handler)
-      fd = os.open(CONF_PATH, os.O_RDONLY)
-      fcntl.fcntl(fd, fcntl.F_SETSIG, 0)
-      fcntl.fcntl(fd, fcntl.F_NOTIFY, fcntl.DN_MODIFY | fcntl.DN_CREATE | fcntl.DN_MULTISHOT)
-    except Exception as ex:
-      print("exception", ex)
-      pass
+    self.check()
+    watcher.add(self)
 
-  def handle(self):
+  def file_stat(self):
     try:
-      if os.path.getsize(self.file) > 0:
-        with open(self.file, 'r') as f:
-          self.config = json.load(f)
-
-        if self.checkValid():
-          self.write_config(self.config)
-
-        self.invalidated = True
-
-    except:
-      pass
-
-  def check(self):  # called by LatControlLQR.update
-    if self.invalidated:
-      self.invalidated = False
-      self.update()
-
-  def read(self):
-    success = False
+      st = os.stat(self.file)
+      return st.st_mtime_ns, st.st_size
+    except OSError:
+      return None
+
+  def reload_if_changed(self):  # called by the watcher
+    stat = self.file_stat()
+    if stat != self.stat:
+      # a config written by validation is reloaded once more, it's valid then
+      self.stat = stat
+      self.load()
+
+  def load(self):
     try:
-      if os.path.getsize(self.file) > 0:
-        with open(self.file, 'r') as f:
-          self.config = json.load(f)
-
-        if self.checkValid():
-          self.write_config(self.config)
-
-        self.update()
-        success = True
-    except:
-      pass
-
-    if not success:
-      try:
-        self.write_default()
-        with open(self.file, 'r') as f:
-          self.config = json.load(f)
-          if self.checkValid():
-            self.write_config(self.config)
-          self.update()
-      except:
-        pass
-
-  def checkValue(self, key, min_, max_, default_):
+      with open(self.file, 'r') as f:
+        config = json.load(f)
+      if not isinstance(config, dict):
+        return False
+    except (OSError, ValueError):
+      # keep the last config if the file is missing or partly written
+      return False
+
+    if self.checkValid(config):
+      self.write_config(config)
+
+    self.config = config
+    self.snapshot = self.snapshot_type(*(float(config[key]) for key in self.ranges))
+    return True
+
+  def check(self):  # called by the lateral controllers' update
+    snapshot = self.snapshot
+    if snapshot is not self.applied:
+      self.applied = snapshot
+      self.update(snapshot)
+
+  def checkValid(self, config):
     updated = False
 
-    if key not in self.config:
-      self.config.update({key: default_})
-      updated = True
-    elif min_ > self.config[key]:
-      self.config.update({key: min_})
-      updated = True
-    elif max_ < self.config[key]:
-      self.config.update({key: max_})
-      updated = True
+    for key, (min_, max_, default_) in self.ranges.items():
+      value = config.get(key)
+      if not isinstance(value, (int, float)):
+        config[key] = default_
+        updated = True
+      elif min_ > value:
+        config[key] = min_
+        updated = True
+      elif max_ < value:
+        config[key] = max_
+        updated = True
 
     return updated
 
-  def checkValid(self):
-
-    if self.type == LatType.LQR:
-      return self.checkValidLQR()
-    elif self.type == LatType.INDI:
-      return self.checkValidIndi()
-    elif self.type == LatType.TORQUE:
-      return self.checkValidTorque()
-    elif self.group == "common":
-      return self.checkValidCommon()
-    else:
-      return self.checkValidISCC()
-
-  def update(self):
+  def update(self, config):
 
     if self.disable_lateral_live_tuning:
       return
 
     if self.type == LatType.LQR:
-      self.updateLQR()
+      self.updateLQR(config)
     elif self.type == LatType.INDI:
-      self.updateIndi()
+      self.updateIndi(config)
     elif self.type == LatType.TORQUE:
-      self.updateTorque()
-
-  def checkValidCommon(self):
-    updated = False
-
-    if self.checkValue("useLiveSteerRatio", 0., 1., 1.):
-      updated = True
+      self.updateTorque(config)
 
-    if self.checkValue("steerRatio", 10.0, 20.0, 16.5):
-      updated = True
-
-    if self.checkValue("steerActuatorDelay", 0., 0.8, 0.1):
-      updated = True
-
-    if self.checkValue("steerRateCost", 0.1, 1.5, 0.4):
-      updated = True
-
-    if self.checkValue("pathOffset", -1.0, 1.0, 0.0):
-      updated = True
-
-    return updated
-
-  def checkValidLQR(self):
-    updated = False
-
-    if self.checkValue("scale", 500.0, 5000.0, 1600.0):
-      updated = True
-
-    if self.checkValue("ki", 0.0, 0.2, 0.01):
-      updated = True
-
-    if self.checkValue("dcGain", 0.002, 0.004, 0.0025):
-      updated = True
-
-    if self.checkValue("steerLimitTimer", 0.5, 3.0, 2.5):
-      updated = True
-
-    return updated
-
-  def checkValidIndi(self):
-    updated = False
-
-    if self.checkValue("actuatorEffectiveness", 0.5, 3.0, 1.8):
-      updated = True
-    if self.checkValue("timeConstant", 0.5, 3.0, 1.4):
-      updated = True
-    if self.checkValue("innerLoopGain", 1.0, 5.0, 3.3):
-      updated = True
-    if self.checkValue("outerLoopGain", 1.0, 5.0, 2.8):
-      updated = True
-
-    return updated
-
-  def checkValidTorque(self):
-    updated = False
-
-    if self.checkValue("useSteeringAngle", 0., 1., 1.):
-      updated = True
-    if self.checkValue("maxLatAccel", 0.5, 4.0, 2.0):
-      updated = True
-    if self.checkValue("friction", 0.0, 0.2, 0.01):
-      updated = True
-    if self.checkValue("ki_factor", 0.0, 1.0, 0.1):
-      updated = True
-    if self.checkValue("kd", 0.0, 2.0, 0.0):
-      updated = True
-    if self.checkValue("deadzone", 0.0, 0.05, 0.0):
-      updated = True
-
-    return updated
-
-  def checkValidISCC(self):
-    updated = False
-
-    if self.checkValue("sccGasFactor", 0.5, 1.5, 1.0):
-      updated = True
-
-    if self.checkValue("sccBrakeFactor", 0.5, 1.5, 1.0):
-      updated = True
-
-    if self.checkValue("sccCurvatureFactor", 0.5, 1.5, 0.98):
-      updated = True
-
-    return updated
-
-  def updateLQR(self):
+  def updateLQR(self, config):
     lqr = self.get_ctrl()
     if lqr is not None:
-      lqr.scale = float(self.config["scale"])
-      lqr.ki = float(self.config["ki"])
-      lqr.dc_gain = float(self.config["dcGain"])
+      lqr.scale = config.scale
+      lqr.ki = config.ki
+      lqr.dc_gain = config.dcGain
 
       lqr.x_hat = np.array([[0], [0]])
       lqr.reset()
 
-  def updateIndi(self):
+  def updateIndi(self, config):
     indi = self.get_ctrl()
     if indi is not None:
-      indi._RC = ([0.], [float(self.config["timeConstant"])])
-      indi._G = ([0.], [float(self.config["actuatorEffectiveness"])])
-      indi._outer_loop_gain = ([0.], [float(self.config["outerLoopGain"])])
-      indi._inner_loop_gain = ([0.], [float(self.config["innerLoopGain"])])
+      indi._RC = ([0.], [config.timeConstant])
+      indi._G = ([0.], [config.actuatorEffectiveness])
+      indi._outer_loop_gain = ([0.], [config.outerLoopGain])
+      indi._inner_loop_gain = ([0.], [config.innerLoopGain])
       indi.steer_filter.update_alpha(indi.RC)
       indi.reset()
 
-  def updateTorque(self):
+  def updateTorque(self, config):
     torque = self.get_ctrl()
     if torque is not None:
-      torque.use_steering_angle = float(self.config["useSteeringAngle"]) > 0.5
-      max_lat_accel = float(self.config["maxLatAccel"])
+      torque.use_steering_angle = config.useSteeringAngle > 0.5
+      max_lat_accel = config.maxLatAccel
       torque.pid._k_p = [[0], [1.0 / max_lat_accel]]
       torque.pid.k_f = 1.0 / max_lat_accel
-      torque.pid._k_i = [[0], [self.config["ki_factor"] / max_lat_accel]]
-      torque.pid._k_d = [[0], [float(self.config["kd"])]]
-      torque.friction = float(self.config["friction"])
-      torque.deadzone = float(self.config["deadzone"])
+      torque.pid._k_i = [[0], [config.ki_factor / max_lat_accel]]
+      torque.pid._k_d = [[0], [config.kd]]
+      torque.friction = config.friction
+      torque.deadzone = config.deadzone
       torque.reset()
 
   def read_cp(self):
@@ -313,7 +287,7 @@ class nTune():
 
     try:
       self.read_cp()
-      self.checkValid()
+      self.checkValid(self.config)
       self.write_config(self.config)
     except:
       pass
@@ -337,22 +311,11 @@ class nTune():
 
 
 def ntune_get(group, key):
-  global ntunes
-  if group not in ntunes:
+  try:
+    return getattr(ntunes[group].snapshot, key)
+  except KeyError:
     ntunes[group] = nTune(group=group)
-
-  ntune = ntunes[group]
-
-  if ntune.config == None or key not in ntune.config:
-    ntune.read()
-
-  v = ntune.config[key]
-
-  if v is None:
-    ntune.read()
-    v = ntune.config[key]
-
-  return v
+    return getattr(ntunes[group].snapshot, key)
 
 
 def ntune_common_get(key):
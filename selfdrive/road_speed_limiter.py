@@ -1,14 +1,10 @@
 import json
-import os
-import random
-
-import select
-import threading
-import time
+import selectors
 import socket
 import fcntl
 import struct
 from threading import Thread
+from typing import NamedTuple, Optional, Tuple
 from cereal import messaging, log
 from common.numpy_fast import clip
 from common.realtime import sec_since_boot
@@ -16,6 +12,12 @@ from common.conversions import Conversions as CV
 
 CAMERA_SPEED_FACTOR = 1.05
 
+# roadLimitSpeed is sent when the limit changes, at most every MIN_PUBLISH_INTERVAL, and every HEARTBEAT_INTERVAL
+MIN_PUBLISH_INTERVAL = 0.05
+HEARTBEAT_INTERVAL = 1.
+# limits and active state expire without updates from the app
+LIMIT_TIMEOUT = 6.
+
 
 class Port:
   BROADCAST_PORT = 2899
@@ -23,53 +25,170 @@ class Port:
   LOCATION_PORT = BROADCAST_PORT
 
 
+class RoadLimit(NamedTuple):
+  active: int = 0
+  road_limit_speed: int = 0
+  is_highway: bool = False
+  cam_type: int = 0
+  cam_limit_speed_left_dist: int = 0
+  cam_limit_speed: int = 0
+  section_limit_speed: int = 0
+  section_left_dist: int = 0
+  cam_speed_factor: float = CAMERA_SPEED_FACTOR
+  rest_area: Tuple[Tuple[str, str, str, str], ...] = ()
+  # sec_since_boot when received, only set by RoadSpeedLimiter
+  updated: float = 0.
+
+  @classmethod
+  def from_msg(cls, msg, updated):
+    return cls(msg.active, msg.roadLimitSpeed, msg.isHighway, msg.camType, msg.camLimitSpeedLeftDist, msg.camLimitSpeed,
+               msg.sectionLimitSpeed, msg.sectionLeftDist, msg.camSpeedFactor, updated=updated)
+
+  def to_msg(self):
+    dat = messaging.new_message('roadLimitSpeed')
+    dat.roadLimitSpeed.active = self.active
+    dat.roadLimitSpeed.roadLimitSpeed = self.road_limit_speed
+    dat.roadLimitSpeed.isHighway = self.is_highway
+    dat.roadLimitSpeed.camType = self.cam_type
+    dat.roadLimitSpeed.camLimitSpeedLeftDist = self.cam_limit_speed_left_dist
+    dat.roadLimitSpeed.camLimitSpeed = self.cam_limit_speed
+    dat.roadLimitSpeed.sectionLimitSpeed = self.section_limit_speed
+    dat.roadLimitSpeed.sectionLeftDist = self.section_left_dist
+    dat.roadLimitSpeed.camSpeedFactor = self.cam_speed_factor
+
+    try:
+      if len(self.rest_area):
+        restAreaList = []
+        for image, title, oil_price, distance in self.rest_area:
+          restArea = log.RoadLimitSpeed.RestArea.new_message()
+          restArea.image = image
+          restArea.title = title
+          restArea.oilPrice = oil_price
+          restArea.distance = distance
+          restAreaList.append(restArea)
+        dat.roadLimitSpeed.restArea = restAreaList
+    except Exception:
+      pass
+    return dat
+
+
+class Timer:
+  def __init__(self, period, callback, start):
+    self.period = period
+    self.callback = callback
+    self.next_time = start
+
+  def check(self, now):
+    if now >= self.next_time:
+      # skip missed periods instead of running them all at once
+      self.next_time = max(self.next_time + self.period, now)
+      self.callback(now)
+
+
 class RoadLimitSpeedServer:
-  def __init__(self):
+  """
+  Receives road limits from the navigation app over UDP and publishes them as roadLimitSpeed.
+  The UDP socket and the timers for broadcasting, GPS forwarding and publishing share one
+  selector loop.
+  """
+  def __init__(self, sock, pub_sock, gps_sm=None):
+    self.sock = sock
+    self.sock.setblocking(False)
+    self.pub_sock = pub_sock
+
     self.json_road_limit = None
     self.active = 0
     self.last_updated = 0
     self.last_updated_active = 0
     self.last_exception = None
-    self.lock = threading.Lock()
     self.remote_addr = None
 
     self.remote_gps_addr = None
-    self.last_time_location = 0
+    self.gps_sm = gps_sm if gps_sm is not None else messaging.SubMaster(['gpsLocationExternal'])
+    self.gps_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 
-    broadcast = Thread(target=self.broadcast_thread, args=[])
-    broadcast.setDaemon(True)
-    broadcast.start()
+    self.broadcast_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    self.broadcast_socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+    self.broadcast_address = None
+    self.broadcast_frame = 0
 
-    self.gps_sm = messaging.SubMaster(['gpsLocationExternal'], poll=['gpsLocationExternal'])
-    self.gps_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    self.published = None
+    self.last_published = 0.
 
-    self.gps_event = threading.Event()
-    gps_thread = Thread(target=self.gps_thread, args=[])
-    gps_thread.setDaemon(True)
-    gps_thread.start()
+    self.selector = selectors.DefaultSelector()
+    self.selector.register(self.sock, selectors.EVENT_READ)
 
-  def gps_thread(self):
+    now = sec_since_boot()
+    self.timers = [
+      Timer(5., self.broadcast_timer, now),
+      Timer(1., self.gps_timer, now),
+      Timer(1., self.send_sdp, now),
+      Timer(1., self.check, now),
+    ]
+
+  def get_limit(self):
+    json = self.json_road_limit
+    rest_area = ()
     try:
-      period = 1.0
-      wait_time = period
-      i = 0.
-      frame = 1
-      start_time = sec_since_boot()
-      while True:
-        self.gps_event.wait(wait_time)
-        self.gps_timer()
-
-        now = sec_since_boot()
-        error = (frame * period - (now - start_time))
-        i += error * 0.1
-        wait_time = period + error * 0.5 + i
-        wait_time = clip(wait_time, 0.8, 1.0)
-        frame += 1
-
-    except:
+      if json is not None and "rest_area" in json:
+        rest_area = tuple((self.get_json_val(r, "image"), self.get_json_val(r, "title"),
+                           self.get_json_val(r, "oilPrice"), self.get_json_val(r, "distance")) for r in json["rest_area"])
+    except Exception:
       pass
 
-  def gps_timer(self):
+    return RoadLimit(
+      self.active,
+      self.get_limit_val("road_limit_speed", 0),
+      self.get_limit_val("is_highway", False),
+      self.get_limit_val("cam_type", 0),
+      self.get_limit_val("cam_limit_speed_left_dist", 0),
+      self.get_limit_val("cam_limit_speed", 0),
+      self.get_limit_val("section_limit_speed", 0),
+      self.get_limit_val("section_left_dist", 0),
+      self.get_limit_val("cam_speed_factor", CAMERA_SPEED_FACTOR),
+      rest_area,
+    )
+
+  def publish_time(self):
+    if self.get_limit() != self.published:
+      return self.last_published + MIN_PUBLISH_INTERVAL
+    return self.last_published + HEARTBEAT_INTERVAL
+
+  def publish(self, now):
+    if now < self.publish_time():
+      return
+
+    limit = self.get_limit()
+    try:
+      dat = limit.to_msg()
+    except Exception as e:
+      # values of the wrong type from the app
+      self.last_exception = e
+      try:
+        dat = RoadLimit(self.active).to_msg()
+      except Exception:
+        dat = RoadLimit().to_msg()
+    self.pub_sock.send(dat.to_bytes())
+    self.published = limit
+    self.last_published = now
+
+  def step(self, max_timeout=None):
+    timeout = min(min(t.next_time for t in self.timers), self.publish_time()) - sec_since_boot()
+    if max_timeout is not None:
+      timeout = min(timeout, max_timeout)
+    if self.selector.select(max(timeout, 0.)):
+      self.udp_recv()
+
+    now = sec_since_boot()
+    for timer in self.timers:
+      timer.check(now)
+    self.publish(now)
+
+  def run(self):
+    while True:
+      self.step()
+
+  def gps_timer(self, now):
     try:
       if self.remote_gps_addr is not None:
         self.gps_sm.update(0)
@@ -99,123 +218,88 @@ class RoadLimitSpeedServer:
 
   def get_broadcast_address(self):
     try:
-      s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-      ip = fcntl.ioctl(
-        s.fileno(),
-        0x8919,
-        struct.pack('256s', 'wlan0'.encode('utf-8'))
-      )[20:24]
+      with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        ip = fcntl.ioctl(
+          s.fileno(),
+          0x8919,
+          struct.pack('256s', 'wlan0'.encode('utf-8'))
+        )[20:24]
 
       return socket.inet_ntoa(ip)
     except:
       return None
 
-  def broadcast_thread(self):
-
-    broadcast_address = None
-    frame = 0
-
-    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
-      try:
-        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-
-        while True:
-
-          try:
-
-            if broadcast_address is None or frame % 10 == 0:
-              broadcast_address = self.get_broadcast_address()
-
-            print('broadcast_address', broadcast_address)
-
-            if broadcast_address is not None:
-              address = (broadcast_address, Port.BROADCAST_PORT)
-              sock.sendto('EON:ROAD_LIMIT_SERVICE:v1'.encode(), address)
-          except:
-            pass
-
-          time.sleep(5.)
-          frame += 1
+  def broadcast_timer(self, now):
+    try:
+      if self.broadcast_address is None or self.broadcast_frame % 10 == 0:
+        self.broadcast_address = self.get_broadcast_address()
 
-      except:
-        pass
+      if self.broadcast_address is not None:
+        address = (self.broadcast_address, Port.BROADCAST_PORT)
+        self.broadcast_socket.sendto('EON:ROAD_LIMIT_SERVICE:v1'.encode(), address)
+    except:
+      pass
+    self.broadcast_frame += 1
 
-  def send_sdp(self, sock):
+  def send_sdp(self, now):
     try:
-      sock.sendto('EON:ROAD_LIMIT_SERVICE:v1'.encode(), (self.remote_addr[0], Port.BROADCAST_PORT))
+      if self.remote_addr is not None:
+        self.sock.sendto('EON:ROAD_LIMIT_SERVICE:v1'.encode(), (self.remote_addr[0], Port.BROADCAST_PORT))
     except:
       pass
 
-  def udp_recv(self, sock):
-    ret = False
+  def udp_recv(self):
+    # handle everything received since the last select, it's published once
+    while True:
+      try:
+        data, self.remote_addr = self.sock.recvfrom(2048)
+      except (BlockingIOError, InterruptedError):
+        return
+      except OSError as e:
+        self.last_exception = e
+        return
+      self.handle_packet(data)
+
+  def handle_packet(self, data):
     try:
-      ready = select.select([sock], [], [], 1.)
-      ret = bool(ready[0])
-      if ret:
-        data, self.remote_addr = sock.recvfrom(2048)
-        json_obj = json.loads(data.decode())
-
-        if 'cmd' in json_obj:
-          try:
-            os.system(json_obj['cmd'])
-            ret = False
-          except:
-            pass
-
-        if 'request_gps' in json_obj:
-          try:
-            if json_obj['request_gps'] == 1:
-              self.remote_gps_addr = self.remote_addr
-            else:
-              self.remote_gps_addr = None
-            ret = False
-          except:
-            pass
-
-        if 'echo' in json_obj:
-          try:
-            echo = json.dumps(json_obj["echo"])
-            sock.sendto(echo.encode(), (self.remote_addr[0], Port.BROADCAST_PORT))
-            ret = False
-          except:
-            pass
+      json_obj = json.loads(data.decode())
 
+      # remote commands from the app are ignored
+      if 'request_gps' in json_obj:
         try:
-          self.lock.acquire()
-          try:
-            if 'active' in json_obj:
-              self.active = json_obj['active']
-              self.last_updated_active = sec_since_boot()
-          except:
-            pass
-
-          if 'road_limit' in json_obj:
-            self.json_road_limit = json_obj['road_limit']
-            self.last_updated = sec_since_boot()
+          if json_obj['request_gps'] == 1:
+            self.remote_gps_addr = self.remote_addr
+          else:
+            self.remote_gps_addr = None
+        except:
+          pass
 
-        finally:
-          self.lock.release()
+      if 'echo' in json_obj:
+        try:
+          echo = json.dumps(json_obj["echo"])
+          self.sock.sendto(echo.encode(), (self.remote_addr[0], Port.BROADCAST_PORT))
+        except:
+          pass
 
-    except:
+      if 'active' in json_obj:
+        try:
+          self.active = int(json_obj['active'])
+          self.last_updated_active = sec_since_boot()
+        except (TypeError, ValueError, OverflowError):
+          pass
 
-      try:
-        self.lock.acquire()
-        self.json_road_limit = None
-      finally:
-        self.lock.release()
+      if 'road_limit' in json_obj:
+        self.json_road_limit = json_obj['road_limit']
+        self.last_updated = sec_since_boot()
 
-    return ret
+    except:
+      self.json_road_limit = None
 
-  def check(self):
-    now = sec_since_boot()
-    if now - self.last_updated > 6.:
-      try:
-        self.lock.acquire()
-        self.json_road_limit = None
-      finally:
-        self.lock.release()
+  def check(self, now):
+    if now - self.last_updated > LIMIT_TIMEOUT:
+      self.json_road_limit = None
 
-    if now - self.last_updated_active > 6.:
+    if now - self.last_updated_active > LIMIT_TIMEOUT:
       self.active = 0
 
   def get_limit_val(self, key, default=None):
@@ -237,58 +321,14 @@ class RoadLimitSpeedServer:
 
 
 def main():
-  server = RoadLimitSpeedServer()
-  roadLimitSpeed = messaging.pub_sock('roadLimitSpeed')
-
   with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
     try:
+      sock.bind(('0.0.0.0', 843))
+    except:
+      sock.bind(('0.0.0.0', Port.RECEIVE_PORT))
 
-      try:
-        sock.bind(('0.0.0.0', 843))
-      except:
-        sock.bind(('0.0.0.0', Port.RECEIVE_PORT))
-
-      sock.setblocking(False)
-
-      while True:
-
-        server.udp_recv(sock)
-
-        dat = messaging.new_message()
-        dat.init('roadLimitSpeed')
-        dat.roadLimitSpeed.active = server.active
-        dat.roadLimitSpeed.roadLimitSpeed = server.get_limit_val("road_limit_speed", 0)
-        dat.roadLimitSpeed.isHighway = server.get_limit_val("is_highway", False)
-        dat.roadLimitSpeed.camType = server.get_limit_val("cam_type", 0)
-        dat.roadLimitSpeed.camLimitSpeedLeftDist = server.get_limit_val("cam_limit_speed_left_dist", 0)
-        dat.roadLimitSpeed.camLimitSpeed = server.get_limit_val("cam_limit_speed", 0)
-        dat.roadLimitSpeed.sectionLimitSpeed = server.get_limit_val("section_limit_speed", 0)
-        dat.roadLimitSpeed.sectionLeftDist = server.get_limit_val("section_left_dist", 0)
-        dat.roadLimitSpeed.camSpeedFactor = server.get_limit_val("cam_speed_factor", CAMERA_SPEED_FACTOR)
-
-        try:
-          json = server.json_road_limit
-          if json is not None and "rest_area" in json:
-
-            restAreaList = []
-            for rest_area in json["rest_area"]:
-              restArea = log.RoadLimitSpeed.RestArea.new_message()
-              restArea.image = server.get_json_val(rest_area, "image")
-              restArea.title = server.get_json_val(rest_area, "title")
-              restArea.oilPrice = server.get_json_val(rest_area, "oilPrice")
-              restArea.distance = server.get_json_val(rest_area, "distance")
-              restAreaList.append(restArea)
-
-            dat.roadLimitSpeed.restArea = restAreaList
-        except:
-          pass
-
-        roadLimitSpeed.send(dat.to_bytes())
-        server.send_sdp(sock)
-        server.check()
-
-    except Exception as e:
-      server.last_exception = e
+    server = RoadLimitSpeedServer(sock, messaging.pub_sock('roadLimitSpeed'))
+    server.run()
 
 
 class RoadSpeedLimiter:
@@ -296,44 +336,59 @@ class RoadSpeedLimiter:
     self.slowing_down = False
     self.started_dist = 0
 
-    self.sock = messaging.sub_sock("roadLimitSpeed")
-    self.roadLimitSpeed = None
-
-  def recv(self):
-    try:
-      dat = messaging.recv_sock(self.sock, wait=False)
-      if dat is not None:
-        self.roadLimitSpeed = dat.roadLimitSpeed
-    except:
-      pass
+    # replaced by the receiver thread, readers don't touch the socket
+    self.limit: Optional[RoadLimit] = None
+
+    recv = Thread(target=self.recv_thread, name="road_speed_limiter", daemon=True)
+    recv.start()
+
+  def recv_thread(self):
+    poller = messaging.Poller()
+    self.sock = messaging.sub_sock("roadLimitSpeed", poller=poller, conflate=True)
+    while True:
+      # poll releases the GIL while waiting
+      for sock in poller.poll(1000):
+        dat = messaging.recv_one_or_none(sock)
+        if dat is not None:
+          self.update(dat.roadLimitSpeed)
+
+  def update(self, msg, t=None):
+    self.limit = RoadLimit.from_msg(msg, sec_since_boot() if t is None else t)
+
+  def get_limit(self) -> Optional[RoadLimit]:
+    limit = self.limit
+    if limit is None or sec_since_boot() - limit.updated > LIMIT_TIMEOUT:
+      # road_speed_limiter isn't running
+      return None
+    return limit
 
   def get_active(self):
-    self.recv()
-    if self.roadLimitSpeed is not None:
-      return self.roadLimitSpeed.active
+    limit = self.get_limit()
+    if limit is not None:
+      return limit.active
     return 0
 
   def get_max_speed(self, cluster_speed, is_metric):
 
     log = ""
-    self.recv()
+    limit = self.get_limit()
 
-    if self.roadLimitSpeed is None:
+    if limit is None:
       return 0, 0, 0, False, ""
 
     try:
 
-      road_limit_speed = self.roadLimitSpeed.roadLimitSpeed
-      is_highway = self.roadLimitSpeed.isHighway
+      road_limit_speed = limit.road_limit_speed
+      is_highway = limit.is_highway
 
-      cam_type = int(self.roadLimitSpeed.camType)
+      cam_type = int(limit.cam_type)
 
-      cam_limit_speed_left_dist = self.roadLimitSpeed.camLimitSpeedLeftDist
-      cam_limit_speed = self.roadLimitSpeed.camLimitSpeed
+      cam_limit_speed_left_dist = limit.cam_limit_speed_left_dist
+      cam_limit_speed = limit.cam_limit_speed
 
-      section_limit_speed = self.roadLimitSpeed.sectionLimitSpeed
-      section_left_dist = self.roadLimitSpeed.sectionLeftDist
-      camSpeedFactor = clip(self.roadLimitSpeed.camSpeedFactor, 1.0, 1.1)
+      section_limit_speed = limit.section_limit_speed
+      section_left_dist = limit.section_left_dist
+      camSpeedFactor = clip(limit.cam_speed_factor, 1.0, 1.1)
 
       if is_highway is not None:
         if is_highway:
@@ -135,7 +135,7 @@ def main() -> NoReturn:
           'max': values[-1],
           'mean': sample_sum / sample_count,
         }
-        for percentile in [0.05, 0.5, 0.95]:
+        for percentile in [0.05, 0.5, 0.95, 0.99]:
           value = values[int(round(percentile * (sample_count - 1)))]
           stats[f"p{int(percentile * 100)}"] = value
 
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+import json
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import selfdrive.ntune as ntune
+from selfdrive.ntune import VALID_RANGES, ntune_get, ntune_scc_get
+
+
+def write_json(path, config, partial=False):
+  dat = json.dumps(config)
+  with open(path, 'w') as f:
+    if partial:
+      # like an editor writing the file in chunks
+      f.write(dat[:len(dat) // 2])
+      f.flush()
+      time.sleep(0.002)
+    f.write(dat[len(dat) // 2:] if partial else dat)
+
+
+class TestNTune(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp() + '/'
+    patches = [mock.patch.object(ntune, 'CONF_PATH', self.tmpdir),
+               mock.patch.object(ntune, 'RELOAD_INTERVAL', 0.01),
+               mock.patch.dict(ntune.ntunes, clear=True)]
+    for p in patches:
+      p.start()
+      self.addCleanup(p.stop)
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def wait_for(self, fn, timeout=5.):
+    t = time.monotonic()
+    while not fn():
+      self.assertLess(time.monotonic() - t, timeout)
+      time.sleep(0.01)
+
+  def test_defaults_written(self):
+    self.assertEqual(ntune_scc_get("sccGasFactor"), 1.0)
+    with open(self.tmpdir + "scc.json") as f:
+      config = json.load(f)
+    self.assertEqual(config, {key: default for key, (_, _, default) in VALID_RANGES["scc"].items()})
+
+  def test_validated_once_per_reload(self):
+    write_json(self.tmpdir + "common.json", {"steerRatio": 30, "steerRateCost": 0.05})
+    self.assertEqual(ntune_get("common", "steerRatio"), 20.0)
+    self.assertEqual(ntune_get("common", "steerRateCost"), 0.1)
+    self.assertEqual(ntune_get("common", "pathOffset"), 0.0)
+
+    # clamped config is written back for the app
+    with open(self.tmpdir + "common.json") as f:
+      self.assertEqual(json.load(f)["steerRatio"], 20.0)
+
+    with mock.patch.object(ntune.nTune, "checkValid", side_effect=AssertionError("validated on access")):
+      for _ in range(100):
+        ntune_get("common", "steerRatio")
+
+  def test_reload(self):
+    self.assertEqual(ntune_scc_get("sccBrakeFactor"), 1.0)
+    write_json(self.tmpdir + "scc.json", {"sccGasFactor": 1.2, "sccBrakeFactor": 0.8, "sccCurvatureFactor": 1.0})
+    self.wait_for(lambda: ntune_scc_get("sccBrakeFactor") == 0.8)
+    self.assertEqual(ntune_scc_get("sccGasFactor"), 1.2)
+
+    # an invalid file keeps the last config
+    with open(self.tmpdir + "scc.json", 'w') as f:
+      f.write('{"sccGasFactor": ')
+    time.sleep(0.1)
+    self.assertEqual(ntune_scc_get("sccGasFactor"), 1.2)
+
+  def test_concurrent_reload(self):
+    # every config has the same value for all keys, a reader must never see a mix of two configs
+    values = [round(0.5 + i / 40, 3) for i in range(41)]
+    write_json(self.tmpdir + "scc.json", dict.fromkeys(VALID_RANGES["scc"], values[0]))
+    self.assertEqual(ntune_scc_get("sccGasFactor"), values[0])
+    errors = []
+    done = threading.Event()
+
+    def reader():
+      reads = 0
+      while not done.is_set():
+        snapshot = ntune.ntunes["scc"].snapshot
+        if not (snapshot.sccGasFactor == snapshot.sccBrakeFactor == snapshot.sccCurvatureFactor):
+          errors.append(snapshot)
+        if ntune_scc_get("sccGasFactor") not in values:
+          errors.append(ntune_scc_get("sccGasFactor"))
+        reads += 1
+      self.assertGreater(reads, 0)
+
+    readers = [threading.Thread(target=reader) for _ in range(2)]
+    for t in readers:
+      t.start()
+    for i, v in enumerate(values):
+      write_json(self.tmpdir + "scc.json", dict.fromkeys(VALID_RANGES["scc"], v), partial=i % 2 == 0)
+      time.sleep(0.005)
+    self.wait_for(lambda: ntune_scc_get("sccGasFactor") == values[-1])
+    done.set()
+    for t in readers:
+      t.join()
+
+    self.assertEqual(errors, [])
+
+  def test_controller_updated_on_control_thread(self):
+    class LatControlTorque:
+      def __init__(self):
+        self.pid = mock.Mock()
+        self.resets = 0
+        self.tune = ntune.nTune(ctrl=self)
+
+      def reset(self):
+        self.resets += 1
+
+    with mock.patch.object(ntune, "CONF_LAT_TORQUE_FILE", self.tmpdir + "lat_torque.json"):
+      ctrl = LatControlTorque()
+    self.assertEqual(ctrl.resets, 1)
+    self.assertEqual(ctrl.deadzone, 0.0)
+
+    config = {key: default for key, (_, _, default) in VALID_RANGES[ntune.LatType.TORQUE].items()}
+    write_json(self.tmpdir + "lat_torque.json", {**config, "deadzone": 0.02})
+    self.wait_for(lambda: ctrl.tune.snapshot.deadzone == 0.02)
+    self.assertEqual(ctrl.deadzone, 0.0)
+
+    for _ in range(3):
+      ctrl.tune.check()
+    self.assertEqual(ctrl.deadzone, 0.02)
+    self.assertEqual(ctrl.resets, 2)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from cereal import messaging
+import selfdrive.road_speed_limiter as rsl
+from selfdrive.road_speed_limiter import Port, RoadLimit, RoadLimitSpeedServer, RoadSpeedLimiter
+
+ROAD_LIMIT = {"road_limit_speed": 50, "is_highway": False, "cam_type": 1, "cam_limit_speed_left_dist": 300,
+              "cam_limit_speed": 50, "section_limit_speed": 0, "section_left_dist": 0, "cam_speed_factor": 1.05}
+
+
+class RoadLimitApp:
+  """Stand-in for the navigation app, talks to the server over UDP on localhost"""
+  def __init__(self, server_addr):
+    self.server_addr = server_addr
+    self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    self.sock.bind(('127.0.0.1', 0))
+    self.sock.settimeout(2.)
+    self.port = self.sock.getsockname()[1]
+
+  def send(self, **kwargs):
+    self.sock.sendto(json.dumps(kwargs).encode(), self.server_addr)
+
+  def recv(self):
+    dat, _ = self.sock.recvfrom(2048)
+    return dat.decode()
+
+  def close(self):
+    self.sock.close()
+
+
+class FakePubSock:
+  def __init__(self):
+    self.sent = []
+
+  def send(self, dat):
+    self.sent.append((time.monotonic(), messaging.log_from_bytes(dat).roadLimitSpeed))
+
+
+class FakeGpsSubMaster:
+  def __init__(self):
+    self.updated = {'gpsLocationExternal': False}
+    self.location = None
+
+  def update(self, timeout):
+    self.updated['gpsLocationExternal'] = self.location is not None
+
+  def __getitem__(self, service):
+    return self.location
+
+
+class TestRoadSpeedLimiter(unittest.TestCase):
+  def setUp(self):
+    self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    self.sock.bind(('127.0.0.1', 0))
+    self.pub_sock = FakePubSock()
+    self.gps_sm = FakeGpsSubMaster()
+    self.server = RoadLimitSpeedServer(self.sock, self.pub_sock, self.gps_sm)
+    self.app = RoadLimitApp(self.sock.getsockname())
+
+    patches = [mock.patch.object(Port, 'BROADCAST_PORT', self.app.port),
+               mock.patch.object(Port, 'LOCATION_PORT', self.app.port),
+               mock.patch.object(rsl, 'HEARTBEAT_INTERVAL', 0.2)]
+    for p in patches:
+      p.start()
+      self.addCleanup(p.stop)
+
+  def tearDown(self):
+    self.app.close()
+    self.sock.close()
+
+  def run_server(self, duration):
+    t = time.monotonic()
+    while (remaining := duration - (time.monotonic() - t)) > 0:
+      self.server.step(remaining)
+
+  def test_publish_on_change(self):
+    self.run_server(0.1)
+    self.assertEqual(len(self.pub_sock.sent), 1)
+    self.assertEqual(self.pub_sock.sent[0][1].roadLimitSpeed, 0)
+
+    # a burst of identical packets is published once
+    self.pub_sock.sent.clear()
+    for _ in range(20):
+      self.app.send(road_limit=ROAD_LIMIT, active=1)
+    self.run_server(0.1)
+    self.assertEqual(len(self.pub_sock.sent), 1)
+    msg = self.pub_sock.sent[0][1]
+    self.assertEqual((msg.active, msg.roadLimitSpeed, msg.camLimitSpeedLeftDist), (1, 50, 300))
+
+    # only the heartbeat without changes
+    self.pub_sock.sent.clear()
+    self.run_server(1.)
+    self.assertTrue(3 <= len(self.pub_sock.sent) <= 6, len(self.pub_sock.sent))
+    times = [t for t, _ in self.pub_sock.sent]
+    self.assertGreaterEqual(min(b - a for a, b in zip(times, times[1:])), 0.2 - 1e-3)
+
+  def test_rate_limited(self):
+    self.run_server(0.1)
+    self.pub_sock.sent.clear()
+    def send():
+      for i in range(20):
+        self.app.send(road_limit={**ROAD_LIMIT, "cam_limit_speed_left_dist": 300 - i})
+        time.sleep(0.005)
+
+    app_thread = threading.Thread(target=send)
+    app_thread.start()
+    self.run_server(0.15)
+    app_thread.join()
+    self.run_server(0.1)
+
+    times = [t for t, _ in self.pub_sock.sent]
+    self.assertLess(len(times), 12)
+    self.assertGreaterEqual(min(b - a for a, b in zip(times, times[1:])), rsl.MIN_PUBLISH_INTERVAL - 1e-3)
+    self.assertEqual(self.pub_sock.sent[-1][1].camLimitSpeedLeftDist, 281)
+
+  def test_limit_expires(self):
+    self.app.send(road_limit=ROAD_LIMIT, active=2)
+    self.run_server(0.1)
+    self.assertEqual(self.pub_sock.sent[-1][1].roadLimitSpeed, 50)
+
+    with mock.patch.object(rsl, 'LIMIT_TIMEOUT', 0.2):
+      self.run_server(1.2)
+    msg = self.pub_sock.sent[-1][1]
+    self.assertEqual((msg.active, msg.roadLimitSpeed), (0, 0))
+
+  def test_echo_and_gps(self):
+    self.app.send(echo={"a": 1})
+    self.run_server(0.05)
+    self.assertEqual(json.loads(self.app.recv()), {"a": 1})
+
+    location = messaging.new_message('gpsLocationExternal').gpsLocationExternal
+    location.latitude, location.longitude, location.accuracy = 37.5, 127.0, 3.
+    self.gps_sm.location = location
+    self.app.send(request_gps=1)
+    t = time.monotonic()
+    while True:
+      self.server.step()
+      self.app.sock.settimeout(0.01)
+      try:
+        dat = self.app.recv()
+      except socket.timeout:
+        self.assertLess(time.monotonic() - t, 3.)
+        continue
+      if dat.startswith('{"location"'):
+        break
+    self.assertEqual(json.loads(dat)["location"][:2], [37.5, 127.0])
+
+  def test_no_remote_commands(self):
+    path = os.path.join(tempfile.mkdtemp(), "cmd")
+    self.app.send(cmd=f"touch {path}")
+    self.run_server(0.1)
+    self.assertFalse(os.path.exists(path))
+
+  def test_invalid_packet(self):
+    self.app.send(road_limit=ROAD_LIMIT)
+    self.run_server(0.1)
+    self.app.sock.sendto(b"not json", self.sock.getsockname())
+    self.run_server(0.1)
+    self.assertEqual(self.pub_sock.sent[-1][1].roadLimitSpeed, 0)
+
+    # wrong types don't stop publishing
+    self.app.send(road_limit={**ROAD_LIMIT, "cam_type": "abc"}, active=1)
+    self.run_server(0.1)
+    self.assertEqual(self.pub_sock.sent[-1][1].active, 1)
+
+    for active in ("1", 1.5):
+      self.app.send(active=active)
+      self.run_server(0.1)
+      self.assertEqual(self.pub_sock.sent[-1][1].active, 1)
+    self.app.send(active="2")
+    self.run_server(0.1)
+    self.assertEqual(self.pub_sock.sent[-1][1].active, 2)
+    for active in ("abc", None, [1]):
+      self.app.send(active=active)
+      self.run_server(0.1)
+      self.assertEqual(self.pub_sock.sent[-1][1].active, 2)
+    # out of range
+    self.app.send(active=100000)
+    self.run_server(0.1)
+    self.assertEqual(self.pub_sock.sent[-1][1].active, 0)
+
+
+class TestRoadLimit(unittest.TestCase):
+  @mock.patch.object(RoadSpeedLimiter, 'recv_thread')
+  def test_cached_limit(self, _):
+    limiter = RoadSpeedLimiter()
+    self.assertIsNone(limiter.get_limit())
+    self.assertEqual(limiter.get_max_speed(60, True), (0, 0, 0, False, ""))
+
+    limit = RoadLimit(active=1, road_limit_speed=50, cam_type=1, cam_limit_speed_left_dist=300, cam_limit_speed=50,
+                      cam_speed_factor=1.)
+    msg = messaging.log_from_bytes(limit.to_msg().to_bytes()).roadLimitSpeed
+    limiter.update(msg)
+    self.assertEqual(limiter.get_limit()._replace(updated=0), limit)
+    self.assertEqual(limiter.get_active(), 1)
+    self.assertGreater(limiter.get_max_speed(80, True)[0], 0)
+
+    # stale without road_speed_limiter
+    limiter.update(msg, t=limiter.limit.updated - rsl.LIMIT_TIMEOUT - 1)
+    self.assertIsNone(limiter.get_limit())
+    self.assertEqual(limiter.get_active(), 0)
+
+
+if __name__ == "__main__":
+  unittest.main()
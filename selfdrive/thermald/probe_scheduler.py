@@ -0,0 +1,126 @@
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from selfdrive.swaglog import cloudlog
+
+
+class ProbeResult(NamedTuple):
+  value: Any
+  age: float  # seconds since the value was read, inf if it never was
+
+
+class ProbeStats(NamedTuple):
+  count: int
+  mean_ms: float
+  max_ms: float
+  timeouts: int
+  errors: int
+
+
+class Probe:
+  """A slow hardware call, run every interval. Results rejected by valid keep the previous value."""
+  def __init__(self, name: str, fn: Callable[[], Any], interval: float, timeout: float, default: Any = None,
+               max_age: Optional[float] = None, valid: Optional[Callable[[Any], bool]] = None):
+    self.name = name
+    self.fn = fn
+    self.interval = interval
+    self.timeout = timeout
+    self.default = default
+    # older values are replaced by the default
+    self.max_age = max_age if max_age is not None else 3 * interval + timeout
+    self.valid = valid
+
+    self.value = default
+    self.updated = -math.inf
+    self.next_time = -math.inf
+    self.started = 0.
+    self.future = None
+    self.timed_out = False
+
+    self.count = 0
+    self.total_time = 0.
+    self.max_time = 0.
+    self.timeouts = 0
+    self.errors = 0
+
+  def run(self) -> Tuple[Any, float]:
+    t = time.monotonic()
+    value = self.fn()
+    return value, time.monotonic() - t
+
+
+class ProbeScheduler:
+  """
+  Runs probes concurrently on their own cadence, so one slow probe doesn't delay the others.
+  update() is called periodically from one thread, get() and stats() from any thread.
+  """
+  def __init__(self, probes: List[Probe]):
+    self.probes: Dict[str, Probe] = {p.name: p for p in probes}
+    self.executor = ThreadPoolExecutor(max_workers=len(probes), thread_name_prefix="hw_probe")
+    self.lock = threading.Lock()
+
+  def update(self, now: Optional[float] = None) -> List[str]:
+    """Collects finished probes and starts the ones that are due, returns the names of the updated probes"""
+    if now is None:
+      now = time.monotonic()
+    updated = []
+
+    for probe in self.probes.values():
+      if probe.future is not None:
+        if probe.future.done():
+          self.finish(probe, now)
+          if probe.updated == now:
+            updated.append(probe.name)
+        elif not probe.timed_out and now - probe.started > probe.timeout:
+          # a running call can't be stopped, it's started again after it returns
+          probe.timed_out = True
+          probe.timeouts += 1
+          cloudlog.warning(f"hardware probe {probe.name} timed out after {probe.timeout}s")
+
+      if probe.future is None and now >= probe.next_time:
+        probe.started = now
+        probe.next_time = now + probe.interval
+        probe.timed_out = False
+        probe.future = self.executor.submit(probe.run)
+
+    return updated
+
+  def finish(self, probe: Probe, now: float) -> None:
+    future, probe.future = probe.future, None
+    try:
+      value, latency = future.result()
+    except Exception:
+      with self.lock:
+        probe.errors += 1
+      cloudlog.exception(f"hardware probe {probe.name} failed")
+      return
+
+    with self.lock:
+      probe.count += 1
+      probe.total_time += latency
+      probe.max_time = max(probe.max_time, latency)
+      if probe.valid is None or probe.valid(value):
+        probe.value = value
+        probe.updated = now
+
+  def get(self, name: str, now: Optional[float] = None) -> ProbeResult:
+    if now is None:
+      now = time.monotonic()
+    probe = self.probes[name]
+    with self.lock:
+      value, updated = probe.value, probe.updated
+    age = now - updated
+    if age > probe.max_age:
+      value = probe.default
+    return ProbeResult(value, age)
+
+  def stats(self) -> Dict[str, ProbeStats]:
+    with self.lock:
+      return {p.name: ProbeStats(p.count, 1000 * p.total_time / max(p.count, 1), 1000 * p.max_time, p.timeouts, p.errors)
+              for p in self.probes.values()}
+
+  def shutdown(self) -> None:
+    self.executor.shutdown(wait=False)
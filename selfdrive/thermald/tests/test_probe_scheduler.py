@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+import math
+import os
+import queue
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from cereal import log
+import selfdrive.thermald.thermald as thermald
+from selfdrive.hardware.pc.hardware import Pc
+from selfdrive.hardware.sysfs import read_sysfs
+from selfdrive.thermald.probe_scheduler import Probe, ProbeScheduler
+
+NetworkType = log.DeviceState.NetworkType
+NetworkStrength = log.DeviceState.NetworkStrength
+
+
+class MockHardware(Pc):
+  """PC hardware with the latency of the slow TICI probes"""
+  def __init__(self, delays=None):
+    self.delays = delays if delays is not None else {}
+    self.calls = {}
+    self.lock = threading.Lock()
+
+  def call(self, name, ret):
+    with self.lock:
+      self.calls[name] = self.calls.get(name, 0) + 1
+    time.sleep(self.delays.get(name, 0.))
+    return ret
+
+  def get_network_type(self):
+    return self.call("get_network_type", NetworkType.cell4G)
+
+  def get_network_strength(self, network_type):
+    return self.call("get_network_strength", NetworkStrength.good)
+
+  def get_network_info(self):
+    return self.call("get_network_info", {'state': 'CONNECTED', 'technology': 'LTE'})
+
+  def get_modem_temperatures(self):
+    return self.call("get_modem_temperatures", [40, 41])
+
+  def get_nvme_temperatures(self):
+    return self.call("get_nvme_temperatures", [35])
+
+  def get_ip_address(self):
+    return self.call("get_ip_address", "192.168.1.2")
+
+  def get_sim_info(self):
+    return self.call("get_sim_info", {'sim_id': ''})
+
+
+def run_scheduler(scheduler, duration, dt=0.01):
+  t = time.monotonic()
+  while time.monotonic() - t < duration:
+    scheduler.update()
+    time.sleep(dt)
+
+
+class TestProbeScheduler(unittest.TestCase):
+  def test_slow_probe_runs_concurrently(self):
+    fast_calls = []
+    scheduler = ProbeScheduler([
+      Probe("slow", lambda: time.sleep(0.5) or 1, 0.1, 1.),
+      Probe("fast", lambda: fast_calls.append(1) or len(fast_calls), 0.05, 1.),
+    ])
+    run_scheduler(scheduler, 0.4)
+    scheduler.shutdown()
+
+    self.assertGreater(len(fast_calls), 5)
+    self.assertLess(scheduler.get("fast").age, 0.1)
+    self.assertIsNone(scheduler.get("slow").value)
+    self.assertEqual(scheduler.get("slow").age, math.inf)
+
+  def test_timeout_and_age(self):
+    release = threading.Event()
+    values = iter([1, 2])
+    scheduler = ProbeScheduler([Probe("hangs", lambda: release.wait() and next(values), 0.01, 0.05, default=0, max_age=0.2)])
+    run_scheduler(scheduler, 0.1)
+    self.assertEqual(scheduler.stats()["hangs"].timeouts, 1)
+    self.assertEqual(scheduler.get("hangs").value, 0)
+
+    release.set()
+    run_scheduler(scheduler, 0.05)
+    self.assertEqual(scheduler.get("hangs").value, 2)
+
+    # stale values are replaced by the default, but keep their age
+    release.clear()
+    run_scheduler(scheduler, 0.3)
+    result = scheduler.get("hangs")
+    self.assertEqual(result.value, 0)
+    self.assertGreater(result.age, 0.2)
+    release.set()
+    scheduler.shutdown()
+
+  def test_invalid_and_failing_probes(self):
+    results = iter([[40], [], [41]])
+    def fail():
+      raise RuntimeError
+
+    scheduler = ProbeScheduler([Probe("temps", lambda: next(results), 0., 1., default=[], valid=len),
+                                Probe("fails", fail, 0., 1., default=-1)])
+    seen = []
+    for _ in range(4):
+      scheduler.update()
+      seen.append(scheduler.get("temps").value)
+      time.sleep(0.02)
+    scheduler.shutdown()
+
+    self.assertEqual(seen, [[], [40], [40], [41]])
+    self.assertEqual(scheduler.get("fails").value, -1)
+    self.assertGreater(scheduler.stats()["fails"].errors, 0)
+
+  def test_latency_stats(self):
+    scheduler = ProbeScheduler([Probe("sleep", lambda: time.sleep(0.02), 0., 1.)])
+    run_scheduler(scheduler, 0.2)
+    scheduler.shutdown()
+
+    stats = scheduler.stats()["sleep"]
+    self.assertGreater(stats.count, 2)
+    self.assertGreaterEqual(stats.mean_ms, 20.)
+    self.assertGreaterEqual(stats.max_ms, stats.mean_ms)
+    self.assertEqual(stats.timeouts, 0)
+
+
+class TestHardwareState(unittest.TestCase):
+  def test_hw_state_thread(self):
+    hw = MockHardware(delays={"get_nvme_temperatures": 2., "get_network_type": 0.1})
+    with mock.patch.object(thermald, "HARDWARE", hw):
+      scheduler = ProbeScheduler(thermald.get_hw_probes())
+      hw_queue = queue.Queue(maxsize=1)
+      end_event = threading.Event()
+      t = threading.Thread(target=thermald.hw_state_thread, args=(end_event, hw_queue, scheduler))
+      with mock.patch.object(thermald, "DT_TRML", 0.05):
+        t.start()
+        start = time.monotonic()
+        while time.monotonic() - start < 0.5:
+          try:
+            hw_state = hw_queue.get(timeout=0.1)
+          except queue.Empty:
+            pass
+        end_event.set()
+        t.join()
+
+    self.assertEqual(hw_state.network_type, NetworkType.cell4G)
+    self.assertTrue(hw_state.network_metered)
+    self.assertEqual(hw_state.network_strength, NetworkStrength.good)
+    self.assertEqual(hw_state.modem_temps, [40, 41])
+    self.assertEqual(hw_state.wifi_address, "192.168.1.2")
+    # still running smartctl
+    self.assertEqual(hw_state.nvme_temps, [])
+    self.assertEqual(hw.calls["get_nvme_temperatures"], 1)
+
+    stats = scheduler.stats()
+    self.assertGreaterEqual(stats["network_state"].mean_ms, 100.)
+    self.assertEqual(stats["nvme_temps"].count, 0)
+
+  def test_modem_temps_kept(self):
+    hw = MockHardware()
+    with mock.patch.object(thermald, "HARDWARE", hw):
+      probe = next(p for p in thermald.get_hw_probes() if p.name == "modem_temps")
+    scheduler = ProbeScheduler([probe])
+    scheduler.update(0.)
+    scheduler.executor.shutdown(wait=True)
+    scheduler.update(1.)
+    self.assertEqual(scheduler.get("modem_temps", 1.).value, [40, 41])
+    # however old
+    self.assertEqual(scheduler.get("modem_temps", 3600.).value, [40, 41])
+
+
+class TestSysfs(unittest.TestCase):
+  def test_read_sysfs(self):
+    with tempfile.NamedTemporaryFile('w') as f:
+      f.write("42000\n")
+      f.flush()
+      self.assertEqual(read_sysfs(f.name), "42000\n")
+
+      # same open file, new value
+      f.seek(0)
+      f.truncate()
+      f.write("43000\n")
+      f.flush()
+      self.assertEqual(read_sysfs(f.name), "43000\n")
+      self.assertEqual(Pc.read_param_file(f.name, int), 43000)
+
+    self.assertEqual(Pc.read_param_file(os.path.join(tempfile.gettempdir(), "does_not_exist"), int, -1), -1)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 import datetime
+import math
 import os
 import queue
 import threading
@@ -18,11 +19,13 @@ from common.params import Params
 from common.realtime import DT_TRML, sec_since_boot
 from selfdrive.controls.lib.alertmanager import set_offroad_alert
 from selfdrive.hardware import EON, HARDWARE, PC, TICI
+from selfdrive.hardware.sysfs import read_sysfs
 from selfdrive.loggerd.config import get_available_percent
 from selfdrive.statsd import statlog
 from selfdrive.swaglog import cloudlog
 from selfdrive.thermald.power_monitoring import PowerMonitoring
 from selfdrive.thermald.fan_controller import EonFanController, UnoFanController, TiciFanController
+from selfdrive.thermald.probe_scheduler import Probe, ProbeScheduler
 from selfdrive.version import terms_version, training_version
 
 ThermalStatus = log.DeviceState.ThermalStatus
@@ -70,8 +73,7 @@ def read_tz(x):
     x = tz_by_type[x]
 
   try:
-    with open(f"/sys/devices/virtual/thermal/thermal_zone{x}/temp") as f:
-      return int(f.read())
+    return int(read_sysfs(f"/sys/devices/virtual/thermal/thermal_zone{x}/temp"))
   except FileNotFoundError:
     return 0
 
@@ -93,73 +95,92 @@ def set_offroad_alert_if_changed(offroad_alert: str, show_alert: bool, extra_tex
   set_offroad_alert(offroad_alert, show_alert, extra_text)
 
 
-def hw_state_thread(end_event, hw_queue):
+def get_network_state():
+  network_type = HARDWARE.get_network_type()
+  return network_type, HARDWARE.get_network_metered(network_type), HARDWARE.get_network_strength(network_type)
+
+
+def get_modem_version():
+  return HARDWARE.get_modem_version(), HARDWARE.get_modem_nv()
+
+
+def get_hw_probes():
+  # D-Bus, modem AT commands and subprocesses, each can take seconds
+  probes = [
+    Probe("network_state", get_network_state, 5., 5., default=(NetworkType.none, False, NetworkStrength.unknown)),
+    Probe("network_info", HARDWARE.get_network_info, 10., 5.),
+    # the last non empty reading is kept, the modem often returns none
+    Probe("modem_temps", HARDWARE.get_modem_temperatures, 10., 5., default=[], max_age=math.inf, valid=len),
+    Probe("nvme_temps", HARDWARE.get_nvme_temperatures, 30., 10., default=[]),
+    Probe("wifi_address", HARDWARE.get_ip_address, 10., 5., default='N/A'),
+    Probe("sim_info", HARDWARE.get_sim_info, 30., 5., default={}),
+  ]
+  if TICI:
+    # logged once
+    probes.append(Probe("modem_version", get_modem_version, 10., 5., default=(None, None), max_age=math.inf,
+                        valid=lambda v: None not in v))
+  return probes
+
+
+def hw_state_thread(end_event, hw_queue, scheduler):
   """Handles non critical hardware state, and sends over queue"""
-  count = 0
   registered_count = 0
-  prev_hw_state = None
-
-  modem_version = None
-  modem_nv = None
+  modem_version_logged = False
   modem_configured = False
 
   while not end_event.is_set():
-    # these are expensive calls. update every 10s
-    if (count % int(10. / DT_TRML)) == 0:
+    try:
+      updated = scheduler.update()
+
+      if "modem_version" in updated and not modem_version_logged:
+        modem_version, modem_nv = scheduler.get("modem_version").value
+        cloudlog.event("modem version", version=modem_version, nv=modem_nv)
+        modem_version_logged = True
+        # don't run it again
+        scheduler.probes["modem_version"].interval = math.inf
+
+      network_type, network_metered, network_strength = scheduler.get("network_state").value
+      hw_state = HardwareState(
+        network_type=network_type,
+        network_metered=network_metered,
+        network_strength=network_strength,
+        network_info=scheduler.get("network_info").value,
+        nvme_temps=scheduler.get("nvme_temps").value,
+        modem_temps=scheduler.get("modem_temps").value,
+        wifi_address=scheduler.get("wifi_address").value,
+      )
+
       try:
-        network_type = HARDWARE.get_network_type()
-        modem_temps = HARDWARE.get_modem_temperatures()
-        if len(modem_temps) == 0 and prev_hw_state is not None:
-          modem_temps = prev_hw_state.modem_temps
-
-        # Log modem version once
-        if TICI and ((modem_version is None) or (modem_nv is None)):
-          modem_version = HARDWARE.get_modem_version()  # pylint: disable=assignment-from-none
-          modem_nv = HARDWARE.get_modem_nv()  # pylint: disable=assignment-from-none
-
-          if (modem_version is not None) and (modem_nv is not None):
-            cloudlog.event("modem version", version=modem_version, nv=modem_nv)
-
-        hw_state = HardwareState(
-          network_type=network_type,
-          network_metered=HARDWARE.get_network_metered(network_type),
-          network_strength=HARDWARE.get_network_strength(network_type),
-          network_info=HARDWARE.get_network_info(),
-          nvme_temps=HARDWARE.get_nvme_temperatures(),
-          modem_temps=modem_temps,
-          wifi_address=HARDWARE.get_ip_address(),
-        )
-
-        try:
-          hw_queue.put_nowait(hw_state)
-        except queue.Full:
-          pass
-
-        if TICI and (hw_state.network_info is not None) and (hw_state.network_info.get('state', None) == "REGISTERED"):
+        hw_queue.put_nowait(hw_state)
+      except queue.Full:
+        pass
+
+      if "network_info" in updated:
+        network_info = scheduler.get("network_info").value
+        if TICI and (network_info is not None) and (network_info.get('state', None) == "REGISTERED"):
           registered_count += 1
         else:
           registered_count = 0
 
         if registered_count > 10:
-          cloudlog.warning(f"Modem stuck in registered state {hw_state.network_info}. nmcli conn up lte")
+          cloudlog.warning(f"Modem stuck in registered state {network_info}. nmcli conn up lte")
           os.system("nmcli conn up lte")
           registered_count = 0
 
-        # TODO: remove this once the config is in AGNOS
-        if not modem_configured and len(HARDWARE.get_sim_info().get('sim_id', '')) > 0:
-          cloudlog.warning("configuring modem")
-          HARDWARE.configure_modem()
-          modem_configured = True
+      # TODO: remove this once the config is in AGNOS
+      if "sim_info" in updated and not modem_configured and len(scheduler.get("sim_info").value.get('sim_id', '')) > 0:
+        cloudlog.warning("configuring modem")
+        HARDWARE.configure_modem()
+        modem_configured = True
+    except Exception:
+      cloudlog.exception("Error getting hardware state")
 
-        prev_hw_state = hw_state
-      except Exception:
-        cloudlog.exception("Error getting hardware state")
-
-    count += 1
     time.sleep(DT_TRML)
 
+  scheduler.shutdown()
 
-def thermald_thread(end_event, hw_queue):
+
+def thermald_thread(end_event, hw_queue, scheduler):
   pm = messaging.PubMaster(['deviceState'])
   sm = messaging.SubMaster(["peripheralState", "gpsLocationExternal", "controlsState", "pandaStates"], poll=["pandaStates"])
 
@@ -430,6 +451,11 @@ def thermald_thread(end_event, hw_queue):
       statlog.gauge(f"modem_temperature{i}", temp)
     statlog.gauge("fan_speed_percent_desired", msg.deviceState.fanSpeedPercentDesired)
     statlog.gauge("screen_brightness_percent", msg.deviceState.screenBrightnessPercent)
+    if (count % int(10. / DT_TRML)) == 0:
+      for name, stats in scheduler.stats().items():
+        statlog.gauge(f"hw_probe_{name}_latency_mean_ms", stats.mean_ms)
+        statlog.gauge(f"hw_probe_{name}_latency_max_ms", stats.max_ms)
+        statlog.gauge(f"hw_probe_{name}_timeouts", stats.timeouts)
 
     # report to server once every 10 minutes
     if (count % int(600. / DT_TRML)) == 0:
@@ -441,7 +467,8 @@ def thermald_thread(end_event, hw_queue):
                      pandaStates=[strip_deprecated_keys(p.to_dict()) for p in pandaStates],
                      peripheralState=strip_deprecated_keys(peripheralState.to_dict()),
                      location=(strip_deprecated_keys(sm["gpsLocationExternal"].to_dict()) if sm.alive["gpsLocationExternal"] else None),
-                     deviceState=strip_deprecated_keys(msg.to_dict()))
+                     deviceState=strip_deprecated_keys(msg.to_dict()),
+                     hwProbes={name: stats._asdict() for name, stats in scheduler.stats().items()})
 
     count += 1
 
@@ -449,10 +476,11 @@ def thermald_thread(end_event, hw_queue):
 def main():
   hw_queue = queue.Queue(maxsize=1)
   end_event = threading.Event()
+  scheduler = ProbeScheduler(get_hw_probes())
 
   threads = [
-    threading.Thread(target=hw_state_thread, args=(end_event, hw_queue)),
-    threading.Thread(target=thermald_thread, args=(end_event, hw_queue)),
+    threading.Thread(target=hw_state_thread, args=(end_event, hw_queue, scheduler)),
+    threading.Thread(target=thermald_thread, args=(end_event, hw_queue, scheduler)),
   ]
 
   for t in threads:
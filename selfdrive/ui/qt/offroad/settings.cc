@@ -137,6 +137,7 @@ DevicePanel::DevicePanel(SettingsWindow *parent) : ListWidget(parent) {
     if (ConfirmationDialog::confirm("캘리브레이션과 라이브파라미터를 초기화 하시겠습니까?", this)) {
       Params().remove("CalibrationParams");
       Params().remove("LiveParameters");
+      Params().remove("LiveParametersSnapshot");
       emit closeSettings();
       QTimer::singleShot(1000, []() {
         Params().putBool("SoftRestartTriggered", true);
@@ -98,6 +98,7 @@ void OnroadWindow::mouseReleaseEvent(QMouseEvent* e) {
       if(dy < 0) { // upward
         Params().remove("CalibrationParams");
         Params().remove("LiveParameters");
+        Params().remove("LiveParametersSnapshot");
         QTimer::singleShot(1500, []() {
           Params().putBool("SoftRestartTriggered", true);
         });
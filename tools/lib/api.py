@@ -1,16 +1,18 @@
 import os
-import requests
+from common.api import get_session
 API_HOST = os.getenv('API_HOST', 'https://api.commadotai.com')
 
 class CommaApi():
   def __init__(self, token=None):
-    self.session = requests.Session()
-    self.session.headers['User-agent'] = 'OpenpilotTools'
+    # the session is shared, so headers are set per request
+    self.session = get_session()
+    self.headers = {'User-agent': 'OpenpilotTools'}
     if token:
-      self.session.headers['Authorization'] = 'JWT ' + token
+      self.headers['Authorization'] = 'JWT ' + token
 
   def request(self, method, endpoint, **kwargs):
-    resp = self.session.request(method, API_HOST + '/' + endpoint, **kwargs)
+    headers = {**self.headers, **kwargs.pop('headers', {})}
+    resp = self.session.request(method, API_HOST + '/' + endpoint, headers=headers, **kwargs)
     resp_json = resp.json()
     if isinstance(resp_json, dict) and resp_json.get('error'):
       if resp.status_code in [401, 403]: